@@ -0,0 +1,173 @@
+import numpy as np
+
+from db import MAX_YEAR, MIN_YEAR, get_connection
+
+METRICS = ("revenue", "assets", "liabilities", "profit")
+DERIVED = ("equity", "profit_margin", "debt_to_asset")
+
+
+class Panel:
+    # balance sheets as dense (company, year) grids, one float array per metric; NaN = no row
+
+    def __init__(self, company_ids, names, years, values):
+        self.company_ids = company_ids
+        self.names = names
+        self.years = years
+        self.values = values
+
+    def index_of(self, company_id):
+        pos = np.searchsorted(self.company_ids, company_id)
+        if pos < len(self.company_ids) and self.company_ids[pos] == company_id:
+            return int(pos)
+        return None
+
+
+def build_panel(rows, names=None):
+    # rows: (company_id, year, revenue, assets, liabilities, profit)
+    data = np.array(rows, dtype=float).reshape(-1, 2 + len(METRICS))
+    # the year axis is dense, so one bad year stored before ingestion checked them would make
+    # every grid span centuries
+    data = data[(data[:, 1] >= MIN_YEAR) & (data[:, 1] <= MAX_YEAR)]
+    company_ids, c_idx = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    if len(data):
+        first, last = int(data[:, 1].min()), int(data[:, 1].max())
+    else:
+        first, last = 0, -1
+    years = np.arange(first, last + 1)
+    y_idx = data[:, 1].astype(np.int64) - first
+
+    values = {}
+    for i, metric in enumerate(METRICS):
+        grid = np.full((len(company_ids), len(years)), np.nan)
+        grid[c_idx, y_idx] = data[:, 2 + i]
+        values[metric] = grid
+    return Panel(company_ids, names or {}, years, values)
+
+
+def load_panel(company_ids=None):
+    conn = get_connection()
+    query = (
+        "SELECT company_id, year, revenue, assets, liabilities, profit FROM balance_sheets"
+    )
+    params = ()
+    if company_ids is not None:
+        query += f" WHERE company_id IN ({','.join('?' * len(company_ids))})"
+        params = tuple(company_ids)
+    rows = conn.execute(query, params).fetchall()
+    names = dict(conn.execute("SELECT id, name FROM companies").fetchall())
+    conn.close()
+    return build_panel(rows, names)
+
+
+def has_data(panel):
+    # (company, year) cells with a row: any metric set, since revenue alone can be NULL
+    return np.logical_or.reduce([~np.isnan(panel.values[m]) for m in METRICS])
+
+
+def safe_divide(a, b):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.divide(a, b)
+    out[~np.isfinite(out)] = np.nan
+    return out
+
+
+def derived_metrics(panel):
+    v = panel.values
+    return {
+        "equity": v["assets"] - v["liabilities"],
+        "profit_margin": safe_divide(v["profit"], v["revenue"]) * 100,
+        "debt_to_asset": safe_divide(v["liabilities"], v["assets"]),
+    }
+
+
+def yoy_growth(grid):
+    # % change against the previous calendar year; NaN where either year is missing
+    out = np.full(grid.shape, np.nan)
+    out[..., 1:] = safe_divide(grid[..., 1:] - grid[..., :-1], np.abs(grid[..., :-1])) * 100
+    return out
+
+
+def growth_series(values):
+    # % change against the previous entry of a 1-D series, 0 for the first
+    values = np.asarray(values, dtype=float)
+    out = np.zeros(len(values))
+    out[1:] = safe_divide(values[1:] - values[:-1], values[:-1]) * 100
+    return out
+
+
+def cagr(grid, window):
+    # compound annual growth (%) over `window` years ending at each year; needs positive endpoints
+    out = np.full(grid.shape, np.nan)
+    if window <= 0 or window >= grid.shape[-1]:
+        return out
+    start, end = grid[..., :-window], grid[..., window:]
+    ratio = safe_divide(end, start)
+    ratio[(start <= 0) | (end <= 0)] = np.nan
+    with np.errstate(invalid="ignore"):
+        out[..., window:] = (ratio ** (1.0 / window) - 1) * 100
+    return out
+
+
+def rank(values):
+    # 1 = largest; companies without a value get NaN
+    order = np.argsort(-np.where(np.isnan(values), -np.inf, values), kind="stable")
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(1, len(values) + 1)
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+
+def all_metrics(panel, window=3):
+    metrics = dict(panel.values)
+    metrics.update(derived_metrics(panel))
+    for name in METRICS + ("equity",):
+        metrics[f"{name}_yoy"] = yoy_growth(metrics[name])
+    for name in METRICS + ("equity",):
+        metrics[f"{name}_cagr"] = cagr(metrics[name], window)
+    return metrics
+
+
+def to_json(value):
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def column_to_json(values, decimals=4):
+    # whole column at once; tolist() is far cheaper than converting element by element
+    return [None if v != v else v for v in np.round(values, decimals).tolist()]
+
+
+def summary(panel, year=None, window=3, rank_by=("revenue", "profit", "profit_margin")):
+    # one entry per company for `year` (default: latest year with data) plus ranks across companies
+    if not len(panel.years):
+        return {"year": None, "window": window, "companies": []}
+    metrics = all_metrics(panel, window)
+    if year is None:
+        present = has_data(panel)
+        year = int(panel.years[present.any(axis=0)].max()) if present.any() else int(panel.years[-1])
+    if not panel.years[0] <= year <= panel.years[-1]:
+        return {"year": year, "window": window, "companies": []}
+    col = year - int(panel.years[0])
+
+    columns = {name: column_to_json(grid[:, col]) for name, grid in metrics.items()}
+    ranks = {name: column_to_json(rank(metrics[name][:, col]), 0) for name in rank_by}
+    companies = []
+    for i, cid in enumerate(panel.company_ids.tolist()):
+        companies.append({
+            "id": cid,
+            "name": panel.names.get(cid),
+            "metrics": {name: values[i] for name, values in columns.items()},
+            "rank": {name: None if r[i] is None else int(r[i]) for name, r in ranks.items()},
+        })
+    return {"year": year, "window": window, "companies": companies}
+
+
+def company_series(panel, company_id, window=3):
+    i = panel.index_of(company_id)
+    if i is None:
+        return []
+    metrics = all_metrics(panel, window)
+    present = has_data(panel)[i]
+    return [
+        {"year": int(panel.years[col]), **{name: to_json(grid[i, col]) for name, grid in metrics.items()}}
+        for col in np.flatnonzero(present)
+    ]
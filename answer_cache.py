@@ -0,0 +1,134 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", 512))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", 24 * 3600))
+# share answers between gunicorn workers through the answer_cache table
+ANSWER_CACHE_PERSIST = os.environ.get("ANSWER_CACHE_PERSIST", "1") == "1"
+
+FILLER = re.compile(r"^(please|can you|could you|tell me)\s+|\s+(please)$")
+
+
+def normalize_question(question):
+    q = question.lower().strip()
+    q = re.sub(r"[^\w%.\s-]", " ", q)
+    q = re.sub(r"\s+", " ", q).strip(" .")
+    return FILLER.sub("", q).strip()
+
+
+def scope_for(user, company_id=None):
+    if user["role"] != "groupadmin":
+        return f"company:{user['company_id']}"
+    if company_id:
+        return f"company:{int(company_id)}"
+    return "all"
+
+
+class AnswerCache:
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, persist=ANSWER_CACHE_PERSIST):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "shared_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def make_key(self, scope, question):
+        # the data versions make answers about old rows or old report text unreachable as soon
+        # as a write commits
+        version = db.get_data_version(scope)
+        passages = db.get_data_version(f"passages:{scope.split(':')[-1]}")
+        raw = f"{scope}|{version}|{passages}|{normalize_question(question)}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+
+        if self.persist:
+            conn = db.get_connection()
+            try:
+                row = conn.execute(
+                    "SELECT scope, answer, created FROM answer_cache WHERE key=? AND created > ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+            finally:
+                conn.close()
+            if row:
+                self._remember(key, *row)
+                self._count("shared_hits")
+                return row[1]
+
+        self._count("misses")
+        return None
+
+    def _remember(self, key, scope, answer, created):
+        with self._lock:
+            self._entries[key] = (scope, answer, created)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def put(self, key, scope, answer):
+        # callers only pass real answers; a failed model call raises before it gets here
+        if not answer:
+            return
+        created = time.time()
+        self._remember(key, scope, answer, created)
+        self._count("stores")
+        if self.persist:
+            conn = db.get_connection()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answer_cache (key, scope, answer, created) VALUES (?,?,?,?)",
+                    (key, scope, answer, created),
+                )
+                conn.execute("DELETE FROM answer_cache WHERE created <= ?", (created - self.ttl,))
+                conn.commit()
+            finally:
+                conn.close()
+
+    def invalidate(self, company_ids):
+        scopes = {f"company:{cid}" for cid in company_ids} | {"all"}
+        with self._lock:
+            stale = [k for k, entry in self._entries.items() if entry[0] in scopes]
+            for k in stale:
+                del self._entries[k]
+            self._counters["invalidations"] += len(stale)
+        if self.persist:
+            conn = db.get_connection()
+            try:
+                conn.executemany("DELETE FROM answer_cache WHERE scope=?", [(s,) for s in scopes])
+                conn.commit()
+            finally:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["shared_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+answer_cache = AnswerCache()
+db.data_change_listeners.append(answer_cache.invalidate)
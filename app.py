@@ -1,38 +1,86 @@
 import os
 import sqlite3
 import json
+import math
+from concurrent.futures import TimeoutError
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
-from huggingface_hub import InferenceClient
-from db import get_connection, seed_data
+import time
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, stream_with_context
+from werkzeug.utils import secure_filename
+from db import get_connection, create_tables, seed_data, bump_generation, pool_stats
+import ingest_jobs
+import upload_store
+import bulk_load
 import extract_pdf
-from plotting_helper import plot_balance_sheet
+import plotting_helper
+from ask_pool import ask_pool, QueueFull
+from answer_cache import answer_cache, scope_for
+from context_builder import build_context, context_stats, fetch_rows_many
+import analytics
+import rollups
+import auth
+import metrics
+import llm
+import passage_index
+from read_cache import read_cache, to_int
+import sheet_query
 
 load_dotenv()
 
 HF_TOKEN = os.environ.get("HF_API_KEY")
-if not HF_TOKEN:
+# point at a local server (see fake_llm.py) to run without a HF token
+INFERENCE_BASE_URL = os.environ.get("INFERENCE_BASE_URL")
+if not HF_TOKEN and not INFERENCE_BASE_URL:
     raise ValueError("HF_API_KEY not found in environment variables.")
 
-client = InferenceClient(token=HF_TOKEN)
-
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = "uploads"
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# set to 0 when ingestion workers run as their own process (python ingest_jobs.py)
+INGEST_EMBEDDED_WORKERS = os.environ.get("INGEST_EMBEDDED_WORKERS", "1") == "1"
+
+api = Blueprint("api", __name__)
+
+MODEL = "deepseek-ai/DeepSeek-V3.2-Exp"
+# providers are tried in LLM_PROVIDERS order with retries, hedging and circuit breakers (llm.py)
+llm_client = llm.LLMClient(llm.providers_from_env(HF_TOKEN, INFERENCE_BASE_URL, MODEL))
+
+# huggingface_hub, openai, matplotlib and pdfplumber are imported on first use rather than at
+# boot; warm_imports() loads them up front for a gunicorn --preload master (see gunicorn.conf.py)
+def warm_imports():
+    # modules only: the clients themselves (and their connections) are still created per worker
+    from huggingface_hub import InferenceClient
+    import matplotlib.figure
+    import openai
+    import pdfplumber
+
+def create_app():
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = "uploads"
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    create_tables()
+    metrics.init_app(app)
+    app.register_blueprint(api)
+    return app
 
 def check_user(username, password):
     conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, role, company_id FROM users WHERE username=? AND password=?",
-        (username, password),
-    )
-    result = cur.fetchone()
-    conn.close()
-    if result:
-        user_id, role, company_id = result
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id, password, role, company_id FROM users WHERE username=?", (username,))
+        result = cur.fetchone()
+        if not result:
+            return None
+        user_id, stored, role, company_id = result
+        ok, needs_rehash = auth.verify_password(password, stored)
+        if not ok:
+            return None
+        if needs_rehash:
+            cur.execute("UPDATE users SET password=? WHERE id=?", (auth.hash_password(password), user_id))
+            conn.commit()
         return {"id": user_id, "username": username, "role": role.lower(), "company_id": company_id}
-    return None
+    finally:
+        conn.close()
+
+def current_user():
+    return auth.verify_token(request.headers.get("Authorization"))
 
 def list_companies(user):
     conn = get_connection()
@@ -45,6 +93,7 @@ def list_companies(user):
     conn.close()
     return [{"id": cid, "name": name} for cid, name in companies]
 
+@metrics.timed("get_balance_sheet")
 def get_balance_sheet(user, company_id=None, year_from=None, year_to=None):
     conn = get_connection()
     cur = conn.cursor()
@@ -71,26 +120,50 @@ def get_balance_sheet(user, company_id=None, year_from=None, year_to=None):
     conn.close()
     return rows
 
+def list_companies_cached(user):
+    scope = "all" if user["role"] == "groupadmin" else user["company_id"]
+    return read_cache.get_or_load(("companies", scope), list_companies, user)
+
+def get_balance_sheet_cached(user, company_id=None, year_from=None, year_to=None):
+    company_id, year_from, year_to = to_int(company_id), to_int(year_from), to_int(year_to)
+    scope = company_id if user["role"] == "groupadmin" else user["company_id"]
+    key = ("balance_sheet", user["role"] == "groupadmin", scope, year_from, year_to)
+    return read_cache.get_or_load(key, get_balance_sheet, user, company_id, year_from, year_to)
+
+ERROR_PREFIX = "[Error contacting DeepSeek:"
+# per /ask/batch call: items accepted and LLM calls in flight at once
+ASK_BATCH_MAX_ITEMS = int(os.environ.get("ASK_BATCH_MAX_ITEMS", 50))
+ASK_BATCH_PARALLELISM = int(os.environ.get("ASK_BATCH_PARALLELISM", 4))
+
+def build_prompt(context, question):
+    return f"Answer the question based on the balance sheet data and report excerpts below:\n\n{context}\n\nQuestion: {question}\nAnswer concisely:"
+
+@metrics.timed("ask_deepseek")
 def ask_deepseek(context, question):
-    prompt = f"Answer the question based on the balance sheet data below:\n\n{context}\n\nQuestion: {question}\nAnswer concisely:"
-    try:
-        response = client.chat_completion(
-            model="deepseek-ai/DeepSeek-V3.2-Exp",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300
-        )
-        if "response" in response:
-            return response["response"]
-        elif "choices" in response and len(response["choices"]) > 0:
-            return response["choices"][0]["message"]["content"]
-        else:
-            return "[No text returned from model]"
-    except Exception as e:
-        return f"[Error contacting DeepSeek: {e}]"
+    # raises llm.LLMUnavailable when no provider answers
+    return llm_client.complete(build_prompt(context, question), max_tokens=300)
 
+def ask_deepseek_cached(cache_key, scope, context, question):
+    # only answers get here, failures raise past the cache
+    answer = ask_deepseek(context, question)
+    answer_cache.put(cache_key, scope, answer)
+    return answer
 
+def ask_deepseek_timed(cache_key, scope, context, question):
+    start = time.perf_counter()
+    answer = ask_deepseek_cached(cache_key, scope, context, question)
+    return answer, time.perf_counter() - start
 
-@app.route("/signup", methods=["POST"])
+def stream_deepseek(context, question):
+    return llm_client.stream(build_prompt(context, question), max_tokens=300)
+
+def sse(data, event=None):
+    message = f"data: {json.dumps(data)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+
+
+@api.route("/signup", methods=["POST"])
 def signup():
     data = request.json
     username = data.get("username")
@@ -100,44 +173,49 @@ def signup():
 
     if role != "groupadmin" and not company_id:
         return jsonify({"success": False, "error": "Non-admin users must have a company_id"}), 400
+    if not username or not password:
+        return jsonify({"success": False, "error": "username and password are required"}), 400
 
+    conn = get_connection()
     try:
-        conn = get_connection()
         cur = conn.cursor()
         cur.execute(
             "INSERT INTO users (username, password, role, company_id) VALUES (?,?,?,?)",
-            (username, password, role, company_id)
+            (username, auth.hash_password(password), role, company_id)
         )
+        bump_generation(cur)
         conn.commit()
-        conn.close()
+        read_cache.clear()
         return jsonify({"success": True})
     except sqlite3.IntegrityError:
         return jsonify({"success": False, "error": "Username already exists"}), 400
+    finally:
+        conn.close()
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     username = data.get("username")
     password = data.get("password")
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        return jsonify({"success": False, "error": "username and password are required"}), 400
     user = check_user(username, password)
     if user:
-        return jsonify({"success": True, "token": user})
+        return jsonify({"success": True, "token": auth.issue_token(user), "user": user})
     return jsonify({"success": False, "error": "Invalid username/password"}), 401
 
-@app.route("/companies", methods=["GET"])
+@api.route("/companies", methods=["GET"])
 def companies():
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"error": "Missing Authorization"}), 401
-    user = json.loads(token)
-    return jsonify(list_companies(user))
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+    return jsonify(list_companies_cached(user))
 
-@app.route("/ask", methods=["POST"])
+@api.route("/ask", methods=["POST"])
 def ask():
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"error": "Missing Authorization"}), 401
-    user = json.loads(token)
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
 
     data = request.json
     question = data.get("question")
@@ -145,33 +223,299 @@ def ask():
 
     if not question:
         return jsonify({"error": "Question is required"}), 400
+    if company_id not in (None, "") and to_int(company_id) is None:
+        return jsonify({"error": "company_id must be an integer"}), 400
+    company_id = to_int(company_id)
+
+    scope = scope_for(user, company_id)
+    cache_key = answer_cache.make_key(scope, question)
+    answer = answer_cache.get(cache_key)
+    if answer is not None:
+        return jsonify({"answer": answer, "cached": True})
+
+    context, prompt_stats = build_context(user, question, company_id)
+    current_app.logger.info("ask context: %s", prompt_stats)
+    try:
+        answer = ask_pool.run(user["id"], ask_deepseek_cached, cache_key, scope, context, question)
+    except QueueFull:
+        return jsonify({"error": "Too many questions in progress, try again shortly"}), 429
+    except TimeoutError:
+        return jsonify({"error": "Timed out waiting for the model"}), 504
+    except llm.LLMUnavailable as e:
+        answer = f"{ERROR_PREFIX} {e}]"
+    return jsonify({"answer": answer, "cached": False})
+
+@api.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
 
-    rows = get_balance_sheet(user, company_id)
-    context = "\n".join([str(r) for r in rows])
-    answer = ask_deepseek(context, question)
-    return jsonify({"answer": answer})
+    data = request.json
+    question = data.get("question")
+    company_id = data.get("company_id")
+
+    if not question:
+        return jsonify({"error": "Question is required"}), 400
+    if company_id not in (None, "") and to_int(company_id) is None:
+        return jsonify({"error": "company_id must be an integer"}), 400
+    company_id = to_int(company_id)
+
+    scope = scope_for(user, company_id)
+    cache_key = answer_cache.make_key(scope, question)
+    cached = answer_cache.get(cache_key)
+    if cached is None:
+        if not ask_pool.try_reserve():
+            return jsonify({"error": "Too many questions in progress, try again shortly"}), 429
+        try:
+            context, prompt_stats = build_context(user, question, company_id)
+        except Exception:
+            # the slot is only handed to the response below; give it back if we never get there
+            ask_pool.release_reserved()
+            raise
+        current_app.logger.info("ask context: %s", prompt_stats)
+
+    def generate():
+        if cached is not None:
+            yield sse({"token": cached})
+            yield sse({"cached": True, "tokens": 1, "ttft": 0.0, "total": 0.0}, event="done")
+            return
+        start = time.perf_counter()
+        ttft = None
+        parts = []
+        try:
+            for piece in stream_deepseek(context, question):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(piece)
+                yield sse({"token": piece})
+            total = time.perf_counter() - start
+            ask_pool.record_stream(ttft if ttft is not None else total, total)
+            answer_cache.put(cache_key, scope, "".join(parts))
+            yield sse({
+                "cached": False,
+                "tokens": len(parts),
+                "ttft": round(ttft if ttft is not None else total, 3),
+                "total": round(total, 3),
+            }, event="done")
+        except Exception as e:
+            yield sse({"error": f"Error contacting DeepSeek: {e}"}, event="error")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    try:
+        response = Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+    except Exception:
+        if cached is None:
+            ask_pool.release_reserved()
+        raise
+    if cached is None:
+        # runs even if the client goes away before the first token
+        response.call_on_close(ask_pool.release_reserved)
+    return response
+
+@api.route("/ask/batch", methods=["POST"])
+def ask_batch():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+
+    data = request.json or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list of {company_id, question}"}), 400
+    if len(items) > ASK_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {ASK_BATCH_MAX_ITEMS} items per batch"}), 400
+    parallelism = max(1, min(to_int(data.get("parallelism")) or ASK_BATCH_PARALLELISM, ASK_BATCH_PARALLELISM))
+
+    start = time.perf_counter()
+    results = []
+    for i, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        company_id = item.get("company_id")
+        result = {"index": i, "company_id": company_id, "question": item.get("question")}
+        if not item.get("question"):
+            result["error"] = "Question is required"
+        elif company_id not in (None, "") and to_int(company_id) is None:
+            result["error"] = "company_id must be an integer"
+        results.append(result)
+    valid = [r for r in results if "error" not in r]
+
+    rows = fetch_rows_many(user, [r["company_id"] for r in valid]) if valid else []
+    fetched = time.perf_counter()
+
+    # identical prompts share one model call; answers already cached need none
+    calls, call_of = [], {}
+    for r in valid:
+        scope = scope_for(user, r["company_id"])
+        cache_key = answer_cache.make_key(scope, r["question"])
+        answer = answer_cache.get(cache_key)
+        if answer is not None:
+            r.update(answer=answer, cached=True, elapsed=0.0)
+            continue
+        context, _ = build_context(user, r["question"], r["company_id"], rows=rows)
+        prompt = build_prompt(context, r["question"])
+        r["deduped"] = prompt in call_of
+        if not r["deduped"]:
+            call_of[prompt] = len(calls)
+            calls.append((ask_deepseek_timed, (cache_key, scope, context, r["question"])))
+        r["call"] = call_of[prompt]
+
+    outcomes = ask_pool.run_many(user["id"], calls, parallelism)
+    for r in valid:
+        if "call" not in r:
+            continue
+        outcome = outcomes[r.pop("call")]
+        r["cached"] = False
+        if isinstance(outcome, QueueFull):
+            r["error"] = "Too many questions in progress, try again shortly"
+        elif isinstance(outcome, TimeoutError):
+            r["error"] = "Timed out waiting for the model"
+        elif isinstance(outcome, Exception):
+            r["error"] = f"{ERROR_PREFIX} {outcome}]"
+        else:
+            r["answer"], r["elapsed"] = outcome[0], round(outcome[1], 3)
+
+    stats = {
+        "items": len(results),
+        "failed": sum(1 for r in results if "error" in r),
+        "cached": sum(1 for r in results if r.get("cached")),
+        "model_calls": len(calls),
+        "rows_fetched": len(rows),
+        "fetch_ms": round((fetched - start) * 1000, 1),
+        "total_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return jsonify({"results": results, "stats": stats})
+
+@api.route("/ask/jobs", methods=["POST"])
+def ask_job():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
 
-@app.route("/balance_sheet_filtered", methods=["GET"])
+    data = request.json
+    question = data.get("question")
+    company_id = data.get("company_id")
+
+    if not question:
+        return jsonify({"error": "Question is required"}), 400
+    if company_id not in (None, "") and to_int(company_id) is None:
+        return jsonify({"error": "company_id must be an integer"}), 400
+    company_id = to_int(company_id)
+
+    scope = scope_for(user, company_id)
+    cache_key = answer_cache.make_key(scope, question)
+    answer = answer_cache.get(cache_key)
+    if answer is not None:
+        return jsonify({"status": "done", "answer": answer, "cached": True})
+
+    context, prompt_stats = build_context(user, question, company_id)
+    current_app.logger.info("ask context: %s", prompt_stats)
+    try:
+        job_id = ask_pool.queue_job(user["id"], ask_deepseek_cached, cache_key, scope, context, question)
+    except QueueFull:
+        return jsonify({"error": "Too many questions in progress, try again shortly"}), 429
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@api.route("/ask/jobs/<job_id>", methods=["GET"])
+def ask_job_status(job_id):
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+
+    status = ask_pool.status(job_id, user["id"])
+    if not status:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+@api.route("/balance_sheet_filtered", methods=["GET"])
 def balance_sheet_filtered():
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"error": "Missing Authorization"}), 401
-    user = json.loads(token)
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
 
     company_id = request.args.get("company_id")
     year_from = request.args.get("year_from")
     year_to = request.args.get("year_to")
+    fmt = request.args.get("format", "json")
+    if fmt not in ("json", "ndjson", "csv"):
+        return jsonify({"error": "format must be json, ndjson or csv"}), 400
+    # a bad value must not widen the query, e.g. a groupadmin's company_id=abc to every company
+    for name, value in (("company_id", company_id), ("year_from", year_from), ("year_to", year_to)):
+        if value not in (None, "") and to_int(value) is None:
+            return jsonify({"error": f"{name} must be an integer"}), 400
+    company_id, year_from, year_to = to_int(company_id), to_int(year_from), to_int(year_to)
+
+    # plain requests keep the original response and go through read_cache
+    if fmt == "json" and not any(k in request.args for k in ("fields", "limit", "cursor")):
+        rows = get_balance_sheet_cached(user, company_id, year_from, year_to)
+        balance_sheets = [{"year": r[0], "revenue": r[1], "assets": r[2], "liabilities": r[3], "profit": r[4]} for r in rows]
+        return jsonify({"balance_sheets": balance_sheets})
 
-    rows = get_balance_sheet(user, company_id, year_from, year_to)
-    balance_sheets = [{"year": r[0], "revenue": r[1], "assets": r[2], "liabilities": r[3], "profit": r[4]} for r in rows]
-    return jsonify({"balance_sheets": balance_sheets})
+    try:
+        fields = sheet_query.parse_fields(request.args.get("fields"))
+        after = sheet_query.parse_cursor(request.args.get("cursor"))
+        limit = sheet_query.parse_limit(request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if fmt == "json":
+        rows, next_cursor = sheet_query.fetch_page(user, fields, company_id, year_from, year_to, after, limit)
+        return jsonify({"balance_sheets": rows, "next_cursor": next_cursor})
+
+    # exports stream every matching row unless the client asks for a page
+    paged = "limit" in request.args
+    query, params = sheet_query.build_query(user, fields, company_id, year_from, year_to, after, limit if paged else None)
+    if fmt == "ndjson":
+        return Response(stream_with_context(sheet_query.iter_ndjson(query, params, fields)), mimetype="application/x-ndjson")
+    return Response(
+        stream_with_context(sheet_query.iter_csv(query, params, fields)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=balance_sheets.csv"},
+    )
+
+@api.route("/analytics", methods=["GET"])
+def analytics_view():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+
+    company_id = request.args.get("company_id", type=int)
+    year = request.args.get("year", type=int)
+    window = request.args.get("window", 3, type=int)
+
+    if user["role"] != "groupadmin":
+        if company_id and company_id != user["company_id"]:
+            return jsonify({"error": "Access denied"}), 403
+        company_id = user["company_id"]
+        panel = analytics.load_panel([company_id])
+    else:
+        # rankings are across every company even when one is selected
+        panel = analytics.load_panel()
+
+    result = analytics.summary(panel, year, window)
+    if company_id:
+        result["series"] = analytics.company_series(panel, company_id, window)
+    return jsonify(result)
+
+@api.route("/groups/<name>/summary", methods=["GET"])
+def group_summary(name):
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+    # group totals include every member company, so only a groupadmin may see them
+    if user["role"] != "groupadmin":
+        return jsonify({"error": "Only a group admin can view group summaries"}), 403
 
-@app.route("/upload-pdf", methods=["POST"])
+    members = rollups.group_members(name)
+    if not members:
+        return jsonify({"error": "Group not found"}), 404
+    return jsonify({"group": name, "companies": members, "years": rollups.group_summary(name)})
+
+@api.route("/upload-pdf", methods=["POST"])
 def upload_pdf():
-    token = request.headers.get("Authorization")
-    if not token:
-        return jsonify({"error": "Missing Authorization"}), 401
-    user = json.loads(token)
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
 
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
@@ -179,17 +523,107 @@ def upload_pdf():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(file_path)
+    company_id = request.form.get("company_id", type=int)
+    if user["role"] != "groupadmin":
+        if company_id and company_id != user["company_id"]:
+            return jsonify({"error": "You cannot upload data for this company"}), 403
+        company_id = user["company_id"]
+
+    tmp_path, content_hash = upload_store.save_upload(file, current_app.config['UPLOAD_FOLDER'])
+    cached = upload_store.get_cached_extraction(content_hash)
+    detected = None
+    if not company_id and cached is not None and cached["detected"]:
+        # a known file: the company was detected when it was first extracted
+        detected = cached["detected"]
+        company_id = detected["company_id"]
+    elif not company_id:
+        # no company picked: find it from the names on the first pages
+        try:
+            company_id, mentions = extract_pdf.detect_company(tmp_path, user)
+        except extract_pdf.CompanyResolutionError as e:
+            os.remove(tmp_path)
+            return jsonify({"error": str(e)}), 422
+        except Exception:
+            os.remove(tmp_path)
+            return jsonify({"error": "Could not read the PDF"}), 400
+        detected = {"company_id": company_id, "mentions": mentions}
+    if cached is not None:
+        # seen this exact file before: reuse its extracted rows, no PDF parsing
+        os.remove(tmp_path)
+        result = upload_store.apply_cached_extraction(company_id, cached, content_hash)
+        return jsonify({"success": True, "filename": file.filename, "cached": True, "status": "done",
+                        "company_id": company_id, "company_detected": detected,
+                        "rows_extracted": result["rows"], "tables": result["tables"],
+                        "passages": result.get("passages", 0)})
+
+    # stored under its content hash so a later upload with the same name can't replace a queued file
+    file_path = os.path.abspath(os.path.join(
+        current_app.config['UPLOAD_FOLDER'], f"{content_hash[:16]}_{secure_filename(file.filename)}"
+    ))
+    os.replace(tmp_path, file_path)
+
+    job_id, created = ingest_jobs.submit(file_path, file.filename, user, company_id, content_hash)
+    if INGEST_EMBEDDED_WORKERS:
+        ingest_jobs.start_workers()
+    upload_store.evict_uploads(current_app.config['UPLOAD_FOLDER'], protected=ingest_jobs.active_file_paths)
+    return jsonify({"success": True, "filename": file.filename, "job_id": job_id, "resubmitted": not created,
+                    "company_id": company_id, "company_detected": detected}), 202
+
+@api.route("/upload-bulk", methods=["POST"])
+def upload_bulk():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
 
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
     try:
-        extract_pdf.extract_and_save(file_path, user)
-        return jsonify({"success": True, "filename": file.filename})
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
-
-@app.route("/plot/<int:company_id>", methods=["GET"])
+        bulk_load.detect_format(file.filename)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # rows without a company column go to company_id; non-admins can only load their own company
+    company_id = request.form.get("company_id", type=int)
+    if user["role"] != "groupadmin" and company_id and company_id != user["company_id"]:
+        return jsonify({"error": "You cannot upload data for this company"}), 403
+    create_companies = user["role"] == "groupadmin" and request.form.get("create_companies") == "1"
+
+    result = bulk_load.load_upload(file, user=user, company_id=company_id, create_companies=create_companies)
+    status = 400 if "error" in result and not result["rows_written"] else 200
+    return jsonify({"success": "error" not in result, "filename": file.filename, **result}), status
+
+@api.route("/ingest/jobs/<int:job_id>", methods=["GET"])
+def ingest_job_status(job_id):
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+
+    job = ingest_jobs.get_job(job_id)
+    if not job or (user["role"] != "groupadmin" and job["company_id"] != user["company_id"]):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "job_id": job["id"],
+        "filename": job["filename"],
+        "company_id": job["company_id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "pages_done": job["pages_done"],
+        "pages_total": job["pages_total"],
+        "rows_extracted": job["rows_extracted"],
+        "errors": job["errors"],
+    })
+
+@api.route("/plot/<int:company_id>", methods=["GET"])
 def plot(company_id):
+    user = current_user()
+    if not user:
+        return jsonify({"error": "Missing or invalid Authorization"}), 401
+    if user["role"] != "groupadmin" and company_id != user["company_id"]:
+        return jsonify({"error": "Access denied"}), 403
+
     conn = get_connection()
     cur = conn.cursor()
     company = cur.execute("SELECT name FROM companies WHERE id=?", (company_id,)).fetchone()
@@ -197,19 +631,59 @@ def plot(company_id):
     if not company:
         return jsonify({"error": "Company not found"}), 404
     company_name = company[0]
+
+    fmt = request.args.get("format", "png")
+    if fmt not in plotting_helper.FORMATS:
+        return jsonify({"error": "format must be png or svg"}), 400
+    width = request.args.get("width", 10, type=float)
+    height = request.args.get("height", 6, type=float)
+    # nan slips through min/max untouched and makes matplotlib fail
+    if not (math.isfinite(width) and math.isfinite(height)):
+        return jsonify({"error": "width and height must be finite numbers"}), 400
+    width = min(max(width, 2), 20)
+    height = min(max(height, 2), 20)
+    dpi = min(max(request.args.get("dpi", 100, type=int), 50), 200)
+
+    etag = plotting_helper.chart_etag(company_id, fmt, width, height, dpi)
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
     try:
-        plot_balance_sheet(company_name)
-        return jsonify({"success": True, "company": company_name})
+        image = plotting_helper.get_chart(company_id, company_name, etag, fmt, width, height, dpi)
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
-
-from flask import render_template
-
-@app.route("/")
+    if image is None:
+        return jsonify({"error": "No balance sheet data for this company"}), 404
+
+    response = Response(image, mimetype=plotting_helper.FORMATS[fmt])
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+@api.route("/metrics", methods=["GET"])
+def metrics_view():
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    components = {
+        "db_pool": pool_stats(),
+        "ask_pool": ask_pool.stats(),
+        "answer_cache": answer_cache.stats(),
+        "read_cache": read_cache.stats(),
+        "token_cache": auth.token_cache.stats(),
+        "context": context_stats(),
+        "passage_index": passage_index.stats(),
+        "llm": llm_client.stats(),
+    }
+    exported = ingest_jobs.exported_metrics()
+    return Response(metrics.render(components, exported), mimetype="text/plain; version=0.0.4")
+
+@api.route("/")
 def home():
     return render_template("index.html")
 
 
+app = create_app()
+
+
 if __name__ == "__main__":
     seed_data()
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
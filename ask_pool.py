@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+
+from db import get_connection
+
+ASK_WORKERS = int(os.environ.get("ASK_WORKERS", 4))
+ASK_QUEUE_DEPTH = int(os.environ.get("ASK_QUEUE_DEPTH", 16))
+ASK_TIMEOUT = float(os.environ.get("ASK_TIMEOUT", 60))
+JOB_TTL = int(os.environ.get("ASK_JOB_TTL", 600))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class AskPool:
+    # bounded thread pool for LLM calls. at most `workers` calls run at once and at most
+    # `max_pending` more may wait; anything beyond that is rejected so the caller can 429.
+    # jobs queued with queue_job() keep their status and answer in the ask_jobs table, so any
+    # gunicorn worker can answer a poll; the others live in this process only.
+
+    def __init__(self, workers=ASK_WORKERS, max_pending=ASK_QUEUE_DEPTH, timeout=ASK_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._jobs = {}
+        self._counters = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "timed_out": 0}
+        self._streams = {"count": 0, "ttft_sum": 0.0, "ttft_max": 0.0, "total_sum": 0.0}
+
+    def _get_executor(self):
+        # created lazily so a preloaded app doesn't fork a parent's idle threads
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ask")
+                self._pid = os.getpid()
+            return self._executor
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _done(self, future):
+        self._slots.release()
+        self._count("failed" if future.exception() else "completed")
+
+    def _expire_jobs(self):
+        cutoff = time.time() - JOB_TTL
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job["submitted"] < cutoff and job["future"].done()]:
+                del self._jobs[job_id]
+
+    def _start(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            raise QueueFull()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        self._count("submitted")
+        return future
+
+    def submit(self, owner_id, fn, *args):
+        self._expire_jobs()
+        future = self._start(fn, *args)
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {"owner": owner_id, "future": future, "submitted": time.time()}
+        return job_id
+
+    def queue_job(self, owner_id, fn, *args):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn = get_connection()
+        try:
+            conn.execute("DELETE FROM ask_jobs WHERE updated < ?", (now - JOB_TTL,))
+            conn.execute(
+                "INSERT INTO ask_jobs (id, owner, submitted, updated) VALUES (?,?,?,?)",
+                (job_id, owner_id, now, now),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        try:
+            self._start(self._run_job, job_id, fn, *args)
+        except QueueFull:
+            conn = get_connection()
+            conn.execute("DELETE FROM ask_jobs WHERE id=?", (job_id,))
+            conn.commit()
+            conn.close()
+            raise
+        return job_id
+
+    def _run_job(self, job_id, fn, *args):
+        self._update_job(job_id, status="running")
+        try:
+            answer = fn(*args)
+        except Exception as e:
+            self._update_job(job_id, status="failed", error=str(e))
+            raise
+        self._update_job(job_id, status="done", answer=answer)
+        return answer
+
+    def _update_job(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name}=?" for name in fields)
+        conn = get_connection()
+        try:
+            conn.execute(f"UPDATE ask_jobs SET {assignments} WHERE id=?", (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def wait(self, job_id, timeout=None):
+        future = self._jobs[job_id]["future"]
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except TimeoutError:
+            self._count("timed_out")
+            raise
+
+    def run(self, owner_id, fn, *args):
+        job_id = self.submit(owner_id, fn, *args)
+        try:
+            return self.wait(job_id)
+        finally:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+
+    def run_many(self, owner_id, calls, parallelism):
+        # runs (fn, args) pairs with at most `parallelism` of them in the pool at a time and
+        # returns one result or exception per call, in order. each call gets its own timeout
+        # from the moment it is submitted; a full pool only fails a call when this batch has
+        # nothing of its own in flight to wait for
+        results = [None] * len(calls)
+        pending = {}
+        next_call = 0
+        while next_call < len(calls) or pending:
+            while next_call < len(calls) and len(pending) < parallelism:
+                fn, args = calls[next_call]
+                try:
+                    job_id = self.submit(owner_id, fn, *args)
+                except QueueFull as e:
+                    if pending:
+                        break
+                    results[next_call] = e
+                    next_call += 1
+                    continue
+                pending[job_id] = (next_call, time.monotonic() + self.timeout)
+                next_call += 1
+            if not pending:
+                continue
+
+            with self._lock:
+                futures = {self._jobs[job_id]["future"]: job_id for job_id in pending}
+            first_deadline = min(deadline for _, deadline in pending.values())
+            wait(futures, timeout=max(0.0, first_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future, job_id in futures.items():
+                index, deadline = pending[job_id]
+                if future.done():
+                    results[index] = future.exception() or future.result()
+                elif deadline <= now:
+                    self._count("timed_out")
+                    results[index] = TimeoutError()
+                else:
+                    continue
+                del pending[job_id]
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+        return results
+
+    def try_reserve(self):
+        # streaming answers run on the request thread but still count against the pool limit
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            return False
+        return True
+
+    def release_reserved(self):
+        self._slots.release()
+
+    def record_stream(self, ttft, total):
+        with self._lock:
+            self._streams["count"] += 1
+            self._streams["ttft_sum"] += ttft
+            self._streams["ttft_max"] = max(self._streams["ttft_max"], ttft)
+            self._streams["total_sum"] += total
+
+    def status(self, job_id, owner_id):
+        conn = get_connection()
+        try:
+            row = conn.execute(
+                "SELECT owner, status, answer, error, submitted FROM ask_jobs WHERE id=?", (job_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row or row[0] != owner_id:
+            return None
+        _, status, answer, error, submitted = row
+        result = {"job_id": job_id, "status": status, "elapsed": round(time.time() - submitted, 3)}
+        if status == "failed":
+            result["error"] = error
+        elif status == "done":
+            result["answer"] = answer
+        return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["jobs"] = len(self._jobs)
+            streams = dict(self._streams)
+        if streams["count"]:
+            stats["streams"] = streams["count"]
+            stats["ttft_avg"] = round(streams["ttft_sum"] / streams["count"], 4)
+            stats["ttft_max"] = round(streams["ttft_max"], 4)
+            stats["stream_total_avg"] = round(streams["total_sum"] / streams["count"], 4)
+        stats["workers"] = self.workers
+        stats["max_pending"] = self.max_pending
+        return stats
+
+
+ask_pool = AskPool()
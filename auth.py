@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+TOKEN_TTL = int(os.environ.get("AUTH_TOKEN_TTL", 12 * 3600))
+TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 4096))
+# pbkdf2 iterations for new password hashes; stored hashes with a different cost are redone on login
+PASSWORD_COST = int(os.environ.get("AUTH_PASSWORD_COST", 200_000))
+SECRET_FILE = os.environ.get("AUTH_SECRET_FILE", ".auth_secret")
+
+
+def load_secret():
+    # every gunicorn worker has to sign with the same key, so without AUTH_SECRET the
+    # first process to start writes one to SECRET_FILE and the rest read it
+    secret = os.environ.get("AUTH_SECRET")
+    if secret:
+        return secret.encode()
+    try:
+        fd = os.open(SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            with open(SECRET_FILE, "rb") as f:
+                secret = f.read().strip()
+            if secret:
+                return secret
+            time.sleep(0.01)
+        raise RuntimeError(f"{SECRET_FILE} is empty; set AUTH_SECRET or delete the file")
+    secret = secrets.token_hex(32).encode()
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+_secret = None
+
+
+def secret():
+    global _secret
+    if _secret is None:
+        _secret = load_secret()
+    return _secret
+
+
+def b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(payload):
+    return b64encode(hmac.new(secret(), payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user, ttl=None):
+    claims = {
+        "id": user["id"],
+        "username": user["username"],
+        "role": user["role"],
+        "company_id": user["company_id"],
+        "exp": int(time.time()) + (ttl or TOKEN_TTL),
+    }
+    payload = b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{sign(payload)}"
+
+
+class TokenCache:
+    # verified tokens -> user dict, so the common path is one dict lookup and an expiry check
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token, now):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token, exp, user):
+        with self._lock:
+            self._entries[token] = (exp, user)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token):
+    if not token:
+        return None
+    if token.startswith("Bearer "):
+        token = token[7:]
+    now = time.time()
+    user = token_cache.get(token, now)
+    if user is not None:
+        return user
+
+    payload, _, signature = token.partition(".")
+    # bytes, because compare_digest rejects str arguments with non-ASCII characters
+    if not signature or not hmac.compare_digest(signature.encode(), sign(payload).encode()):
+        return None
+    try:
+        claims = json.loads(b64decode(payload))
+    except ValueError:
+        return None
+    exp = claims.pop("exp", 0)
+    if exp <= now:
+        return None
+    token_cache.put(token, exp, claims)
+    return claims
+
+
+def hash_password(password, cost=None):
+    cost = cost or PASSWORD_COST
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, cost)
+    return f"pbkdf2_sha256${cost}${b64encode(salt)}${b64encode(digest)}"
+
+
+def verify_password(password, stored):
+    # returns (ok, needs_rehash); rows written before hashing hold the plain password.
+    # a hash that can't be parsed never matches
+    if not isinstance(password, str) or not isinstance(stored, str):
+        return False, False
+    if not stored.startswith("pbkdf2_sha256$"):
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    try:
+        _, cost, salt, digest = stored.split("$")
+        cost = int(cost)
+        salt, digest = b64decode(salt), b64decode(digest)
+    except ValueError:
+        return False, False
+    if cost <= 0:
+        return False, False
+    candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, cost)
+    return hmac.compare_digest(candidate, digest), cost != PASSWORD_COST
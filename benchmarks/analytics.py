@@ -0,0 +1,84 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import analytics
+import db
+
+# batch analytics over a synthetic portfolio:
+#   python -m benchmarks.analytics --companies 10000 --years 30 [--sqlite]
+
+
+def make_rows(companies, years, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for cid in range(1, companies + 1):
+        revenue = rng.uniform(1e4, 1e6)
+        for year in range(2024 - years, 2024):
+            revenue *= rng.uniform(0.9, 1.25)
+            assets = revenue * rng.uniform(1.5, 3)
+            rows.append((cid, year, revenue, assets, assets * rng.uniform(0.2, 0.8), revenue * rng.uniform(-0.05, 0.2)))
+    return rows
+
+
+def python_baseline(rows):
+    # what a per-company loop costs: yoy revenue growth, margin and leverage only
+    by_company = {}
+    for cid, year, revenue, assets, liabilities, profit in rows:
+        by_company.setdefault(cid, []).append((year, revenue, assets, liabilities, profit))
+    out = {}
+    for cid, series in by_company.items():
+        series.sort()
+        out[cid] = [
+            (
+                (r[1] - p[1]) / abs(p[1]) * 100 if p and p[0] == r[0] - 1 and p[1] else None,
+                r[4] / r[1] * 100 if r[1] else None,
+                r[3] / r[2] if r[2] else None,
+            )
+            for p, r in zip([None] + series[:-1], series)
+        ]
+    return out
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{label:<32} {(time.perf_counter() - start) * 1000:9.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--companies", type=int, default=10000)
+    parser.add_argument("--years", type=int, default=30)
+    parser.add_argument("--sqlite", action="store_true", help="also time loading the panel from SQLite")
+    args = parser.parse_args()
+
+    rows = make_rows(args.companies, args.years)
+    print(f"{len(rows)} rows ({args.companies} companies x {args.years} years)")
+
+    timed("python loop (3 metrics)", python_baseline, rows)
+    panel = timed("build_panel", analytics.build_panel, rows)
+    timed("all_metrics (21 metrics)", analytics.all_metrics, panel, 5)
+    timed("summary + rankings", analytics.summary, panel, None, 5)
+    timed("company_series", analytics.company_series, panel, args.companies // 2, 5)
+
+    if args.sqlite:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.pool.db_name = os.path.join(tmp, "bench.db")
+            db.create_tables()
+            conn = db.get_connection()
+            conn.executemany(
+                "INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit) "
+                "VALUES (?,?,?,?,?,?)", rows,
+            )
+            conn.commit()
+            conn.close()
+            timed("load_panel from sqlite", analytics.load_panel)
+            db.pool.close_idle()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("AUTH_SECRET", "benchmark")
+
+import auth
+
+# per-request cost of token verification and per-login cost of password hashing:
+#   python -m benchmarks.auth --tokens 1000 --rounds 100000
+
+
+def per_call(label, fn, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / len(args_list) * 1e6:9.2f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct users/tokens")
+    parser.add_argument("--rounds", type=int, default=100_000)
+    parser.add_argument("--cost", type=int, default=auth.PASSWORD_COST)
+    args = parser.parse_args()
+
+    users = [{"id": i, "username": f"user{i}", "role": "analyst", "company_id": i % 50} for i in range(args.tokens)]
+    tokens = [auth.issue_token(u) for u in users]
+    headers = [f"Bearer {t}" for t in tokens]
+    rounds = [(headers[i % len(headers)],) for i in range(args.rounds)]
+
+    per_call("json.loads (old header parse)", json.loads, [(json.dumps(u),) for u in users])
+    per_call("issue_token", auth.issue_token, [(u,) for u in users])
+    auth.token_cache.clear()
+    per_call("verify_token, cold (hmac)", auth.verify_token, [(h,) for h in headers])
+    per_call("verify_token, cached", auth.verify_token, rounds)
+    print(f"token cache: {auth.token_cache.stats()}")
+
+    start = time.perf_counter()
+    stored = auth.hash_password("correct horse", args.cost)
+    print(f"{'hash_password':<32} {(time.perf_counter() - start) * 1000:9.1f} ms (cost {args.cost})")
+    start = time.perf_counter()
+    auth.verify_password("correct horse", stored)
+    print(f"{'verify_password':<32} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+import bulk_load
+import db
+
+# bulk loader throughput on a generated file:
+#   python -m benchmarks.bulk_load --rows 500000 --companies 10000 [--format jsonl] [--messy]
+
+
+def write_file(path, fmt, rows, companies, messy, seed=0):
+    rng = random.Random(seed)
+    years = max(1, -(-rows // companies))
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer:
+            writer.writerow(["company", "year", "revenue", "assets", "liabilities", "profit"])
+        n = 0
+        for year in range(2024 - years, 2024):
+            for cid in range(companies):
+                if n == rows:
+                    return
+                values = [rng.uniform(1e4, 1e7) for _ in range(4)]
+                if messy:
+                    # thousands separators and accounting negatives push rows through clean_number
+                    values = [f"{v:,.2f}" if i % 2 else f"({v:.2f})" for i, v in enumerate(values)]
+                else:
+                    values = [round(v, 2) for v in values]
+                if writer:
+                    writer.writerow([f"Company {cid}", year, *values])
+                else:
+                    f.write(json.dumps({"company": f"Company {cid}", "year": year, "revenue": values[0],
+                                        "assets": values[1], "liabilities": values[2], "profit": values[3]}) + "\n")
+                n += 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--companies", type=int, default=10_000)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--messy", action="store_true", help="formatted numbers instead of plain floats")
+    parser.add_argument("--batch-size", type=int, default=bulk_load.BULK_BATCH_SIZE)
+    parser.add_argument("--groups", type=int, default=20, help="parent groups, so rollups are maintained too")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.pool.db_name = os.path.join(tmp, "bench.db")
+        db.create_tables()
+        conn = db.get_connection()
+        conn.executemany(
+            "INSERT INTO companies (name, parent_group) VALUES (?, ?)",
+            [(f"Company {i}", f"Group {i % args.groups}" if args.groups else None) for i in range(args.companies)],
+        )
+        conn.commit()
+        conn.close()
+
+        path = os.path.join(tmp, f"rows.{args.format}")
+        write_file(path, args.format, args.rows, args.companies, args.messy)
+        print(f"{args.rows} rows, {os.path.getsize(path) / 1e6:.1f} MB {args.format}")
+
+        for label in ("insert", "upsert (same rows again)"):
+            start = time.perf_counter()
+            result = bulk_load.load_file(path, batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<28} {elapsed:7.2f} s  {result['rows_written'] / elapsed:>10,.0f} rows/s  "
+                  f"skipped {result['rows_skipped']}")
+        db.pool.close_idle()
+
+
+if __name__ == "__main__":
+    main()
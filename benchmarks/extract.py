@@ -0,0 +1,44 @@
+import argparse
+import os
+import tempfile
+import time
+
+import extract_pdf
+from benchmarks.fixtures import make_report_pdf
+
+# sequential vs parallel extract_tables, with and without the page pre-filter, on a generated report:
+#   python -m benchmarks.extract --pages 200 --workers 1 2 4
+
+
+def run(pdf_path, workers, prefilter):
+    stats = {}
+    start = time.perf_counter()
+    tables = extract_pdf.extract_tables(pdf_path, workers=workers, prefilter=prefilter, stats=stats)
+    return time.perf_counter() - start, tables, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    extract_pdf.PARALLEL_MIN_PAGES = 1
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_report_pdf(os.path.join(tmp, "report.pdf"), pages=args.pages)
+        baseline = None
+        for prefilter in (False, True):
+            for workers in args.workers:
+                elapsed, tables, stats = run(pdf_path, workers, prefilter)
+                if baseline is None:
+                    baseline = tables
+                assert tables == baseline, "extraction returned different tables"
+                print(
+                    f"prefilter={prefilter!s:<5} workers={workers:<3} {elapsed:7.2f}s  "
+                    f"{args.pages / elapsed:7.1f} pages/s  {len(tables)} tables  "
+                    f"{stats['pages_skipped']} pages skipped"
+                )
+
+
+if __name__ == "__main__":
+    main()
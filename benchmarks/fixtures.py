@@ -0,0 +1,43 @@
+import random
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_pdf import PdfPages
+
+HEADER = ["Year", "Revenue", "Assets", "Liabilities", "Profit"]
+FILLER = (
+    "Management discussion and analysis. Revenue from operations was driven by volume growth "
+    "across segments while input costs remained elevated. The board recommends a dividend. "
+)
+
+
+def make_report_pdf(path, pages=50, table_every=10, seed=0, company=None):
+    # a synthetic annual report: mostly narrative pages, a balance-sheet table every `table_every` pages.
+    # with a company name, page one opens with it as a title
+    rng = random.Random(seed)
+    with PdfPages(path) as pdf:
+        for n in range(pages):
+            fig = Figure(figsize=(8.5, 11))
+            ax = fig.add_subplot()
+            ax.axis("off")
+            if company and n == 0:
+                fig.suptitle(f"{company} Limited - Annual Report")
+            if n % table_every == 0:
+                base = 2000 + n // table_every
+                rows = [HEADER] + [
+                    [
+                        str(base + i),
+                        f"{rng.randint(100000, 500000):,}",
+                        f"{rng.randint(500000, 1500000):,}",
+                        f"{rng.randint(100000, 700000):,}",
+                        f"({rng.randint(1000, 9000):,})" if rng.random() < 0.1 else f"{rng.randint(1000, 90000):,}",
+                    ]
+                    for i in range(5)
+                ]
+                ax.table(cellText=rows, loc="center")
+            else:
+                for line in range(40):
+                    ax.text(0, 1 - line / 40, FILLER[: 60 + (line * 7) % 40], fontsize=8)
+            pdf.savefig(fig)
+    return path
@@ -0,0 +1,92 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_llm
+import llm
+
+# success rate and latency of LLM calls against two local stub servers with injected faults:
+#   python -m benchmarks.llm_resilience [--requests 200] [--error-rate 0.2] [--slow-rate 0.05]
+# the primary (HF InferenceClient protocol) fails and stalls at the given rates, the secondary
+# (OpenAI-compatible router protocol) is healthy. "single" calls the primary directly, once,
+# as ask_deepseek used to; "resilient" is llm.LLMClient over both.
+
+
+def start_stub(**settings):
+    server = fake_llm.serve(0, **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def run(complete, prompts, concurrency):
+    def one(prompt):
+        start = time.perf_counter()
+        try:
+            complete(prompt)
+            ok = True
+        except (llm.LLMUnavailable, llm.ProviderError):
+            ok = False
+        return ok, time.perf_counter() - start
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(one, prompts))
+    latencies = [t for _, t in results]
+    return {
+        "ok": sum(ok for ok, _ in results),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duplicates", type=float, default=0.3, help="share of prompts repeated while in flight")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--hedge-after", type=float, default=0.5)
+    args = parser.parse_args()
+
+    faults = dict(latency=args.latency, error_rate=args.error_rate, slow_rate=args.slow_rate,
+                  slow_latency=args.slow_latency, token_delay=0)
+    unique = max(1, int(args.requests * (1 - args.duplicates)))
+    # repeats sit next to each other so they are in flight together, like a refresh storm
+    prompts = [f"question {i * unique // args.requests}" for i in range(args.requests)]
+
+    primary, primary_url = start_stub(**faults)
+    single = llm.HFProvider("hf", "stub", base_url=primary_url)
+    single_result = run(lambda p: single.complete([{"role": "user", "content": p}], 300), prompts, args.concurrency)
+    single_calls = primary.requests
+
+    primary, primary_url = start_stub(**faults)
+    secondary, secondary_url = start_stub(latency=args.latency, token_delay=0)
+    resilient = llm.LLMClient([
+        llm.HFProvider("hf", "stub", base_url=primary_url),
+        llm.RouterProvider("router", "stub", api_key="stub", base_url=f"{secondary_url}/v1"),
+    ], backoff=0.05, hedge_after=args.hedge_after)
+    resilient_result = run(resilient.complete, prompts, args.concurrency)
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, primary error rate {args.error_rate:.0%}, "
+          f"{args.slow_rate:.0%} stalls of {args.slow_latency}s")
+    print(f"{'':10} {'ok':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'upstream calls':>15}")
+    for name, result, calls in (("single", single_result, single_calls),
+                                ("resilient", resilient_result, primary.requests + secondary.requests)):
+        print(f"{name:10} {result['ok']:>6} {result['p50'] * 1000:>8.0f} {result['p95'] * 1000:>8.0f} "
+              f"{result['p99'] * 1000:>8.0f} {calls:>15}")
+    stats = resilient.stats()
+    print("resilient: " + ", ".join(f"{k}={stats[k]}" for k in ("coalesced", "retries", "failovers", "hedges",
+                                                                "hedge_wins", "hf_breaker_opens")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+import argparse
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# end-to-end load test: boots the app in a subprocess against a generated database and the
+# fake inference server, then drives a weighted mix of routes at a fixed concurrency.
+#   python -m benchmarks.load_test --companies 200 --years 20 --concurrency 8 --duration 30
+# results are written to benchmarks/results/ and compared with the previous run.
+# "upload" is the /upload-pdf response (hashing and queueing); "ingest" runs from the upload to
+# its job reaching done in the server's ingest workers (--ingest-workers), the real parsing cost
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_MIX = "login=1,companies=4,balance_sheet=4,export=1,ask=2,plot=1,upload=0.2"
+PASSWORD = "bench-password"
+QUESTIONS = [
+    "How did revenue change for {name} in {year}?",
+    "Is {name} taking on more debt?",
+    "What was the profit margin of {name} in {year}?",
+    "Compare assets and liabilities of {name}",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# ----------------- server side -----------------
+
+def seed_database(companies, years, seed=0):
+    import db
+    from auth import hash_password
+
+    rng = random.Random(seed)
+    db.create_tables()
+    conn = db.get_connection()
+    conn.executemany(
+        "INSERT INTO companies (name, parent_group) VALUES (?, ?)",
+        [(f"Company {i}", f"Group {i % 10}") for i in range(companies)],
+    )
+    rows = []
+    for cid in range(1, companies + 1):
+        revenue = rng.uniform(1e4, 1e6)
+        for year in range(2024 - years, 2024):
+            revenue *= rng.uniform(0.9, 1.25)
+            assets = revenue * rng.uniform(1.5, 3)
+            rows.append((cid, year, revenue, assets, assets * rng.uniform(0.2, 0.8), revenue * rng.uniform(-0.05, 0.2)))
+    conn.executemany(
+        "INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit) VALUES (?,?,?,?,?,?)", rows
+    )
+    # one hash shared by every bench user keeps seeding fast; logins still pay the full verify
+    password = hash_password(PASSWORD)
+    users = [("bench_admin", password, "GroupAdmin", None)]
+    users += [(f"bench_user{i}", password, "analyst", i) for i in range(1, min(companies, 50) + 1)]
+    conn.executemany("INSERT INTO users (username, password, role, company_id) VALUES (?,?,?,?)", users)
+    conn.commit()
+    conn.close()
+
+
+def serve(args):
+    # runs in the child process; prints "READY <port>" once it accepts requests
+    os.chdir(args.workdir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import fake_llm
+    fake_llm.LATENCY = args.llm_latency
+    fake_llm.TOKEN_DELAY = args.llm_token_delay
+    llm = fake_llm.serve(0)
+    threading.Thread(target=llm.serve_forever, daemon=True).start()
+    os.environ["INFERENCE_BASE_URL"] = f"http://127.0.0.1:{llm.server_port}"
+    os.environ.pop("HF_API_KEY", None)
+
+    import db
+    db.pool.db_name = os.path.join(args.workdir, "bench.db")
+    seed_database(args.companies, args.years)
+
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import app as appmod
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, appmod.app, threaded=True, request_handler=QuietHandler)
+    print(f"READY {server.server_port}", flush=True)
+    server.serve_forever()
+
+
+# ----------------- client side -----------------
+
+class Client:
+
+    def __init__(self, base_url, args, pdfs):
+        self.base_url = base_url
+        self.args = args
+        self.pdfs = pdfs
+        self.tokens = {}
+        # uploads whose job hasn't finished: job id -> (user, start); polled by watch_jobs()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.ingest_samples = []
+
+    def request(self, method, path, body=None, headers=None):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def post_json(self, path, payload, headers=None):
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        return self.request("POST", path, json.dumps(payload).encode(), headers)
+
+    def login(self, username):
+        status, body = self.post_json("/login", {"username": username, "password": PASSWORD})
+        if status == 200:
+            self.tokens[username] = json.loads(body)["token"]
+        return status
+
+    def auth(self, username):
+        if username not in self.tokens:
+            self.login(username)
+        return {"Authorization": f"Bearer {self.tokens.get(username, '')}"}
+
+    def pick_user(self, rng):
+        # mostly the admin (whole portfolio, the expensive case), some single-company analysts
+        if rng.random() < 0.7:
+            return "bench_admin", None
+        i = rng.randint(1, min(self.args.companies, 50))
+        return f"bench_user{i}", i
+
+    def run(self, op, rng):
+        user, company = self.pick_user(rng)
+        company = company or rng.randint(1, self.args.companies)
+        year = rng.randint(2024 - self.args.years, 2023)
+        if op == "login":
+            return self.login(user)
+        if op == "companies":
+            return self.request("GET", "/companies", headers=self.auth(user))[0]
+        if op == "balance_sheet":
+            path = f"/balance_sheet_filtered?company_id={company}&year_from={year - 5}&year_to={year}"
+            return self.request("GET", path, headers=self.auth(user))[0]
+        if op == "export":
+            return self.request("GET", "/balance_sheet_filtered?format=ndjson", headers=self.auth(user))[0]
+        if op == "ask":
+            question = rng.choice(QUESTIONS).format(name=f"Company {company - 1}", year=year)
+            return self.post_json("/ask", {"company_id": company, "question": question}, self.auth(user))[0]
+        if op == "plot":
+            return self.request("GET", f"/plot/{company}?format=png", headers=self.auth(user))[0]
+        if op == "upload":
+            return self.upload(rng.choice(self.pdfs), company, user)
+        raise ValueError(f"unknown op {op}")
+
+    def upload(self, pdf_path, company, user):
+        boundary = uuid.uuid4().hex
+        with open(pdf_path, "rb") as f:
+            # a trailing comment makes every upload a new file, so none is served from the
+            # extraction cache or folded into an earlier job
+            content = f.read() + f"\n% {boundary}\n".encode()
+        start = time.perf_counter()
+        body = b"".join([
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"company_id\"\r\n\r\n{company}\r\n".encode(),
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{os.path.basename(pdf_path)}\"\r\n"
+            "Content-Type: application/pdf\r\n\r\n".encode(),
+            content,
+            f"\r\n--{boundary}--\r\n".encode(),
+        ])
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}", **self.auth(user)}
+        status, response = self.request("POST", "/upload-pdf", body, headers)
+        if status == 202:
+            with self.pending_lock:
+                self.pending[json.loads(response)["job_id"]] = (user, start)
+        return status
+
+    def watch_jobs(self, stop, timeout, interval=0.2):
+        # records ("ingest", status, upload-to-done seconds) per job until stop is set and every
+        # job has finished, or timeout seconds after that; unfinished jobs count as status 0
+        deadline = None
+        while True:
+            if stop.is_set() and deadline is None:
+                deadline = time.monotonic() + timeout
+            with self.pending_lock:
+                pending = list(self.pending.items())
+            if not pending and stop.is_set():
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                self.ingest_samples.extend(("ingest", 0, time.perf_counter() - start) for _, (_, start) in pending)
+                return
+            for job_id, (user, start) in pending:
+                status, body = self.request("GET", f"/ingest/jobs/{job_id}", headers=self.auth(user))
+                job = json.loads(body) if status == 200 else {}
+                if status != 200 or job["status"] in ("done", "failed"):
+                    self.ingest_samples.append(
+                        ("ingest", 200 if job.get("status") == "done" else 500, time.perf_counter() - start)
+                    )
+                    with self.pending_lock:
+                        del self.pending[job_id]
+            time.sleep(interval)
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if float(weight or 1) > 0:
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def drive(client, mix, concurrency, duration, seed=0):
+    ops, weights = list(mix), list(mix.values())
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(n):
+        rng = random.Random(seed + n)
+        local = []
+        while time.monotonic() < deadline:
+            op = rng.choices(ops, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = client.run(op, rng)
+            except OSError:
+                status = 0
+            local.append((op, status, time.perf_counter() - start))
+        with lock:
+            samples.extend(local)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return samples, time.monotonic() - start
+
+
+def summarize(samples, elapsed):
+    routes = {}
+    for op, status, latency in samples:
+        routes.setdefault(op, {"latencies": [], "statuses": {}})
+        routes[op]["latencies"].append(latency)
+        routes[op]["statuses"][str(status)] = routes[op]["statuses"].get(str(status), 0) + 1
+    summary = {}
+    for op, data in sorted(routes.items()):
+        lat = data["latencies"]
+        ok = sum(n for status, n in data["statuses"].items() if status.startswith("2") or status == "304")
+        summary[op] = {
+            "requests": len(lat),
+            "errors": len(lat) - ok,
+            "rps": round(len(lat) / elapsed, 2),
+            "p50_ms": round(percentile(lat, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(lat, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(lat, 0.99) * 1000, 2),
+            "max_ms": round(max(lat) * 1000, 2),
+            "statuses": data["statuses"],
+        }
+    total = len(samples)
+    return {"requests": total, "rps": round(total / elapsed, 2), "elapsed": round(elapsed, 2), "routes": summary}
+
+
+def print_report(result, previous=None):
+    prev_routes = (previous or {}).get("summary", {}).get("routes", {})
+    print(f"\n{'route':<14} {'reqs':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  vs previous p95")
+    for op, r in result["summary"]["routes"].items():
+        delta = ""
+        if op in prev_routes and prev_routes[op]["p95_ms"]:
+            delta = f"{(r['p95_ms'] / prev_routes[op]['p95_ms'] - 1) * 100:+.0f}%"
+        print(f"{op:<14} {r['requests']:>7} {r['errors']:>5} {r['rps']:>8} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}  {delta}")
+    print(f"{'total':<14} {result['summary']['requests']:>7} {'':>5} {result['summary']['rps']:>8}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_previous(config):
+    # the latest stored run with the same workload, so numbers are comparable
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), reverse=True):
+        with open(path) as f:
+            result = json.load(f)
+        if result.get("config") == config:
+            return result
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--companies", type=int, default=200)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="route=weight pairs")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-token-delay", type=float, default=0.01)
+    parser.add_argument("--pdfs", type=int, default=3, help="distinct synthetic PDFs to upload")
+    parser.add_argument("--ingest-workers", type=int, default=2)
+    parser.add_argument("--ingest-timeout", type=float, default=120,
+                        help="seconds to wait for queued uploads to finish after the run")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args)
+
+    mix = parse_mix(args.mix)
+    config = {k: getattr(args, k) for k in ("companies", "years", "concurrency", "duration", "llm_latency",
+                                            "llm_token_delay", "pdfs", "ingest_workers")}
+    config["mix"] = mix
+    with tempfile.TemporaryDirectory() as tmp:
+        from benchmarks.fixtures import make_report_pdf
+        pdfs = [make_report_pdf(os.path.join(tmp, f"report{i}.pdf"), pages=6, table_every=3, seed=i)
+                for i in range(args.pdfs)] if "upload" in mix else []
+
+        # the app starts its ingest workers on the first upload, as in production
+        env = dict(os.environ, AUTH_SECRET="load-test", INGEST_EMBEDDED_WORKERS="1",
+                   INGEST_WORKERS=str(args.ingest_workers), PYTHONUNBUFFERED="1")
+        cmd = [sys.executable, "-m", "benchmarks.load_test", "--serve", "--workdir", tmp,
+               "--companies", str(args.companies), "--years", str(args.years),
+               "--llm-latency", str(args.llm_latency), "--llm-token-delay", str(args.llm_token_delay)]
+        server = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, env=env,
+                                  cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        try:
+            port = None
+            for line in server.stdout:
+                if line.startswith("READY"):
+                    port = int(line.split()[1])
+                    break
+            if port is None:
+                raise SystemExit("server failed to start")
+            # keep draining the server's output so its prints can never fill the pipe and block it
+            threading.Thread(target=server.stdout.read, daemon=True).start()
+            print(f"app on :{port}, {args.companies} companies x {args.years} years, "
+                  f"concurrency {args.concurrency} for {args.duration}s")
+            client = Client(f"http://127.0.0.1:{port}", args, pdfs)
+            stop = threading.Event()
+            watcher = threading.Thread(target=client.watch_jobs, args=(stop, args.ingest_timeout))
+            watcher.start()
+            try:
+                samples, elapsed = drive(client, mix, args.concurrency, args.duration)
+            finally:
+                stop.set()
+                watcher.join()
+            samples += client.ingest_samples
+        finally:
+            server.terminate()
+            server.wait()
+
+    result = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit(), "config": config,
+              "summary": summarize(samples, elapsed)}
+    previous = load_previous(config)
+    print_report(result, previous)
+    if previous:
+        print(f"compared with {previous['time']} ({previous.get('commit')})")
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import db
+import extract_pdf
+from benchmarks.fixtures import make_report_pdf
+
+# peak Python heap while ingesting a large synthetic report; exits non-zero over the budget:
+#   python -m benchmarks.memory --pages 300 --budget-mb 16
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--budget-mb", type=float, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_report_pdf(os.path.join(tmp, "report.pdf"), pages=args.pages, table_every=3)
+        db.pool.db_name = os.path.join(tmp, "bench.db")
+        db.create_tables()
+        db.seed_data()
+
+        # tracemalloc only sees this process, so keep extraction in it
+        extract_pdf.EXTRACT_WORKERS = 1
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = extract_pdf.extract_and_store(pdf_path, None, company_id=1)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db.pool.close_idle()
+
+    peak_mb = peak / 1024 / 1024
+    print(f"{args.pages} pages in {elapsed:.1f}s, {result['rows']} rows, peak heap {peak_mb:.1f} MB "
+          f"(budget {args.budget_mb} MB)")
+    if peak_mb > args.budget_mb:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
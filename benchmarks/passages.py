@@ -0,0 +1,96 @@
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+
+import db
+import passage_index
+
+# passage index build rate, incremental update cost and query latency on a synthetic corpus:
+#   python -m benchmarks.passages --companies 50 --documents 2000 --pages 20 --queries 200
+# documents are spread over the companies; words follow a Zipf-like distribution so a few terms
+# are in nearly every passage and most are rare, like real report text
+
+
+def make_vocabulary(rng, size):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+def make_page(rng, vocabulary, cum_weights, words=300):
+    sentences = []
+    for _ in range(words // 15):
+        sentences.append(" ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=15)).capitalize() + ".")
+    # a blank line every few sentences so pages chunk into paragraphs
+    return "\n\n".join(" ".join(sentences[i:i + 4]) for i in range(0, len(sentences), 4))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return f"p50 {pick(0.5):6.2f} ms   p95 {pick(0.95):6.2f} ms   p99 {pick(0.99):6.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--companies", type=int, default=50)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.pool.db_name = os.path.join(tmp, "passages.db")
+        db.create_tables()
+        conn = db.get_connection()
+        conn.executemany("INSERT INTO companies (name) VALUES (?)", [(f"Company {i}",) for i in range(args.companies)])
+        conn.commit()
+        company_ids = [row[0] for row in conn.execute("SELECT id FROM companies")]
+        conn.close()
+
+        elapsed = 0.0
+        passages = 0
+        for doc in range(args.documents):
+            pages = [(n, make_page(rng, vocabulary, cum_weights)) for n in range(1, args.pages + 1)]
+            start = time.perf_counter()
+            passages += passage_index.index_document(company_ids[doc % len(company_ids)], f"doc-{doc}", pages)
+            elapsed += time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(tmp, f)) for f in os.listdir(tmp))
+        print(f"indexed {args.documents} documents, {passages} passages in {elapsed:.1f}s "
+              f"({passages / elapsed:.0f} passages/s), database {size / 2 ** 20:.0f} MB")
+
+        # one more upload into a full index, and replacing it (a re-upload of the same file)
+        pages = [(n, make_page(rng, vocabulary, cum_weights)) for n in range(1, args.pages + 1)]
+        for label in ("add document", "replace document"):
+            start = time.perf_counter()
+            passage_index.index_document(company_ids[0], "doc-extra", pages)
+            print(f"{label:18} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        # questions mix a couple of common words with rarer ones, as real questions do
+        questions = [
+            " ".join(rng.choices(vocabulary[:50], k=2) + rng.choices(vocabulary[50:5000], k=rng.randint(1, 4)))
+            for _ in range(args.queries)
+        ]
+        for label, scope in (("all companies", lambda: None), ("one company", lambda: [rng.choice(company_ids)])):
+            samples = []
+            found = 0
+            for question in questions:
+                start = time.perf_counter()
+                found += bool(passage_index.search(question, scope()))
+                samples.append(time.perf_counter() - start)
+            print(f"search {label:14} {percentiles(samples)}   {found}/{len(questions)} with hits")
+
+
+if __name__ == "__main__":
+    main()
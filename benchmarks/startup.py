@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# cold import time and RSS of app.py, checked against a budget:
+#   python -m benchmarks.startup [--max-import-ms 400] [--max-rss-mb 80]
+# exits 1 when over budget, so it can run in CI
+
+HEAVY_MODULES = ["matplotlib", "pdfplumber", "pdfminer", "huggingface_hub", "openai"]
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+result = {"import_ms": imported * 1000, "rss_mb": rss_mb(),
+          "heavy_loaded": [m for m in HEAVY if m in sys.modules]}
+client = app.app.test_client()
+start = time.perf_counter()
+client.get("/companies", headers={"Authorization": "Bearer x"})
+result["first_request_ms"] = (time.perf_counter() - start) * 1000
+result["rss_after_request_mb"] = rss_mb()
+print(json.dumps(result))
+"""
+
+
+def measure(repo):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, INFERENCE_BASE_URL="http://127.0.0.1:9", AUTH_SECRET="startup",
+                   INGEST_EMBEDDED_WORKERS="0", PYTHONPATH=repo, PYTHONDONTWRITEBYTECODE="0")
+        # the app creates its database and uploads/ folder in the working directory
+        code = f"HEAVY = {HEAVY_MODULES!r}\n" + PROBE
+        out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=env, capture_output=True, text=True)
+        if out.returncode:
+            raise SystemExit(out.stderr)
+        return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-import-ms", type=float, default=400)
+    parser.add_argument("--max-rss-mb", type=float, default=80)
+    args = parser.parse_args()
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    runs = [measure(repo) for _ in range(args.runs)]
+    best = min(runs, key=lambda r: r["import_ms"])
+    print(f"import app          {best['import_ms']:8.1f} ms (best of {args.runs})")
+    print(f"first /companies    {best['first_request_ms']:8.1f} ms")
+    print(f"rss after import    {best['rss_mb']:8.1f} MB")
+    print(f"rss after request   {best['rss_after_request_mb']:8.1f} MB")
+    print(f"heavy modules       {', '.join(best['heavy_loaded']) or 'none'}")
+
+    failures = []
+    if best["import_ms"] > args.max_import_ms:
+        failures.append(f"import took {best['import_ms']:.0f} ms > {args.max_import_ms:.0f} ms")
+    if best["rss_mb"] > args.max_rss_mb:
+        failures.append(f"RSS {best['rss_mb']:.0f} MB > {args.max_rss_mb:.0f} MB")
+    if best["heavy_loaded"]:
+        failures.append(f"imported at boot: {', '.join(best['heavy_loaded'])}")
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
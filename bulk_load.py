@@ -0,0 +1,237 @@
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import sys
+import time
+from operator import itemgetter
+
+from db import MAX_YEAR, MIN_YEAR, get_connection, bump_data_version, notify_data_change
+from extract_pdf import clean_number
+import metrics
+from rollups import update_rollups
+
+# rows per transaction; one executemany + commit per batch
+BULK_BATCH_SIZE = int(os.environ.get("BULK_BATCH_SIZE", 50_000))
+# only the first few row errors are kept in the result, the rest are just counted
+MAX_REPORTED_ERRORS = 20
+FORMATS = {".csv": "csv", ".txt": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+COLUMNS = ("year", "revenue", "assets", "liabilities", "profit")
+COMPANY_COLUMNS = ("company", "company_name", "name")
+
+UPSERT = """
+    INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(company_id, year)
+    DO UPDATE SET revenue=excluded.revenue,
+                  assets=excluded.assets,
+                  liabilities=excluded.liabilities,
+                  profit=excluded.profit
+"""
+
+
+class CompanyMap:
+    # company name (case-insensitive) -> id, loaded once per load instead of a lookup per row
+
+    def __init__(self, conn, create=False):
+        self.conn = conn
+        self.create = create
+        self.by_name = {}
+        self.ids = set()
+        for cid, name in conn.execute("SELECT id, name FROM companies"):
+            self.by_name[name.strip().casefold()] = cid
+            self.ids.add(cid)
+        self.created = 0
+
+    def resolve(self, name=None, company_id=None):
+        if company_id not in (None, ""):
+            cid = int(company_id)
+            if cid not in self.ids:
+                raise ValueError(f"unknown company_id {cid}")
+            return cid
+        if not name:
+            raise ValueError("missing company")
+        key = name.strip().casefold()
+        cid = self.by_name.get(key)
+        if cid is None:
+            if not self.create:
+                raise ValueError(f"unknown company {name.strip()!r}")
+            cur = self.conn.execute("INSERT INTO companies (name) VALUES (?)", (name.strip(),))
+            cid = self.by_name[key] = cur.lastrowid
+            self.ids.add(cid)
+            self.created += 1
+        return cid
+
+
+def to_number(value):
+    # float() covers clean exports; clean_number handles "1,200", "(300)", "₹ 50" and the like.
+    # nan and inf (also JSON's NaN/Infinity) count as invalid rather than landing as NULL
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        value = clean_number(value)
+        if value is None:
+            return None
+    return value if math.isfinite(value) else None
+
+
+def detect_format(filename):
+    fmt = FORMATS.get(os.path.splitext(filename or "")[1].lower())
+    if not fmt:
+        raise ValueError(f"Unsupported file type; expected one of {', '.join(sorted(FORMATS))}")
+    return fmt
+
+
+def iter_csv(stream):
+    # excel exports often use ';' and a BOM; sniff the delimiter from the first line
+    header_line = stream.readline()
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    header = [h.strip().lower() for h in next(csv.reader([header_line], dialect))]
+    for row in csv.reader(stream, dialect):
+        if row:
+            yield dict(zip(header, row))
+
+
+def iter_jsonl(stream):
+    # a malformed line comes through as None so it is reported like any other bad row
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield {k.strip().lower(): v for k, v in record.items()} if isinstance(record, dict) else None
+
+
+def parse_record(record, companies, default_company_id=None):
+    if record is None:
+        raise ValueError("not a JSON object")
+    year = int(to_number(record.get("year")) or 0)
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        raise ValueError(f"bad year {record.get('year')!r}")
+    values = [to_number(record.get(col)) for col in COLUMNS[1:]]
+    if None in values:
+        missing = [col for col, v in zip(COLUMNS[1:], values) if v is None]
+        raise ValueError(f"missing or invalid {', '.join(missing)}")
+    # the company comes last, so a row that fails validation never creates one
+    name = None
+    for column in COMPANY_COLUMNS:
+        if record.get(column):
+            name = record[column]
+            break
+    company_id = record.get("company_id") or (None if name else default_company_id)
+    cid = companies.resolve(name, company_id)
+    return (cid, year, *values)
+
+
+@metrics.timed("bulk_load")
+def load_stream(stream, fmt, user=None, company_id=None, create_companies=False, batch_size=None):
+    # streams the file, writing each batch in its own transaction. user limits which companies
+    # rows may target (None for the CLI); company_id fills in rows that don't name a company
+    batch_size = batch_size or BULK_BATCH_SIZE
+    restrict = user["company_id"] if user and user["role"] != "groupadmin" else None
+    if restrict is not None:
+        company_id = restrict
+    result = {"rows_read": 0, "rows_written": 0, "rows_skipped": 0, "batches": 0, "errors": []}
+    start = time.perf_counter()
+    conn = get_connection()
+    try:
+        companies = CompanyMap(conn, create=create_companies and restrict is None)
+        records = iter_csv(stream) if fmt == "csv" else iter_jsonl(stream)
+        batch = []
+        for line, record in enumerate(records, 2 if fmt == "csv" else 1):
+            result["rows_read"] += 1
+            try:
+                row = parse_record(record, companies, company_id)
+                if restrict is not None and row[0] != restrict:
+                    raise ValueError("access denied for this company")
+            except (ValueError, TypeError, AttributeError, OverflowError) as e:
+                result["rows_skipped"] += 1
+                if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                    result["errors"].append(f"line {line}: {e}")
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                write_batch(conn, batch, result)
+                batch = []
+        if batch:
+            write_batch(conn, batch, result)
+        result["companies_created"] = companies.created
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        conn.rollback()
+        result["error"] = f"Stopped after {result['rows_read']} rows: {e}"
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+    result["seconds"] = round(elapsed, 3)
+    result["rows_per_sec"] = int(result["rows_written"] / elapsed) if elapsed else 0
+    return result
+
+
+def write_batch(conn, batch, result):
+    # in (company_id, year) order the index inserts land next to each other instead of all
+    # over the b-tree; the sort is stable, so a repeated row still wins in file order
+    batch.sort(key=itemgetter(0, 1))
+    cur = conn.cursor()
+    cur.executemany(UPSERT, batch)
+    update_rollups(cur, [(row[0], row[1]) for row in batch])
+    company_ids = {row[0] for row in batch}
+    bump_data_version(cur, company_ids)
+    conn.commit()
+    notify_data_change(company_ids)
+    result["rows_written"] += len(batch)
+    result["batches"] += 1
+
+
+def load_file(path, **kwargs):
+    fmt = detect_format(path)
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return load_stream(f, fmt, **kwargs)
+
+
+def load_upload(file, **kwargs):
+    fmt = detect_format(file.filename)
+    stream = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+    return load_stream(stream, fmt, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load balance sheet rows from CSV or JSONL")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--company-id", type=int, help="company for rows that don't name one")
+    parser.add_argument("--create-companies", action="store_true", help="add companies that don't exist yet")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    from db import create_tables
+    create_tables()
+    failed = False
+    for path in args.files:
+        try:
+            result = load_file(path, company_id=args.company_id, create_companies=args.create_companies,
+                               batch_size=args.batch_size)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}")
+            failed = True
+            continue
+        print(f"{path}: {result['rows_written']} rows written, {result['rows_skipped']} skipped "
+              f"in {result['seconds']}s ({result['rows_per_sec']} rows/s)")
+        for error in result["errors"]:
+            print(f"  {error}")
+        if "error" in result:
+            print(f"  {result['error']}")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
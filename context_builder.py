@@ -0,0 +1,236 @@
+import os
+import re
+import threading
+
+import numpy as np
+
+import analytics
+import passage_index
+import rollups
+from db import get_connection
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+# report excerpts from the passage index get their own budget on top of the table's
+PASSAGE_TOKEN_BUDGET = int(os.environ.get("PASSAGE_TOKEN_BUDGET", 600))
+CHARS_PER_TOKEN = 4
+COLUMNS = "year | revenue | assets | liabilities | profit | equity | margin% | debt/assets | rev yoy% | profit yoy%"
+# words that appear in many company names and say nothing about which one is meant
+GENERIC_WORDS = {"group", "limited", "ltd", "industries", "platforms", "company", "holdings", "retail"}
+
+_stats_lock = threading.Lock()
+_totals = {"requests": 0, "rows_in": 0, "rows_used": 0, "est_tokens": 0, "truncated": 0, "passages": 0}
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def fetch_rows(user, company_id=None):
+    conn = get_connection()
+    cur = conn.cursor()
+    query = (
+        "SELECT companies.id, companies.name, year, revenue, assets, liabilities, profit "
+        "FROM balance_sheets JOIN companies ON balance_sheets.company_id = companies.id"
+    )
+    if user["role"] != "groupadmin":
+        cur.execute(query + " WHERE company_id=? ORDER BY year ASC", (user["company_id"],))
+    elif company_id:
+        cur.execute(query + " WHERE company_id=? ORDER BY year ASC", (company_id,))
+    else:
+        cur.execute(query + " ORDER BY companies.name, year ASC")
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def fetch_rows_many(user, company_ids):
+    # one query for a whole batch of questions; None in company_ids means the full portfolio
+    if user["role"] != "groupadmin":
+        return fetch_rows(user)
+    ids = sorted({int(cid) for cid in company_ids if cid})
+    if not ids or any(not cid for cid in company_ids):
+        return fetch_rows(user)
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT companies.id, companies.name, year, revenue, assets, liabilities, profit "
+        "FROM balance_sheets JOIN companies ON balance_sheets.company_id = companies.id "
+        f"WHERE company_id IN ({','.join('?' * len(ids))}) ORDER BY companies.name, year ASC",
+        ids,
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def fmt(value):
+    if value is None or value != value:
+        return "-"
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.2f}"
+
+
+LINE_METRICS = (
+    "revenue", "assets", "liabilities", "profit",
+    "equity", "profit_margin", "debt_to_asset", "revenue_yoy", "profit_yoy",
+)
+
+
+def derive(panel, metrics, i):
+    # one company's row of the panel -> list of (year, line) for the years it has data
+    lines = []
+    for col in np.flatnonzero(analytics.has_data(panel)[i]):
+        cells = [int(panel.years[col])] + [metrics[name][i, col] for name in LINE_METRICS]
+        lines.append((int(panel.years[col]), " | ".join(fmt(c) for c in cells)))
+    return lines
+
+
+def relevant_companies(question, names):
+    q = question.lower()
+    exact = [n for n in names if n.lower() in q]
+    if exact:
+        return exact
+    words = set(re.findall(r"[a-z]+", q))
+    partial = [
+        n for n in names
+        if any(w in words for w in re.findall(r"[a-z]+", n.lower()) if len(w) >= 3 and w not in GENERIC_WORDS)
+    ]
+    return partial or names
+
+
+def relevant_years(question):
+    # a year the question names plus the one before it, so growth can still be shown
+    years = set()
+    for y in re.findall(r"\b(?:19|20)\d{2}\b", question):
+        years.update({int(y), int(y) - 1})
+    return years
+
+
+def relevant_groups(question):
+    q = question.lower()
+    return [g for g in rollups.list_groups() if g.lower() in q]
+
+
+def group_blocks(groups, years):
+    # group totals rendered like a company block, straight from group_rollups
+    rows = rollups.group_rows(groups)
+    ids = {name: i for i, name in enumerate(groups)}
+    names = {i: f"{name} (group total)" for name, i in ids.items()}
+    panel = analytics.build_panel([(ids[g], year, *sums) for g, year, _companies, *sums in rows], names)
+    metrics = analytics.all_metrics(panel)
+    blocks = []
+    for name, i in sorted(ids.items()):
+        row = panel.index_of(i)
+        if row is None:
+            continue
+        lines = derive(panel, metrics, row)
+        if years:
+            lines = [line for line in lines if line[0] in years] or lines
+        blocks.append((names[i], lines))
+    return blocks, len(rows)
+
+
+def render(blocks, budget_chars):
+    # blocks: list of (company, [(year, line)]). drop the oldest years first, then whole companies,
+    # leaving a note of what was left out so the model knows the table is partial
+    blocks = [[name, list(lines), 0] for name, lines in blocks]
+    omitted = 0
+    truncated = False
+
+    def text():
+        parts = [COLUMNS]
+        for name, lines, dropped in blocks:
+            parts.append(f"# {name}" + (f" ({dropped} earlier years omitted)" if dropped else ""))
+            parts.extend(line for _, line in lines)
+        if omitted:
+            parts.append(f"({omitted} more companies omitted)")
+        return "\n".join(parts)
+
+    out = text()
+    while len(out) > budget_chars:
+        truncated = True
+        longest = max(blocks, key=lambda b: len(b[1]))
+        if len(longest[1]) > 1:
+            longest[1].pop(0)
+            longest[2] += 1
+        elif len(blocks) > 1:
+            blocks.pop()
+            omitted += 1
+        else:
+            out = out[:budget_chars]
+            break
+        out = text()
+    return out, sum(len(lines) for _, lines, _ in blocks), truncated
+
+
+def build_context(user, question, company_id=None, budget=None, rows=None):
+    # rows, when given, must already be limited to what the user may see (see fetch_rows_many)
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    years = relevant_years(question)
+
+    # a groupadmin asking about a whole group gets its precomputed totals, not every member's rows
+    groups = relevant_groups(question) if user["role"] == "groupadmin" and not company_id else []
+    blocks = []
+    # companies whose report text may be searched; None is the whole portfolio
+    if user["role"] != "groupadmin":
+        scope_ids = [user["company_id"]]
+    else:
+        scope_ids = [int(company_id)] if company_id else None
+    if groups:
+        blocks, rows_in = group_blocks(groups, years)
+        names = [name for name, _ in blocks]
+    if not blocks:
+        if rows is None:
+            rows = fetch_rows(user, company_id)
+        elif company_id and user["role"] == "groupadmin":
+            rows = [row for row in rows if row[0] == int(company_id)]
+
+        names = {cid: name for cid, name, *_ in rows}
+        panel = analytics.build_panel([(cid, *values) for cid, _, *values in rows], names)
+        metrics = analytics.all_metrics(panel)
+        row_of = {name: panel.index_of(cid) for cid, name in names.items()}
+
+        selected = sorted(relevant_companies(question, list(row_of)))
+        if scope_ids is None and len(selected) < len(row_of):
+            # the question names companies: search their reports only
+            scope_ids = [cid for cid, name in names.items() if name in selected]
+        names = selected
+        rows_in = len(rows)
+        for name in names:
+            lines = derive(panel, metrics, row_of[name])
+            if years:
+                lines = [line for line in lines if line[0] in years] or lines
+            blocks.append((name, lines))
+
+    context, rows_used, truncated = render(blocks, budget * CHARS_PER_TOKEN)
+    passages = 0
+    if passage_index.PASSAGES_ENABLED and PASSAGE_TOKEN_BUDGET:
+        hits = passage_index.search(question, scope_ids)
+        excerpts, passages = passage_index.render(hits, PASSAGE_TOKEN_BUDGET * CHARS_PER_TOKEN)
+        if excerpts:
+            context = f"{context}\n\n{excerpts}"
+    stats = {
+        "rows_in": rows_in,
+        "rows_used": rows_used,
+        "companies": len(names),
+        "passages": passages,
+        "est_tokens": estimate_tokens(context),
+        "truncated": truncated,
+    }
+    with _stats_lock:
+        _totals["requests"] += 1
+        _totals["rows_in"] += stats["rows_in"]
+        _totals["rows_used"] += rows_used
+        _totals["est_tokens"] += stats["est_tokens"]
+        _totals["truncated"] += int(truncated)
+        _totals["passages"] += passages
+    return context, stats
+
+
+def context_stats():
+    with _stats_lock:
+        totals = dict(_totals)
+    if totals["requests"]:
+        totals["avg_tokens"] = round(totals["est_tokens"] / totals["requests"], 1)
+    return totals
@@ -1,10 +1,171 @@
 
+import os
 import sqlite3
+import threading
+
+from auth import hash_password
 
 DB_NAME = "balance_gpt.db"
 
+# applied to every new connection; WAL lets readers run while an upload is writing
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", 256 * 1024 * 1024),
+    ("cache_size", -16000),
+    ("busy_timeout", 5000),
+]
+STATEMENT_CACHE_SIZE = 256
+# plausible balance sheet years; anything outside is a parse error, e.g. "FY2022-23" read as 202223
+MIN_YEAR, MAX_YEAR = 1800, 2200
+POOL_MAX_IDLE = int(os.environ.get("DB_POOL_MAX_IDLE", 4))
+
+
+class PooledConnection(sqlite3.Connection):
+    # close() hands the connection back to its pool instead of closing the file
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def _close(self):
+        sqlite3.Connection.close(self)
+
+
+class ConnectionPool:
+    # sqlite connections can't cross threads, so idle connections are kept per thread.
+    # a pid change means we are in a freshly forked gunicorn worker and start over.
+
+    def __init__(self, db_name=DB_NAME, max_idle=POOL_MAX_IDLE):
+        self.db_name = db_name
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._counters = {"opened": 0, "reused": 0, "released": 0, "closed": 0, "in_use": 0}
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def _idle(self):
+        if self._pid != os.getpid():
+            self._reset()
+        idle = getattr(self._local, "idle", None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            factory=PooledConnection,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for name, value in PRAGMAS:
+            conn.execute(f"PRAGMA {name}={value}")
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        idle = self._idle()
+        if idle:
+            conn = idle.pop()
+            self._count("reused")
+        else:
+            conn = self._open()
+            self._count("opened")
+        self._count("in_use")
+        return conn
+
+    def release(self, conn):
+        self._count("in_use", -1)
+        if conn.in_transaction:
+            conn.rollback()
+        idle = self._idle()
+        if len(idle) < self.max_idle:
+            idle.append(conn)
+            self._count("released")
+        else:
+            conn._close()
+            self._count("closed")
+
+    def close_idle(self):
+        idle = self._idle()
+        while idle:
+            idle.pop()._close()
+            self._count("closed")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["idle"] = len(self._idle())
+        stats["max_idle"] = self.max_idle
+        stats["pid"] = self._pid
+        return stats
+
+
+pool = ConnectionPool()
+
+
 def get_connection():
-    return sqlite3.connect(DB_NAME)
+    return pool.acquire()
+
+
+def pool_stats():
+    return pool.stats()
+
+
+# callbacks run after balance sheet writes commit, with the affected company ids
+data_change_listeners = []
+
+
+def bump_data_version(cur, company_ids):
+    # call inside the write transaction so readers never see new rows with an old version
+    scopes = [f"company:{cid}" for cid in sorted(set(company_ids))] + ["all", "generation"]
+    cur.executemany(
+        "INSERT INTO data_versions (scope, version) VALUES (?, 1) "
+        "ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+        [(scope,) for scope in scopes],
+    )
+
+
+def bump_generation(cur):
+    # for writes that don't touch balance sheets (users, companies) but still stale read_cache
+    cur.execute(
+        "INSERT INTO data_versions (scope, version) VALUES ('generation', 1) "
+        "ON CONFLICT(scope) DO UPDATE SET version = version + 1"
+    )
+
+
+def bump_passage_version(cur, company_ids):
+    # report text only feeds /ask, so passage writes get their own scopes and leave the
+    # balance sheet versions (and read_cache, charts) alone
+    scopes = [f"passages:{cid}" for cid in sorted(set(company_ids))] + ["passages:all"]
+    cur.executemany(
+        "INSERT INTO data_versions (scope, version) VALUES (?, 1) "
+        "ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+        [(scope,) for scope in scopes],
+    )
+
+
+def notify_data_change(company_ids):
+    company_ids = sorted(set(company_ids))
+    for listener in data_change_listeners:
+        listener(company_ids)
+
+
+def get_data_version(scope):
+    conn = get_connection()
+    row = conn.execute("SELECT version FROM data_versions WHERE scope=?", (scope,)).fetchone()
+    conn.close()
+    return row[0] if row else 0
 
 # get companies a user can access
 def list_companies(user):
@@ -55,45 +216,9 @@ def get_balance_sheet(user, company_id=None):
 
 
 def create_tables():
-    conn = get_connection()
-    cur = conn.cursor()
-
-   
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS companies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE NOT NULL,
-            parent_group TEXT
-        )
-    """)
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL CHECK(role IN ('analyst','ceo','GroupAdmin')),
-            company_id INTEGER,
-            FOREIGN KEY(company_id) REFERENCES companies(id)
-        )
-    """)
-
-
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS balance_sheets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company_id INTEGER NOT NULL,
-            year INTEGER NOT NULL,
-            revenue REAL,
-            assets REAL,
-            liabilities REAL,
-            profit REAL,
-            FOREIGN KEY(company_id) REFERENCES companies(id)
-        )
-    """)
-
-    conn.commit()
-    conn.close()
+    # the schema lives in migrations.py; this brings the database up to the latest version
+    from migrations import migrate
+    migrate()
 
 
 def seed_data():
@@ -120,9 +245,11 @@ def seed_data():
         ("ramesh", "pass123", "ceo", company_map["Jio Platforms"]),
         ("ambani", "ambani123", "GroupAdmin", None),
     ]
+    cur.execute("SELECT username FROM users")
+    existing = {row[0] for row in cur.fetchall()}
     cur.executemany(
         "INSERT OR IGNORE INTO users (username,password,role,company_id) VALUES (?,?,?,?)",
-        users
+        [(name, hash_password(password), role, cid) for name, password, role, cid in users if name not in existing]
     )
 
 
@@ -138,9 +265,13 @@ def seed_data():
         "INSERT OR IGNORE INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit) VALUES (?,?,?,?,?,?)",
         balances
     )
+    from rollups import update_rollups
+    update_rollups(cur, [(b[0], b[1]) for b in balances])
+    bump_data_version(cur, company_map.values())
 
     conn.commit()
     conn.close()
+    notify_data_change(company_map.values())
 
 def add_balance_sheet_data(company_name, year, revenue, assets, liabilities, profit):
     conn = get_connection()
@@ -163,9 +294,13 @@ def add_balance_sheet_data(company_name, year, revenue, assets, liabilities, pro
         DO UPDATE SET revenue=excluded.revenue, assets=excluded.assets, 
                       liabilities=excluded.liabilities, profit=excluded.profit
     """, (company_id, year, revenue, assets, liabilities, profit))
+    from rollups import update_rollups
+    update_rollups(cur, [(company_id, year)])
+    bump_data_version(cur, [company_id])
 
     conn.commit()
     conn.close()
+    notify_data_change([company_id])
     print(f"✅ Balance sheet data added/updated for {company_name} ({year})")
 
 
@@ -1,10 +1,18 @@
 import os
 import re
 import sqlite3
-import pdfplumber
-from db import get_connection
+import time
+from concurrent.futures import ProcessPoolExecutor
+import db
+from db import MAX_YEAR, MIN_YEAR, get_connection, bump_data_version, notify_data_change
+import metrics
+import passage_index
+from rollups import update_rollups
 
+# pdfplumber/pdfminer are imported inside the functions that read PDFs, so the web app and the
+# bulk loader can import this module without paying for them at boot
 
+@metrics.timed("add_balance_sheet_data_bulk")
 def add_balance_sheet_data_bulk(records):
    
     if not records:
@@ -12,11 +20,6 @@ def add_balance_sheet_data_bulk(records):
     conn = get_connection()
     cur = conn.cursor()
 
-    cur.execute("""
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_company_year
-        ON balance_sheets(company_id, year)
-    """)
-
     cur.executemany("""
         INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit)
         VALUES (?, ?, ?, ?, ?, ?)
@@ -26,9 +29,13 @@ def add_balance_sheet_data_bulk(records):
                       liabilities=excluded.liabilities,
                       profit=excluded.profit
     """, records)
+    update_rollups(cur, [(r[0], r[1]) for r in records])
+    company_ids = [r[0] for r in records]
+    bump_data_version(cur, company_ids)
 
     conn.commit()
     conn.close()
+    notify_data_change(company_ids)
 
 
 def list_companies():
@@ -76,40 +83,328 @@ def clean_number(val):
         return None
 
 
-def extract_tables(pdf_path):
-   
+class CompanyResolutionError(ValueError):
+    pass
+
+
+# company auto-detection reads the text of the first few pages (cover, letterhead, headers)
+# and counts mentions of every known company name
+DETECT_PAGES = int(os.environ.get("COMPANY_DETECT_PAGES", 3))
+NAME_SUFFIXES = {"ltd", "limited", "pvt", "private", "inc", "plc", "llp", "corp", "co"}
+_name_index = {"generation": None, "names": {}, "longest": 0}
+
+
+def name_tokens(text):
+    return re.findall(r"[a-z0-9&]+", text.lower())
+
+
+def company_key(name):
+    tokens = name_tokens(name)
+    while len(tokens) > 1 and tokens[-1] in NAME_SUFFIXES:
+        tokens.pop()
+    return tuple(tokens)
+
+
+def company_name_index():
+    # normalized name tokens -> company id, rebuilt only when a write bumps the generation stamp
+    generation = db.get_data_version("generation")
+    if _name_index["generation"] != generation:
+        names = {company_key(name): cid for cid, name in list_companies() if company_key(name)}
+        _name_index.update(generation=generation, names=names, longest=max(map(len, names), default=0))
+    return _name_index
+
+
+def pdf_text(pdf_path, pages=DETECT_PAGES):
+    import pdfplumber
+    with pdfplumber.open(pdf_path, pages=list(range(1, pages + 1))) as pdf:
+        texts = []
+        for page in pdf.pages:
+            texts.append(page.extract_text() or "")
+            release_page(page)
+    return " ".join(texts)
+
+
+def match_company(text, user=None):
+    # returns (company_id, mentions) for the company named most often in text; the longest
+    # name wins at each position, so "Reliance Retail" isn't also counted as "Reliance"
+    index = company_name_index()
+    names, longest = index["names"], index["longest"]
+    tokens = name_tokens(text)
+    mentions = {}
+    i = 0
+    while i < len(tokens):
+        step = 1
+        for n in range(min(longest, len(tokens) - i), 0, -1):
+            cid = names.get(tuple(tokens[i:i + n]))
+            if cid is not None:
+                mentions[cid] = mentions.get(cid, 0) + 1
+                step = n
+                break
+        i += step
+    if user and user["role"] != "groupadmin":
+        mentions = {cid: count for cid, count in mentions.items() if cid == user["company_id"]}
+    if not mentions:
+        raise CompanyResolutionError("No known company name found in the PDF; pass company_id")
+    ranked = sorted(mentions.items(), key=lambda item: -item[1])
+    if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+        raise CompanyResolutionError("PDF mentions several companies equally often; pass company_id")
+    return ranked[0]
+
+
+def detect_company(pdf_path, user=None, pages=DETECT_PAGES):
+    return match_company(pdf_text(pdf_path, pages), user)
+
+
+def detect_in_text(text):
+    # what detect_company would find for any user, or None
+    try:
+        company_id, mentions = match_company(text)
+    except CompanyResolutionError:
+        return None
+    return {"company_id": company_id, "mentions": mentions}
+
+
+# page-level parallelism for extract_tables; small documents aren't worth the process start-up
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+PARALLEL_MIN_PAGES = int(os.environ.get("PARALLEL_MIN_PAGES", 16))
+# extracted rows are written to balance_sheets in batches of this size
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 500))
+
+
+# cheap text scan before extract_tables: a page has to mention most of the balance sheet
+# columns to be worth a full table extraction. if nothing qualifies, fall back to every page
+REQUIRED_COLUMNS = ["year", "revenue", "assets", "liabilities", "profit"]
+PREFILTER = os.environ.get("PDF_PREFILTER", "1") == "1"
+PREFILTER_MIN_SCORE = int(os.environ.get("PREFILTER_MIN_SCORE", 4))
+PREFILTER_FALLBACK = os.environ.get("PREFILTER_FALLBACK", "1") == "1"
+
+
+def is_candidate_table(table):
+    return table and len(table) > 2 and len(table[0]) >= 5
+
+
+# string literals inside the page's content stream, e.g. the (Re) and (venue) in [(Re) -15 (venue)] TJ
+PDF_LITERAL = re.compile(rb"\(((?:\\.|[^\\)])*)\)")
+# /Name Do paints an XObject; a form XObject carries its own content stream the literals don't include
+XOBJECT_DO = re.compile(rb"/[^\s/\[\]()<>{}%]+\s+Do\b")
+
+
+def content_stream(page):
+    from pdfminer.pdftypes import resolve1
+    try:
+        return b"".join(resolve1(stream).get_data() for stream in (page.page_obj.contents or []))
+    except Exception:
+        return None
+
+
+def page_text_fast(data):
+    # joins the literal strings of the raw content stream without running the pdfminer
+    # interpreter; returns None when the text isn't stored that way (hex / CID-encoded fonts)
+    literals = PDF_LITERAL.findall(data or b"")
+    if not literals:
+        return None
+    return b"".join(literals).decode("latin-1").lower()
+
+
+# text-showing operators: (..) Tj, (..) ' and (..) " draw one string, [..] TJ a kerned array of them
+TEXT_OPERATOR = re.compile(rb"\[((?:\\.|[^\\\]])*)\]\s*TJ|\(((?:\\.|[^\\)])*)\)\s*(?:Tj|'|\")")
+TJ_PART = re.compile(rb"\(((?:\\.|[^\\)])*)\)|(-?\d+(?:\.\d+)?)")
+PDF_ESCAPE = re.compile(rb"\\([nrtbf()\\]|[0-7]{1,3})")
+ESCAPED = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+# a gap wider than this inside a TJ array (thousandths of the font size) is a word space
+TJ_WORD_GAP = 250
+
+
+def unescape(literal):
+    def replace(match):
+        code = match.group(1)
+        return bytes([int(code, 8) & 0xFF]) if code[:1].isdigit() else ESCAPED.get(code, code)
+    return PDF_ESCAPE.sub(replace, literal)
+
+
+def shown_text(data):
+    shown = []
+    for array, single in TEXT_OPERATOR.findall(data):
+        if single:
+            shown.append(unescape(single))
+            continue
+        pieces = []
+        for literal, gap in TJ_PART.findall(array):
+            if gap and float(gap) < -TJ_WORD_GAP:
+                pieces.append(b" ")
+            elif literal:
+                pieces.append(unescape(literal))
+        shown.append(b"".join(pieces))
+    return b" ".join(shown).decode("latin-1")
+
+
+def reads_like_text(text):
+    # fonts with custom encodings turn the content-stream literals into junk; real text has
+    # enough words and a fair share of stopwords among them
+    words = re.findall(r"[a-z]+", text.lower())
+    return len(words) >= 20 and sum(w in passage_index.STOPWORDS for w in words) >= 0.15 * len(words)
+
+
+def page_text(page):
+    # text for the passage index. reading the text operators straight from the content stream
+    # is ~100x cheaper than pdfminer's layout pass, but only trusted when it reads like text;
+    # otherwise use extract_text
+    text = shown_text(content_stream(page) or b"")
+    if reads_like_text(text):
+        return text
+    return page.extract_text() or ""
+
+
+def page_score(page):
+    # the literal text can only rule a page out when it is readable and there is no form
+    # XObject whose text it can't see; enough column names in it always count, since junk
+    # from a custom encoding won't spell them. anything else is scored from page.chars, which
+    # pdfminer decodes through the fonts and XObjects
+    data = content_stream(page)
+    text = page_text_fast(data)
+    if text is not None:
+        score = sum(1 for word in REQUIRED_COLUMNS if word in text)
+        if score >= PREFILTER_MIN_SCORE:
+            return score
+        if not XOBJECT_DO.search(data) and reads_like_text(shown_text(data)):
+            return score
+    # raw chars without layout analysis; column names still come out as contiguous letters
+    text = "".join(c["text"] for c in page.chars).lower()
+    return sum(1 for word in REQUIRED_COLUMNS if word in text)
+
+
+def scan_page(page, prefilter):
+    # returns the page's candidate tables, or None if the pre-filter skipped it
+    if prefilter and page_score(page) < PREFILTER_MIN_SCORE:
+        return None
+    return [t for t in page.extract_tables() if is_candidate_table(t)]
+
+
+def release_page(page):
+    # drop pdfplumber's cached chars/objects for a page we're done with
+    page.close()
+    # pdfminer also keeps the decoded content streams on the page and in the document cache.
+    # those are private (see the pdfminer.six pin in requirements.txt); if they have moved,
+    # leave them to the garbage collector rather than fail the page
+    page_obj = getattr(page, "page_obj", None)
+    cached = getattr(getattr(getattr(page, "pdf", None), "doc", None), "_cached_objs", None)
+    if page_obj is None or not isinstance(cached, dict):
+        return
+    for stream in getattr(page_obj, "contents", None) or []:
+        cached.pop(getattr(stream, "objid", None), None)
+    if hasattr(page_obj, "contents"):
+        page_obj.contents = []
+
+
+def extract_page_range(pdf_path, start, stop, prefilter, with_text=False):
+    # runs in a pool process; pages are 0-based, stop exclusive. the per-page parse times go
+    # back with the tables, since spans recorded here would stay in the pool process
     tables = []
+    texts = []
+    timings = []
+    skipped = 0
+    import pdfplumber
+    with pdfplumber.open(pdf_path, pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            started = time.perf_counter()
+            found = scan_page(page, prefilter)
+            if with_text:
+                texts.append((page.page_number, page_text(page)))
+            timings.append(time.perf_counter() - started)
+            release_page(page)
+            if found is None:
+                skipped += 1
+            else:
+                tables.extend(found)
+    return start, stop, tables, skipped, texts, timings
+
+
+def iter_page_ranges(pdf_path, total, workers, prefilter, with_text=False):
+    # a couple of shards per worker so one slow range doesn't leave the others idle.
+    # map() hands results back in page order, holding at most the shards that finished early
+    chunk = max(1, -(-total // (workers * 2)))
+    starts = list(range(0, total, chunk))
+    stops = [min(start + chunk, total) for start in starts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(
+            extract_page_range, [pdf_path] * len(starts), starts, stops, [prefilter] * len(starts),
+            [with_text] * len(starts),
+        )
+
+
+def iter_tables(pdf_path, on_page=None, strict=False, workers=None, prefilter=None, stats=None, on_text=None):
+    # yields candidate tables in page order, one page at a time.
+    # on_page(pages_done, pages_total) is called as pages finish; strict re-raises read errors.
+    # on_text(page_number, text) gets the text of every page, skipped or not.
+    # pass a dict as stats to get page counts back once the generator is exhausted
+    workers = EXTRACT_WORKERS if workers is None else workers
+    prefilter = PREFILTER if prefilter is None else prefilter
+    stats = {} if stats is None else stats
+    found = 0
+    skipped = 0
+    import pdfplumber
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                extracted = page.extract_tables()
-                for table in extracted:
-                    
-                    if table and len(table) > 2 and len(table[0]) >= 5:
-                        tables.append(table)
+            total = len(pdf.pages)
+            parallel = workers > 1 and total >= PARALLEL_MIN_PAGES
+            if not parallel:
+                for n, page in enumerate(pdf.pages, 1):
+                    started = time.perf_counter()
+                    extracted = scan_page(page, prefilter)
+                    text = page_text(page) if on_text else None
+                    metrics.observe_span("extract_page", time.perf_counter() - started)
+                    if on_text:
+                        on_text(n, text)
+                    release_page(page)
+                    if extracted is None:
+                        skipped += 1
+                    else:
+                        found += len(extracted)
+                        yield from extracted
+                    if on_page:
+                        on_page(n, total)
+        if parallel:
+            done = 0
+            ranges = iter_page_ranges(pdf_path, total, workers, prefilter, with_text=on_text is not None)
+            for start, stop, tables, range_skipped, texts, timings in ranges:
+                for seconds in timings:
+                    metrics.observe_span("extract_page", seconds)
+                if on_text:
+                    for page_number, text in texts:
+                        on_text(page_number, text)
+                skipped += range_skipped
+                found += len(tables)
+                done += stop - start
+                yield from tables
+                if on_page:
+                    on_page(done, total)
     except Exception as e:
         print(f"Error reading PDF: {e}")
-    return tables
+        if strict:
+            raise
+        return
 
+    stats.update({"pages_total": total, "pages_skipped": skipped, "pages_extracted": total - skipped})
+    if prefilter and not found and PREFILTER_FALLBACK and skipped:
+        print("Pre-filter found no balance sheet pages, scanning every page.")
+        stats["fallback"] = True
+        # page text was already handed to on_text on the first pass
+        yield from iter_tables(pdf_path, on_page, strict, workers, prefilter=False, stats=stats)
 
-def extract_and_store(pdf_path, user):
-    print("Extracting tables from PDF...")
-    tables = extract_tables(pdf_path)
-    if not tables:
-        print("No valid tables found in PDF.")
-        return
 
-    company_id = choose_company(user)
-    inserted_records = []
-    total_rows = 0
+def extract_tables(pdf_path, on_page=None, strict=False, workers=None, prefilter=None, stats=None):
+    return list(iter_tables(pdf_path, on_page, strict, workers, prefilter, stats))
+
 
+def iter_records(tables, result):
+    # (year, revenue, assets, liabilities, profit) for every usable row; counts go into result
     for table in tables:
+        result["tables"] += 1
         headers = [h.strip().lower() for h in table[0] if h]
         col_map = {name: idx for idx, name in enumerate(headers)}
 
        
-        required = ["year", "revenue", "assets", "liabilities", "profit"]
-        if not all(any(r in h for h in headers) for r in required):
+        if not all(any(r in h for h in headers) for r in REQUIRED_COLUMNS):
             continue  
 
         for i in range(1, len(table)):
@@ -118,24 +413,92 @@ def extract_and_store(pdf_path, user):
                 continue
             try:
                 year = int(re.sub(r"[^\d]", "", row[col_map.get("year", 0)]))
+                if not MIN_YEAR <= year <= MAX_YEAR:
+                    raise ValueError(f"bad year {row[col_map.get('year', 0)]!r}")
                 revenue = clean_number(row[col_map.get("revenue", 1)])
                 assets = clean_number(row[col_map.get("assets", 2)])
                 liabilities = clean_number(row[col_map.get("liabilities", 3)])
                 profit = clean_number(row[col_map.get("profit", 4)])
                 if None in [year, revenue, assets, liabilities, profit]:
                     continue
-                inserted_records.append(
-                    (company_id, year, revenue, assets, liabilities, profit)
-                )
-                total_rows += 1
+                yield (year, revenue, assets, liabilities, profit)
             except Exception as e:
                 print(f"Skipping row {i}: {e}")
+                result["errors"].append(f"row {i}: {e}")
 
-    if inserted_records:
-        add_balance_sheet_data_bulk(inserted_records)
-        print(f"{total_rows} rows of balance sheet data stored/updated successfully.")
+
+@metrics.timed("extract_and_store")
+def extract_and_store(pdf_path, user, company_id=None, on_page=None, strict=False, batch_size=None,
+                      content_hash=None):
+    # pages are parsed, mapped to records and written in batches as we go,
+    # so memory stays flat however long the report is. with a content_hash the extracted
+    # records are also kept in the extraction cache so the same file never needs parsing again.
+    # without a company_id the company is detected from the PDF text (CompanyResolutionError
+    # if that fails); this never prompts, so it is safe to run from web and batch workers.
+    # the page text goes into the passage index for /ask as it is read
+    batch_size = INGEST_BATCH_SIZE if batch_size is None else batch_size
+    page_stats = {}
+    result = {"tables": 0, "rows": 0, "errors": []}
+    batch = []
+    extracted = []
+    first_pages = []
+
+    if company_id is None:
+        company_id, mentions = detect_company(pdf_path, user)
+        result["company_detected"] = {"company_id": company_id, "mentions": mentions}
+        print(f"Detected company {company_id} ({mentions} mentions).")
+    result["company_id"] = company_id
+
+    writer = None
+    if passage_index.PASSAGES_ENABLED:
+        writer = passage_index.DocumentWriter(company_id, content_hash or os.path.abspath(pdf_path))
+
+    def on_text(page, text):
+        # the first pages also go to company detection, for the extraction cache
+        if page <= DETECT_PAGES:
+            first_pages.append(text or "")
+        writer.add_page(page, text)
+
+    print("Extracting tables from PDF...")
+    tables = iter_tables(pdf_path, on_page=on_page, strict=strict, stats=page_stats,
+                         on_text=on_text if writer else None)
+    for record in iter_records(tables, result):
+        if content_hash:
+            extracted.append(record)
+        batch.append((company_id, *record))
+        if len(batch) >= batch_size:
+            add_balance_sheet_data_bulk(batch)
+            result["rows"] += len(batch)
+            batch = []
+    if batch:
+        add_balance_sheet_data_bulk(batch)
+        result["rows"] += len(batch)
+    if writer:
+        writer.finish()
+        result["passages"] = writer.stored
+
+    result.update(page_stats)
+    if content_hash and page_stats:
+        import upload_store
+        if first_pages:
+            detected = detect_in_text(" ".join(first_pages))
+        elif user is None or user["role"] == "groupadmin":
+            detected = result.get("company_detected")
+        else:
+            detected = None  # narrowed to this user's company, not what others would detect
+        upload_store.store_extraction(content_hash, extracted, result, detected)
+    if page_stats:
+        print(f"Scanned {page_stats['pages_total']} pages, "
+              f"{page_stats['pages_skipped']} skipped by the pre-filter.")
+    if writer:
+        print(f"Indexed {writer.stored} passages of report text.")
+    if not result["tables"]:
+        print("No valid tables found in PDF.")
+    elif result["rows"]:
+        print(f"{result['rows']} rows of balance sheet data stored/updated successfully.")
     else:
         print("No valid balance sheet data found.")
+    return result
 
 
 def main_menu(user):
@@ -150,7 +513,7 @@ def main_menu(user):
             if not os.path.isfile(pdf_path):
                 print("Invalid file path. Try again.")
                 continue
-            extract_and_store(pdf_path, user)
+            extract_and_store(pdf_path, user, company_id=choose_company(user))
         elif choice == "2":
             print("Returning to main menu.")
             break
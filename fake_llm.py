@@ -0,0 +1,105 @@
+import json
+import os
+import random
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# stand-in for the HF inference endpoint so /ask can be exercised offline:
+#   python fake_llm.py
+#   INFERENCE_BASE_URL=http://127.0.0.1:8089 python app.py
+
+PORT = int(os.environ.get("FAKE_LLM_PORT", 8089))
+LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", 0.5))
+TOKEN_DELAY = float(os.environ.get("FAKE_LLM_TOKEN_DELAY", 0.02))
+ANSWER = os.environ.get("FAKE_LLM_ANSWER", "This is a canned answer from the fake inference server.")
+# fault injection: share of requests answered with ERROR_STATUS, and of requests that take
+# SLOW_LATENCY instead of LATENCY
+ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", 0))
+ERROR_STATUS = int(os.environ.get("FAKE_LLM_ERROR_STATUS", 503))
+SLOW_RATE = float(os.environ.get("FAKE_LLM_SLOW_RATE", 0))
+SLOW_LATENCY = float(os.environ.get("FAKE_LLM_SLOW_LATENCY", 5.0))
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setting(self, name):
+        # per-server overrides from serve(**settings), else the module default
+        return self.server.settings.get(name, globals()[name.upper()])
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for i, word in enumerate(self.setting("answer").split(" ")):
+            chunk = {
+                "id": "fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": word if i == 0 else " " + word},
+                    "finish_reason": None,
+                }],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.setting("token_delay"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        self.server.requests += 1
+        slow = random.random() < self.setting("slow_rate")
+        time.sleep(self.setting("slow_latency") if slow else self.setting("latency"))
+        if random.random() < self.setting("error_rate"):
+            self.server.errors += 1
+            self._send_json(self.setting("error_status"), {"error": "injected failure"})
+            return
+        if payload.get("stream"):
+            self._send_stream(payload.get("model", "fake"))
+            return
+        self._send_json(200, {
+            "id": "fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.setting("answer")},
+                "finish_reason": "stop",
+            }],
+        })
+
+
+def serve(port=PORT, **settings):
+    # settings override the module defaults for this server only, e.g. serve(0, error_rate=0.5)
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeLLMHandler)
+    server.settings = settings
+    server.requests = 0
+    server.errors = 0
+    print(f"Fake inference server on http://127.0.0.1:{server.server_port}")
+    return server
+
+
+if __name__ == "__main__":
+    serve().serve_forever()
@@ -0,0 +1,14 @@
+import gc
+import os
+
+# gunicorn picks this file up automatically.
+# GUNICORN_PRELOAD=1 imports the app once in the master, warms the heavy modules the routes
+# import lazily, and freezes the GC so workers keep sharing those pages copy-on-write
+preload_app = os.environ.get("GUNICORN_PRELOAD", "0") == "1"
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+        app.warm_imports()
+        gc.freeze()
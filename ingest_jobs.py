@@ -0,0 +1,254 @@
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import db
+import metrics
+from db import get_connection
+
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 2))
+INGEST_MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", 3))
+# a running job whose progress hasn't moved for this long is assumed to have lost its worker
+INGEST_LEASE = int(os.environ.get("INGEST_LEASE", 300))
+POLL_INTERVAL = 1.0
+RETRY_BACKOFF = 5
+
+# names this process's rows in worker_metrics; a restarted worker gets new ones, so the
+# totals of the old process are kept rather than reset
+PROCESS_KEY = f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}"
+
+log = logging.getLogger(__name__)
+
+_started_pid = None
+_processes = []
+_start_lock = threading.Lock()
+
+JOB_COLUMNS = (
+    "id, content_hash, file_path, filename, user, company_id, status, attempts, "
+    "pages_done, pages_total, rows_extracted, errors, created, updated"
+)
+
+
+def job_to_dict(row):
+    job = dict(zip([c.strip() for c in JOB_COLUMNS.split(",")], row))
+    job["user"] = json.loads(job["user"])
+    job["errors"] = json.loads(job["errors"]) if job["errors"] else []
+    return job
+
+
+def get_job(job_id):
+    conn = get_connection()
+    row = conn.execute(f"SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE id=?", (job_id,)).fetchone()
+    conn.close()
+    return job_to_dict(row) if row else None
+
+
+def active_file_paths():
+    conn = get_connection()
+    rows = conn.execute("SELECT file_path FROM ingest_jobs WHERE status IN ('queued', 'running')").fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+
+def submit(file_path, filename, user, company_id, content_hash):
+    # the same file for the same company is only ingested once; a failed one is queued again.
+    # the write lock is taken before the lookup so two uploads of the same file can't both miss it
+    now = time.time()
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, status FROM ingest_jobs WHERE content_hash=? AND company_id IS ?",
+            (content_hash, company_id),
+        )
+        existing = cur.fetchone()
+        if existing and existing[1] != "failed":
+            conn.rollback()
+            return existing[0], False
+        if existing:
+            cur.execute(
+                "UPDATE ingest_jobs SET status='queued', attempts=0, run_after=0, pages_done=0, "
+                "rows_extracted=0, errors=NULL, file_path=?, user=?, updated=? WHERE id=?",
+                (file_path, json.dumps(user), now, existing[0]),
+            )
+            job_id = existing[0]
+        else:
+            cur.execute(
+                "INSERT INTO ingest_jobs (content_hash, file_path, filename, user, company_id, created, updated) "
+                "VALUES (?,?,?,?,?,?,?)",
+                (content_hash, file_path, filename, json.dumps(user), company_id, now, now),
+            )
+            job_id = cur.lastrowid
+        conn.commit()
+        return job_id, True
+    finally:
+        conn.close()
+
+
+def claim_job():
+    now = time.time()
+    conn = get_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        # a job that keeps losing its lease is probably killing its worker (a crash, the OOM
+        # killer), so it never gets to run_job's attempt check; fail it here instead
+        lost = conn.execute(
+            "SELECT id, attempts, errors FROM ingest_jobs WHERE status='running' AND updated < ? AND attempts >= ?",
+            (now - INGEST_LEASE, INGEST_MAX_ATTEMPTS),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE ingest_jobs SET status='failed', errors=?, updated=? WHERE id=?",
+            [
+                (json.dumps((json.loads(errors) if errors else []) + [f"attempt {attempts}: worker lost"]), now, job_id)
+                for job_id, attempts, errors in lost
+            ],
+        )
+        row = conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM ingest_jobs "
+            "WHERE (status='queued' AND run_after <= ?) OR (status='running' AND updated < ?) "
+            "ORDER BY id LIMIT 1",
+            (now, now - INGEST_LEASE),
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE ingest_jobs SET status='running', attempts=attempts+1, updated=? WHERE id=?",
+                (now, row[0]),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+    return job_to_dict(row) if row else None
+
+
+def update_job(job_id, **fields):
+    fields["updated"] = time.time()
+    if "errors" in fields:
+        fields["errors"] = json.dumps(fields["errors"])
+    assignments = ", ".join(f"{name}=?" for name in fields)
+    conn = get_connection()
+    conn.execute(f"UPDATE ingest_jobs SET {assignments} WHERE id=?", (*fields.values(), job_id))
+    conn.commit()
+    conn.close()
+
+
+def run_job(job):
+    import extract_pdf
+
+    last_write = [0.0]
+
+    def on_page(done, total):
+        # progress doubles as the lease heartbeat; don't write more than a couple of times a second
+        if done == total or time.time() - last_write[0] > 0.5:
+            update_job(job["id"], pages_done=done, pages_total=total)
+            last_write[0] = time.time()
+
+    try:
+        result = extract_pdf.extract_and_store(
+            job["file_path"], job["user"], company_id=job["company_id"], on_page=on_page, strict=True,
+            content_hash=job["content_hash"],
+        )
+    except Exception as e:
+        errors = job["errors"] + [f"attempt {job['attempts'] + 1}: {e}"]
+        # a company that can't be detected won't be found on a retry either
+        if job["attempts"] + 1 >= INGEST_MAX_ATTEMPTS or isinstance(e, extract_pdf.CompanyResolutionError):
+            update_job(job["id"], status="failed", errors=errors)
+        else:
+            update_job(
+                job["id"], status="queued", errors=errors,
+                run_after=time.time() + RETRY_BACKOFF * 2 ** job["attempts"],
+            )
+        return
+    update_job(
+        job["id"], status="done", rows_extracted=result["rows"], errors=job["errors"] + result["errors"]
+    )
+
+
+def publish_metrics():
+    # spans recorded here (extract_and_store, extract_page, ...) live in this process's registry;
+    # copy them to the database so /metrics in the web process can serve them
+    if not metrics.ENABLED:
+        return
+    now = time.time()
+    rows = [(PROCESS_KEY, *row, now) for row in metrics.registry.export()]
+    conn = get_connection()
+    try:
+        conn.executemany(
+            "INSERT INTO worker_metrics (process, name, labels, counts, sum, count, updated) VALUES (?,?,?,?,?,?,?) "
+            "ON CONFLICT(process, name, labels) DO UPDATE SET counts=excluded.counts, sum=excluded.sum, "
+            "count=excluded.count, updated=excluded.updated",
+            rows,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def exported_metrics():
+    conn = get_connection()
+    try:
+        return conn.execute("SELECT name, labels, counts, sum, count FROM worker_metrics").fetchall()
+    finally:
+        conn.close()
+
+
+def worker_main(db_name, poll_interval=POLL_INTERVAL, parent_pid=None):
+    db.pool.db_name = db_name
+    while True:
+        if parent_pid and os.getppid() != parent_pid:
+            return  # the web worker that started us is gone
+        # a locked database (say during a long /upload-bulk batch) must not end the worker.
+        # a job whose final update failed stays 'running' and is claimed again once its lease runs out
+        try:
+            job = claim_job()
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            run_job(job)
+            publish_metrics()
+        except Exception:
+            log.exception("ingest worker %s: poll failed, retrying in %ss", os.getpid(), poll_interval)
+            time.sleep(poll_interval)
+
+
+def stop_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(5)
+
+
+def start_workers(count=INGEST_WORKERS):
+    # spawn rather than fork: the web worker has live threads and sqlite connections.
+    # not daemonic, because extract_tables starts its own page-level process pool.
+    # called on every upload, so a worker process that died is replaced on the next one
+    global _started_pid
+    with _start_lock:
+        if count <= 0:
+            return
+        if _started_pid != os.getpid():
+            _processes.clear()  # a forked copy of the module; those processes aren't ours
+            atexit.register(stop_workers, _processes)
+            _started_pid = os.getpid()
+        alive = [process for process in _processes if process.is_alive()]
+        for process in _processes:
+            if not process.is_alive():
+                log.warning("ingest worker %s exited with %s, starting a new one", process.pid, process.exitcode)
+        ctx = multiprocessing.get_context("spawn")
+        args = (os.path.abspath(db.pool.db_name), POLL_INTERVAL, os.getpid())
+        for _ in range(count - len(alive)):
+            process = ctx.Process(target=worker_main, args=args)
+            process.start()
+            alive.append(process)
+        _processes[:] = alive
+
+
+if __name__ == "__main__":
+    db.create_tables()
+    print(f"Ingestion worker polling {db.pool.db_name}")
+    worker_main(db.pool.db_name)
@@ -0,0 +1,376 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+# comma-separated, tried in this order: "hf" is the InferenceClient (INFERENCE_BASE_URL or the HF
+# inference API), "router" the OpenAI-compatible HF router that chat.py talks to
+LLM_PROVIDERS = os.environ.get("LLM_PROVIDERS", "hf,router")
+LLM_ROUTER_BASE_URL = os.environ.get("LLM_ROUTER_BASE_URL", "https://router.huggingface.co/v1")
+LLM_ROUTER_MODEL = os.environ.get("LLM_ROUTER_MODEL", "deepseek-ai/DeepSeek-V3.2-Exp:novita")
+# per provider call; the whole answer (retries included) must fit in LLM_DEADLINE
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 30))
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", 55))
+# rounds over the providers after the first one fails, with jittered exponential backoff between
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", 2))
+LLM_BACKOFF = float(os.environ.get("LLM_BACKOFF", 0.25))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 4.0))
+# a call still running after this many seconds is raced against the next provider; 0 disables
+LLM_HEDGE_AFTER = float(os.environ.get("LLM_HEDGE_AFTER", 8.0))
+# consecutive failures that open a provider's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))
+
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+
+class ProviderError(Exception):
+    def __init__(self, provider, error):
+        self.provider = provider
+        self.status = status_of(error)
+        # timeouts, dropped connections, rate limits and 5xx are worth another try; a 400 is not
+        self.retryable = self.status is None or self.status in RETRYABLE_STATUS or self.status >= 500
+        super().__init__(f"{provider}: {error}")
+
+
+class LLMUnavailable(Exception):
+    pass
+
+
+def status_of(error):
+    # huggingface_hub errors carry the requests response, openai errors a status_code
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+class CircuitBreaker:
+    # closed -> open after `failures` consecutive failures; after `cooldown` one probe call is
+    # let through (half-open) and its outcome closes or re-opens the circuit
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def available(self):
+        # like allow() but without claiming the half-open probe
+        with self._lock:
+            return (self._opened_at is None
+                    or (time.monotonic() - self._opened_at >= self.cooldown and not self._probing))
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record(self, future):
+        # done callback, so calls that lost a race or outlived the deadline still count
+        self.record_error(future.exception())
+
+    def record_error(self, error):
+        # only errors that say the provider is unhealthy count; a non-retryable one (a 400 for
+        # a bad prompt, too many tokens) means it answered and the request was at fault
+        if error is None or not getattr(error, "retryable", True):
+            self.record_success()
+        else:
+            self.record_failure()
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or (self._opened_at is None and self._consecutive >= self.failures):
+                if self._opened_at is None:
+                    self.opens += 1
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class Provider:
+
+    def __init__(self, name, model, timeout=LLM_TIMEOUT):
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self.breaker = CircuitBreaker()
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        # the SDKs are imported on first use so they stay out of worker boot
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.make_client()
+        return self._client
+
+    def complete(self, messages, max_tokens):
+        try:
+            return self._complete(messages, max_tokens)
+        except Exception as e:
+            raise ProviderError(self.name, e) from e
+
+
+class HFProvider(Provider):
+
+    def __init__(self, name, model, token=None, base_url=None, timeout=LLM_TIMEOUT):
+        super().__init__(name, model, timeout)
+        self.token = token
+        self.base_url = base_url
+
+    def make_client(self):
+        from huggingface_hub import InferenceClient
+        return InferenceClient(token=self.token, base_url=self.base_url, timeout=self.timeout)
+
+    def _complete(self, messages, max_tokens):
+        response = self.client().chat_completion(model=self.model, messages=messages, max_tokens=max_tokens)
+        if "response" in response:
+            return response["response"]
+        elif "choices" in response and len(response["choices"]) > 0:
+            return response["choices"][0]["message"]["content"]
+        # an empty response is the provider's failure, so it is retried and never cached
+        raise ValueError("no text returned from model")
+
+    def stream(self, messages, max_tokens):
+        for chunk in self.client().chat_completion(model=self.model, messages=messages, max_tokens=max_tokens,
+                                                   stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class RouterProvider(Provider):
+
+    def __init__(self, name, model, api_key=None, base_url=LLM_ROUTER_BASE_URL, timeout=LLM_TIMEOUT):
+        super().__init__(name, model, timeout)
+        self.api_key = api_key
+        self.base_url = base_url
+
+    def make_client(self):
+        from openai import OpenAI
+        # retries happen in LLMClient, where they can fail over instead
+        return OpenAI(base_url=self.base_url, api_key=self.api_key or "unused", timeout=self.timeout, max_retries=0)
+
+    def _complete(self, messages, max_tokens):
+        completion = self.client().chat.completions.create(model=self.model, messages=messages, max_tokens=max_tokens)
+        if completion.choices and completion.choices[0].message.content:
+            return completion.choices[0].message.content
+        raise ValueError("no text returned from model")
+
+    def stream(self, messages, max_tokens):
+        for chunk in self.client().chat.completions.create(model=self.model, messages=messages, max_tokens=max_tokens,
+                                                           stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+def providers_from_env(token, base_url, model, names=LLM_PROVIDERS):
+    providers = []
+    for name in [n.strip() for n in names.split(",") if n.strip()]:
+        if name == "hf":
+            providers.append(HFProvider("hf", model, token=token, base_url=base_url))
+        elif name == "router":
+            # without a token the router is only usable when pointed somewhere else (a local stub)
+            if token or "LLM_ROUTER_BASE_URL" in os.environ:
+                api_key = os.environ.get("LLM_ROUTER_API_KEY", token)
+                providers.append(RouterProvider("router", LLM_ROUTER_MODEL, api_key=api_key))
+        else:
+            raise ValueError(f"Unknown LLM provider {name!r} in LLM_PROVIDERS")
+    return providers
+
+
+class LLMClient:
+    # one completion = identical in-flight prompts coalesced into a single call, then up to
+    # 1 + retries rounds over the providers in order. within a round a provider that fails hands
+    # over to the next one straight away, and one that is slow past hedge_after is raced against
+    # it; the first answer wins. providers with an open circuit are skipped.
+
+    def __init__(self, providers, retries=LLM_RETRIES, backoff=LLM_BACKOFF, backoff_max=LLM_BACKOFF_MAX,
+                 hedge_after=LLM_HEDGE_AFTER, deadline=LLM_DEADLINE):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._executor = None
+        self._pid = None
+        self._counters = {"calls": 0, "coalesced": 0, "attempts": 0, "retries": 0, "failovers": 0, "hedges": 0,
+                          "hedge_wins": 0, "failures": 0, "short_circuited": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _get_executor(self):
+        # attempts run on their own threads so a hedge can start while the first is still waiting
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                workers = 4 * len(self.providers) + 4
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+                self._pid = os.getpid()
+            return self._executor
+
+    def complete(self, prompt, max_tokens=300):
+        key = hashlib.sha1(f"{max_tokens}|{prompt}".encode()).hexdigest()
+        with self._lock:
+            leader = self._inflight.get(key)
+            if leader is None:
+                future = self._inflight[key] = Future()
+        if leader is not None:
+            self._count("coalesced")
+            return leader.result()
+
+        self._count("calls")
+        try:
+            answer = self._complete([{"role": "user", "content": prompt}], max_tokens)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(answer)
+            return answer
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _complete(self, messages, max_tokens):
+        deadline = time.monotonic() + self.deadline
+        errors = []
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                if time.monotonic() + delay >= deadline:
+                    break
+                self._count("retries")
+                time.sleep(delay)
+            candidates = [p for p in self.providers if p.breaker.available()]
+            if not candidates:
+                # failing fast is the point of an open circuit, so don't wait out the backoff
+                self._count("short_circuited")
+                errors.append("all providers' circuits are open")
+                break
+            try:
+                return self._round(candidates, messages, max_tokens, deadline)
+            except ProviderError as e:
+                errors.append(str(e))
+                if not e.retryable:
+                    break
+        self._count("failures")
+        raise LLMUnavailable("; ".join(errors) or "no provider available")
+
+    def _round(self, candidates, messages, max_tokens, deadline):
+        executor = self._get_executor()
+        waiting = list(candidates)
+        running = {}
+        hedged = set()
+        last_error = None
+
+        def start(provider, reason=None):
+            if not provider.breaker.allow():
+                return False
+            if reason:
+                self._count(reason)
+            self._count("attempts")
+            future = executor.submit(provider.complete, messages, max_tokens)
+            future.add_done_callback(provider.breaker.record)
+            running[future] = provider
+            if reason == "hedges":
+                hedged.add(future)
+            return True
+
+        while running or waiting:
+            if not running:
+                reason = "failovers" if waiting[0] is not candidates[0] else None
+                start(waiting.pop(0), reason)
+                continue
+            timeout = deadline - time.monotonic()
+            if waiting and self.hedge_after > 0:
+                timeout = min(timeout, self.hedge_after)
+            done, _ = wait(running, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+            if not done:
+                if time.monotonic() >= deadline:
+                    break
+                # the slow call keeps going; whichever answers first is used
+                while waiting and not start(waiting.pop(0), "hedges"):
+                    pass
+                continue
+            for future in done:
+                running.pop(future)
+                try:
+                    answer = future.result()
+                except ProviderError as e:
+                    last_error = e
+                    continue
+                if future in hedged:
+                    self._count("hedge_wins")
+                return answer
+        if last_error is None:
+            last_error = ProviderError(candidates[0].name, TimeoutError("no answer before the deadline"))
+        raise last_error
+
+    def stream(self, prompt, max_tokens=300):
+        # streams can't be retried or raced once tokens have gone out, so this only fails over
+        # while nothing has been yielded yet
+        messages = [{"role": "user", "content": prompt}]
+        errors = []
+        for provider in self.providers:
+            if not provider.breaker.allow():
+                continue
+            started = False
+            try:
+                for piece in provider.stream(messages, max_tokens):
+                    started = True
+                    yield piece
+            except GeneratorExit:
+                # the client went away; the provider itself was fine
+                provider.breaker.record_success()
+                raise
+            except Exception as e:
+                provider.breaker.record_error(ProviderError(provider.name, e))
+                if started:
+                    raise
+                errors.append(f"{provider.name}: {e}")
+                self._count("failovers")
+                continue
+            provider.breaker.record_success()
+            return
+        self._count("failures")
+        raise LLMUnavailable("; ".join(errors) or "all providers' circuits are open")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["inflight"] = len(self._inflight)
+        for provider in self.providers:
+            state = provider.breaker.state
+            stats[f"{provider.name}_open"] = int(state == "open")
+            stats[f"{provider.name}_breaker_opens"] = provider.breaker.opens
+        return stats
@@ -0,0 +1,218 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# METRICS_ENABLED=0 turns span()/timed() into no-ops: timed() hands back the undecorated
+# function and span() a shared nullcontext, so the only cost left is one attribute check
+ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+PREFIX = "balance_gpt"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# quantiles are taken over the most recent samples of each series
+RECENT_SAMPLES = int(os.environ.get("METRICS_RECENT_SAMPLES", 1024))
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self):
+        samples = sorted(self.recent)
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_gauge(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {
+                key: (list(h.counts), h.sum, h.count, h.quantiles()) for key, h in self.histograms.items()
+            }
+            return histograms, dict(self.counters), dict(self.gauges)
+
+    def export(self):
+        # histograms as (name, labels, bucket counts, sum, count) with the labels and counts in
+        # JSON, for processes that hand their metrics to the web process through the database
+        with self._lock:
+            return [
+                (name, json.dumps(labels), json.dumps(h.counts), h.sum, h.count)
+                for (name, labels), h in self.histograms.items()
+            ]
+
+
+registry = Registry()
+
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe("span_seconds", (("span", name),), time.perf_counter() - start)
+
+
+def span(name):
+    return _span(name) if ENABLED else _NOOP
+
+
+def observe_span(name, seconds):
+    # for work timed in another process and reported back, e.g. pages parsed in a pool process
+    if ENABLED:
+        registry.observe("span_seconds", (("span", name),), seconds)
+
+
+def timed(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def init_app(app):
+    if not ENABLED:
+        return
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+        registry.add_gauge("http_in_flight", (("route", g.metrics_route),))
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            labels = (("route", g.metrics_route), ("method", request.method))
+            registry.observe("http_request_seconds", labels, time.perf_counter() - start)
+            registry.inc("http_requests_total", labels + (("status", str(response.status_code)),))
+        return response
+
+    # teardown runs even when a view raised, so the gauge can't leak
+    @app.teardown_request
+    def end_in_flight(exc):
+        route = g.pop("metrics_route", None)
+        if route is not None:
+            registry.add_gauge("http_in_flight", (("route", route),), -1)
+
+
+def format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def merge_exported(histograms, rows):
+    # adds rows from Registry.export() of other processes into a snapshot. they carry no recent
+    # samples, so the _recent quantiles stay those of this process
+    for name, labels, counts, total, count in rows:
+        key = (name, tuple(tuple(pair) for pair in json.loads(labels)))
+        counts = json.loads(counts)
+        if len(counts) != len(BUCKETS) + 1:
+            continue  # exported before the buckets changed
+        own = histograms.get(key)
+        if own is not None:
+            counts = [a + b for a, b in zip(own[0], counts)]
+            total += own[1]
+            count += own[2]
+        histograms[key] = (counts, total, count, own[3] if own is not None else {})
+
+
+def render(components=None, exported=()):
+    # Prometheus text exposition format 0.0.4. exported: histograms of other processes,
+    # summed into the matching series of this one
+    histograms, counters, gauges = registry.snapshot()
+    merge_exported(histograms, exported)
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), (counts, total, count, _) in sorted(histograms.items()):
+        metric = f"{PREFIX}_{name}"
+        declare(metric, "histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += n
+            lines.append(f"{metric}_bucket{format_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{metric}_sum{format_labels(labels)} {total}")
+        lines.append(f"{metric}_count{format_labels(labels)} {count}")
+    for (name, labels), (_, _, _, quantiles) in sorted(histograms.items()):
+        if not quantiles:
+            continue
+        metric = f"{PREFIX}_{name}_recent"
+        declare(metric, "gauge")
+        for q, value in quantiles.items():
+            lines.append(f"{metric}{format_labels(labels, (('quantile', q),))} {value}")
+    for (name, labels), value in sorted(counters.items()):
+        metric = f"{PREFIX}_{name}"
+        declare(metric, "counter")
+        lines.append(f"{metric}{format_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        metric = f"{PREFIX}_{name}"
+        declare(metric, "gauge")
+        lines.append(f"{metric}{format_labels(labels)} {value}")
+
+    # numeric fields of the components' own stats() dicts, one gauge per field
+    for component, stats in sorted((components or {}).items()):
+        for key, value in sorted(stats.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            metric = f"{PREFIX}_{component}_{key}"
+            declare(metric, "gauge")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,367 @@
+import sys
+import time
+
+from auth import hash_password
+from db import get_connection
+
+# numbered schema migrations, applied in order at startup by db.create_tables().
+# never edit a migration once it has shipped; add a new one instead.
+
+
+def m001_base_schema(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS companies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            parent_group TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('analyst','ceo','GroupAdmin')),
+            company_id INTEGER,
+            FOREIGN KEY(company_id) REFERENCES companies(id)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS balance_sheets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            revenue REAL,
+            assets REAL,
+            liabilities REAL,
+            profit REAL,
+            FOREIGN KEY(company_id) REFERENCES companies(id)
+        )
+    """)
+
+
+def m002_users_family_role(cur):
+    # what spare.py used to do by hand: allow the 'family' role and map it to GroupAdmin.
+    # a table spare.py already rebuilt allows both and only needs any later 'family' rows mapped
+    sql = cur.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='users'").fetchone()[0]
+    if "'family'" in sql and "'GroupAdmin'" in sql:
+        cur.execute("UPDATE users SET role='GroupAdmin' WHERE role='family'")
+        return
+    cur.execute("ALTER TABLE users RENAME TO users_old")
+    cur.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('analyst','ceo','family','GroupAdmin')),
+            company_id INTEGER,
+            FOREIGN KEY(company_id) REFERENCES companies(id)
+        )
+    """)
+    cur.execute("""
+        INSERT INTO users (id, username, password, role, company_id)
+        SELECT id, username, password,
+               CASE WHEN role='family' THEN 'GroupAdmin' ELSE role END,
+               company_id
+        FROM users_old
+    """)
+    cur.execute("DROP TABLE users_old")
+
+
+def m003_data_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+
+
+def m004_balance_sheet_indexes(cur):
+    # the upserts need (company_id, year) unique; older databases can hold duplicates, keep the newest
+    cur.execute("""
+        DELETE FROM balance_sheets WHERE id NOT IN (
+            SELECT MAX(id) FROM balance_sheets GROUP BY company_id, year
+        )
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_company_year ON balance_sheets(company_id, year)")
+    # company + year range reads never have to touch the table
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_balance_sheets_company_year_cover
+        ON balance_sheets(company_id, year, revenue, assets, liabilities, profit)
+    """)
+    # companies.name and users.username are UNIQUE, so their lookups already have an index
+
+
+def m005_ingest_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_hash TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            filename TEXT,
+            user TEXT NOT NULL,
+            company_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after REAL NOT NULL DEFAULT 0,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            pages_total INTEGER,
+            rows_extracted INTEGER NOT NULL DEFAULT 0,
+            errors TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL,
+            UNIQUE(content_hash, company_id)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, run_after)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            content_hash TEXT PRIMARY KEY,
+            records TEXT NOT NULL,
+            tables INTEGER NOT NULL,
+            pages_total INTEGER,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+    """)
+
+
+def m006_answer_cache(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            key TEXT PRIMARY KEY,
+            scope TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created REAL NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_scope ON answer_cache(scope)")
+
+
+def m007_hash_passwords(cur):
+    cur.execute("SELECT id, password FROM users WHERE password NOT LIKE 'pbkdf2_sha256$%'")
+    cur.executemany(
+        "UPDATE users SET password=? WHERE id=?",
+        [(hash_password(password), user_id) for user_id, password in cur.fetchall()],
+    )
+
+
+def m008_group_rollups(cur):
+    from rollups import rebuild_rollups
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS group_rollups (
+            parent_group TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            companies INTEGER NOT NULL,
+            revenue REAL,
+            assets REAL,
+            liabilities REAL,
+            profit REAL,
+            PRIMARY KEY (parent_group, year)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_companies_parent_group ON companies(parent_group)")
+    rebuild_rollups(cur)
+
+
+def m009_passages(cur):
+    # page text of uploaded reports and its inverted index, see passage_index.py
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS passages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_id INTEGER NOT NULL,
+            document TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            length INTEGER NOT NULL,
+            FOREIGN KEY(company_id) REFERENCES companies(id)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_passages_document ON passages(document, company_id)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS passage_postings (
+            term TEXT NOT NULL,
+            company_id INTEGER NOT NULL,
+            passage_id INTEGER NOT NULL,
+            tf INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            PRIMARY KEY (term, company_id, passage_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS passage_terms (
+            term TEXT NOT NULL,
+            company_id INTEGER NOT NULL,
+            df INTEGER NOT NULL,
+            PRIMARY KEY (term, company_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS passage_stats (
+            company_id INTEGER PRIMARY KEY,
+            passages INTEGER NOT NULL,
+            total_length INTEGER NOT NULL
+        )
+    """)
+
+
+def m010_worker_metrics(cur):
+    # histograms of ingest worker processes, which /metrics in the web process can't see otherwise
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS worker_metrics (
+            process TEXT NOT NULL,
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            counts TEXT NOT NULL,
+            sum REAL NOT NULL,
+            count INTEGER NOT NULL,
+            updated REAL NOT NULL,
+            PRIMARY KEY (process, name, labels)
+        ) WITHOUT ROWID
+    """)
+
+
+def m011_extraction_cache_company(cur):
+    # the company detected in a cached file, so a repeat upload without company_id skips the PDF
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(extraction_cache)")}
+    if "detected_company" not in columns:
+        cur.execute("ALTER TABLE extraction_cache ADD COLUMN detected_company INTEGER")
+        cur.execute("ALTER TABLE extraction_cache ADD COLUMN detected_mentions INTEGER")
+
+
+def m012_ask_jobs(cur):
+    # /ask/jobs status and answers, so a poll can land on any gunicorn worker
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ask_jobs (
+            id TEXT PRIMARY KEY,
+            owner INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            answer TEXT,
+            error TEXT,
+            submitted REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ask_jobs_updated ON ask_jobs(updated)")
+
+
+MIGRATIONS = [
+    (1, m001_base_schema),
+    (2, m002_users_family_role),
+    (3, m003_data_versions),
+    (4, m004_balance_sheet_indexes),
+    (5, m005_ingest_tables),
+    (6, m006_answer_cache),
+    (7, m007_hash_passwords),
+    (8, m008_group_rollups),
+    (9, m009_passages),
+    (10, m010_worker_metrics),
+    (11, m011_extraction_cache_company),
+    (12, m012_ask_jobs),
+]
+
+
+def current_version(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied REAL NOT NULL
+        )
+    """)
+    return cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(verbose=False):
+    # each migration runs in its own IMMEDIATE transaction, so gunicorn workers booting
+    # together queue up on the write lock and the later ones find nothing left to do
+    conn = get_connection()
+    applied = []
+    try:
+        for number, migration in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.cursor()
+            if current_version(cur) >= number:
+                conn.rollback()
+                continue
+            migration(cur)
+            cur.execute(
+                "INSERT INTO schema_version (version, name, applied) VALUES (?,?,?)",
+                (number, migration.__name__, time.time()),
+            )
+            conn.commit()
+            applied.append(number)
+            if verbose:
+                print(f"Applied migration {number}: {migration.__name__}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return applied
+
+
+# the hot read paths and the index each one has to use
+QUERY_PLANS = [
+    (
+        "SELECT year, revenue, assets, liabilities, profit FROM balance_sheets "
+        "WHERE 1=1 AND company_id=? AND year >= ? AND year <= ? ORDER BY year ASC",
+        (1, 2000, 2030),
+        "COVERING INDEX idx_balance_sheets_company_year_cover",
+    ),
+    (
+        "SELECT year, revenue, assets, liabilities, profit FROM balance_sheets "
+        "JOIN companies ON balance_sheets.company_id = companies.id "
+        "WHERE companies.name = ? ORDER BY year ASC",
+        ("x",),
+        "COVERING INDEX idx_balance_sheets_company_year_cover",
+    ),
+    ("SELECT id FROM companies WHERE name=?", ("x",), "COVERING INDEX sqlite_autoindex_companies_1"),
+    (
+        "SELECT id, password, role, company_id FROM users WHERE username=?",
+        ("x",),
+        "INDEX sqlite_autoindex_users_1",
+    ),
+    (
+        "SELECT COUNT(*), SUM(revenue) FROM companies JOIN balance_sheets ON balance_sheets.company_id = companies.id "
+        "WHERE companies.parent_group = ? AND balance_sheets.year = ?",
+        ("x", 2020),
+        "INDEX idx_companies_parent_group",
+    ),
+    (
+        "SELECT passage_id, tf, length FROM passage_postings WHERE term=? AND company_id IN (?,?)",
+        ("x", 1, 2),
+        "PRIMARY KEY (term=? AND company_id=?)",
+    ),
+    (
+        "SELECT id, text, length FROM passages WHERE company_id=? AND document=?",
+        (1, "x"),
+        "INDEX idx_passages_document",
+    ),
+]
+
+
+def check_query_plans():
+    conn = get_connection()
+    failures = []
+    try:
+        for sql, params, expected in QUERY_PLANS:
+            plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+            if expected not in plan or "TEMP B-TREE" in plan:
+                failures.append(f"{sql}\n  expected {expected}\n  got {plan}")
+    finally:
+        conn.close()
+    return failures
+
+
+if __name__ == "__main__":
+    # python migrations.py [--check]: migrate balance_gpt.db, optionally assert the query plans.
+    # tests/test_migrations.py runs the same checks on a scratch database
+    migrate(verbose=True)
+    if "--check" in sys.argv:
+        failures = check_query_plans()
+        for failure in failures:
+            print(failure)
+        sys.exit(1 if failures else 0)
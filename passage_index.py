@@ -0,0 +1,344 @@
+import argparse
+import math
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+import metrics
+from db import get_connection, bump_passage_version
+
+# narrative text of uploaded reports (MD&A, notes, risk factors), chunked into passages and kept
+# in an inverted index in the database next to the numbers:
+#   passages          one row per chunk of page text
+#   passage_postings  (term, company, passage) -> term frequency and passage length
+#   passage_terms     per company document frequency of each term
+#   passage_stats     per company passage count and total length, for BM25's average length
+# every write updates all four in one transaction, so an upload is searchable as soon as it commits
+PASSAGES_ENABLED = os.environ.get("PASSAGES_ENABLED", "1") == "1"
+PASSAGE_CHARS = int(os.environ.get("PASSAGE_CHARS", 800))
+PASSAGE_TOP_K = int(os.environ.get("PASSAGE_TOP_K", 4))
+# pages buffered before a write transaction during ingestion
+PASSAGE_BATCH_PAGES = int(os.environ.get("PASSAGE_BATCH_PAGES", 25))
+# terms in more than this share of the passages searched carry almost no weight; skipping them
+# avoids reading their (long) posting lists
+PASSAGE_MAX_DF = float(os.environ.get("PASSAGE_MAX_DF", 0.5))
+PASSAGE_MAX_TERMS = 12
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = set("""
+a about above after again all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this
+those through to too under until up very was we were what when where which while who whom why will with would
+you your yours
+""".split())
+
+
+def normalize(token):
+    # just enough folding that "risks" finds "risk" and "liabilities" finds "liability"
+    if len(token) > 4 and not token.isdigit():
+        if token.endswith("ies"):
+            return token[:-3] + "y"
+        if token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [normalize(t) for t in re.findall(r"[a-z0-9]+", text.lower()) if 1 < len(t) < 30 and t not in STOPWORDS]
+
+
+def is_narrative(text):
+    # financial tables are mostly digits; they are already in balance_sheets
+    letters = sum(map(str.isalpha, text))
+    digits = sum(map(str.isdigit, text))
+    return letters >= 0.6 * (letters + digits) and len(text.split()) >= 8
+
+
+def chunk_page(text, size=PASSAGE_CHARS):
+    # paragraphs (then lines, then words) packed into chunks of at most `size` characters
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        for line in paragraph.splitlines():
+            line = " ".join(line.split())
+            while len(line) > size:
+                cut = line.rfind(" ", 0, size)
+                cut = cut if cut > 0 else size
+                chunks.append(line[:cut])
+                line = line[cut:].strip()
+            if current and len(current) + len(line) + 1 > size:
+                chunks.append(current)
+                current = ""
+            current = f"{current} {line}".strip()
+        if current and len(current) > size // 2:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return [c for c in chunks if is_narrative(c)]
+
+
+def write_passages(cur, company_id, document, passages):
+    # passages: list of (page, text). returns the number stored
+    df = Counter()
+    postings = []
+    total_length = 0
+    for page, text in passages:
+        counts = Counter(tokenize(text))
+        if not counts:
+            continue
+        length = sum(counts.values())
+        cur.execute(
+            "INSERT INTO passages (company_id, document, page, text, length) VALUES (?,?,?,?,?)",
+            (company_id, document, page, text, length),
+        )
+        passage_id = cur.lastrowid
+        postings.extend((term, company_id, passage_id, tf, length) for term, tf in counts.items())
+        df.update(counts.keys())
+        total_length += length
+    if not postings:
+        return 0
+    stored = len({p[2] for p in postings})
+    cur.executemany(
+        "INSERT INTO passage_postings (term, company_id, passage_id, tf, length) VALUES (?,?,?,?,?)", postings
+    )
+    cur.executemany(
+        "INSERT INTO passage_terms (term, company_id, df) VALUES (?,?,?) "
+        "ON CONFLICT(term, company_id) DO UPDATE SET df = df + excluded.df",
+        [(term, company_id, n) for term, n in df.items()],
+    )
+    cur.execute(
+        "INSERT INTO passage_stats (company_id, passages, total_length) VALUES (?,?,?) "
+        "ON CONFLICT(company_id) DO UPDATE SET passages = passages + excluded.passages, "
+        "total_length = total_length + excluded.total_length",
+        (company_id, stored, total_length),
+    )
+    return stored
+
+
+def delete_document(cur, company_id, document):
+    # postings are keyed by term, so re-tokenize the stored text to find them
+    rows = cur.execute(
+        "SELECT id, text, length FROM passages WHERE company_id=? AND document=?", (company_id, document)
+    ).fetchall()
+    if not rows:
+        return 0
+    df = Counter()
+    for passage_id, text, _ in rows:
+        terms = set(tokenize(text))
+        cur.executemany(
+            "DELETE FROM passage_postings WHERE term=? AND company_id=? AND passage_id=?",
+            [(term, company_id, passage_id) for term in terms],
+        )
+        df.update(terms)
+    cur.executemany(
+        "UPDATE passage_terms SET df = df - ? WHERE term=? AND company_id=?",
+        [(n, term, company_id) for term, n in df.items()],
+    )
+    cur.execute("DELETE FROM passage_terms WHERE company_id=? AND df <= 0", (company_id,))
+    cur.execute(
+        "UPDATE passage_stats SET passages = passages - ?, total_length = total_length - ? WHERE company_id=?",
+        (len(rows), sum(r[2] for r in rows), company_id),
+    )
+    cur.execute("DELETE FROM passages WHERE company_id=? AND document=?", (company_id, document))
+    return len(rows)
+
+
+class DocumentWriter:
+    # feeds page text from extraction into the index a batch of pages at a time. the previous
+    # copy of the same document (a re-upload or a retried job) is replaced in the first batch.
+    # finish() writes the rest and bumps the passage version once for the whole document
+
+    def __init__(self, company_id, document, batch_pages=PASSAGE_BATCH_PAGES):
+        self.company_id = company_id
+        self.document = document
+        self.batch_pages = batch_pages
+        self.pending = []
+        self.pages = 0
+        self.stored = 0
+        self.replaced = False
+
+    def add_page(self, page, text):
+        self.pending.extend((page, chunk) for chunk in chunk_page(text or ""))
+        self.pages += 1
+        if self.pages % self.batch_pages == 0:
+            self.flush()
+
+    def flush(self):
+        if not self.pending and self.replaced:
+            return
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            if not self.replaced:
+                delete_document(cur, self.company_id, self.document)
+                self.replaced = True
+            self.stored += write_passages(cur, self.company_id, self.document, self.pending)
+            conn.commit()
+        finally:
+            conn.close()
+        self.pending = []
+
+    def finish(self):
+        self.flush()
+        conn = get_connection()
+        try:
+            bump_passage_version(conn.cursor(), [self.company_id])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+@metrics.timed("passage_index_document")
+def index_document(company_id, document, pages):
+    # pages: iterable of (page number, text)
+    writer = DocumentWriter(company_id, document)
+    for page, text in pages:
+        writer.add_page(page, text)
+    writer.finish()
+    return writer.stored
+
+
+def copy_document(document, company_id):
+    # a re-upload of a known file for another company reuses the passages already chunked for it
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT company_id FROM passages WHERE document=? AND company_id != ? LIMIT 1", (document, company_id)
+        ).fetchone()
+        if not row:
+            return 0
+        passages = conn.execute(
+            "SELECT page, text FROM passages WHERE company_id=? AND document=? ORDER BY id", (row[0], document)
+        ).fetchall()
+        cur = conn.cursor()
+        delete_document(cur, company_id, document)
+        stored = write_passages(cur, company_id, document, passages)
+        bump_passage_version(cur, [company_id])
+        conn.commit()
+    finally:
+        conn.close()
+    return stored
+
+
+def in_scope(company_ids):
+    if company_ids is None:
+        return "", ()
+    return f" AND company_id IN ({','.join('?' * len(company_ids))})", tuple(company_ids)
+
+
+@metrics.timed("passage_search")
+def search(question, company_ids=None, k=PASSAGE_TOP_K):
+    # BM25 over the passages of company_ids (None: every company). returns the top k as dicts
+    terms = list(dict.fromkeys(tokenize(question)))
+    if not terms or company_ids == []:
+        return []
+    scope, scope_params = in_scope(company_ids)
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        total, total_length = cur.execute(
+            "SELECT COALESCE(SUM(passages), 0), COALESCE(SUM(total_length), 0) FROM passage_stats WHERE 1=1" + scope,
+            scope_params,
+        ).fetchone()
+        if not total:
+            return []
+        avg_length = total_length / total
+
+        weighted = []
+        for term in terms:
+            df = cur.execute(
+                "SELECT COALESCE(SUM(df), 0) FROM passage_terms WHERE term=?" + scope, (term, *scope_params)
+            ).fetchone()[0]
+            if df:
+                weighted.append((df, term, math.log(1 + (total - df + 0.5) / (df + 0.5))))
+        if not weighted:
+            return []
+        # the rarest terms say the most; common ones past the cap are left out unless, as in a
+        # company with only a few passages, nothing else would be left
+        weighted.sort()
+        weighted = [w for w in weighted if w[0] <= PASSAGE_MAX_DF * total][:PASSAGE_MAX_TERMS] or weighted[:1]
+
+        ids, scores = [], []
+        for _, term, idf in weighted:
+            rows = cur.execute(
+                "SELECT passage_id, tf, length FROM passage_postings WHERE term=?" + scope, (term, *scope_params)
+            ).fetchall()
+            postings = np.array(rows, dtype=np.float64)
+            tf, length = postings[:, 1], postings[:, 2]
+            ids.append(postings[:, 0].astype(np.int64))
+            scores.append(idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)))
+
+        unique, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        top = np.argsort(-totals)[:k] if len(totals) <= k else np.argpartition(-totals, k)[:k]
+        top = top[np.argsort(-totals[top])]
+        best = [(int(unique[i]), float(totals[i])) for i in top]
+
+        placeholders = ",".join("?" * len(best))
+        rows = cur.execute(
+            "SELECT passages.id, company_id, companies.name, page, text FROM passages "
+            f"JOIN companies ON companies.id = passages.company_id WHERE passages.id IN ({placeholders})",
+            [pid for pid, _ in best],
+        ).fetchall()
+    finally:
+        conn.close()
+    found = {row[0]: row for row in rows}
+    return [
+        {"id": pid, "company_id": found[pid][1], "company": found[pid][2], "page": found[pid][3],
+         "text": found[pid][4], "score": round(score, 3)}
+        for pid, score in best if pid in found
+    ]
+
+
+def render(hits, budget_chars):
+    # best passages first, as many as fit
+    lines = ["Excerpts from uploaded reports:"]
+    used = len(lines[0])
+    shown = 0
+    for hit in hits:
+        line = f"[{hit['company']}, p.{hit['page']}] {hit['text']}"
+        if used + len(line) + 1 > budget_chars:
+            break
+        lines.append(line)
+        used += len(line) + 1
+        shown += 1
+    return ("\n".join(lines) if shown else ""), shown
+
+
+def stats():
+    conn = get_connection()
+    try:
+        passages, total_length = conn.execute(
+            "SELECT COALESCE(SUM(passages), 0), COALESCE(SUM(total_length), 0) FROM passage_stats"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {"passages": passages, "tokens": total_length}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the passages of uploaded reports")
+    parser.add_argument("question")
+    parser.add_argument("company_ids", nargs="*", type=int)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    from db import create_tables
+    create_tables()
+    start = time.perf_counter()
+    hits = search(args.question, args.company_ids or None, k=args.k)
+    print(f"{len(hits)} passages in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for hit in hits:
+        print(f"{hit['score']:7.3f}  {hit['company']} p.{hit['page']}: {hit['text'][:120]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
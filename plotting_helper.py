@@ -1,6 +1,20 @@
-import matplotlib.pyplot as plt
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+import analytics
+import db
+import metrics
 from db import get_connection
 
+# rendered charts keyed on company + data version + format/size; a write to the company's
+# balance sheets bumps its version and also drops its entries here
+CHART_CACHE_SIZE = 64
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+_chart_cache = OrderedDict()
+_chart_lock = threading.Lock()
+
 def fetch_balance_sheet_data(company_name):
     conn = get_connection()
     cur = conn.cursor()
@@ -18,11 +32,13 @@ def fetch_balance_sheet_data(company_name):
     conn.close()
     return rows
 
-def plot_balance_sheet(company_name):
+@metrics.timed("plot_balance_sheet")
+def plot_balance_sheet(company_name, fmt="png", width=10, height=6, dpi=100):
+    # headless: draws on its own Figure (no pyplot state) and returns the image bytes
     rows = fetch_balance_sheet_data(company_name)
     if not rows:
         print(f"No balance sheet data found for {company_name}.")
-        return
+        return None
 
     years = [r[0] for r in rows]
     revenue = [r[1] for r in rows]
@@ -30,36 +46,67 @@ def plot_balance_sheet(company_name):
     liabilities = [r[3] for r in rows]
     profit = [r[4] for r in rows]
 
-    growth = [0] + [((revenue[i] - revenue[i-1])/revenue[i-1])*100 for i in range(1, len(revenue))]
+    growth = analytics.growth_series(revenue)
+
+
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(width, height), dpi=dpi)
+    ax1, ax2, ax3, ax4 = fig.subplots(2, 2).flat
+
+    ax1.plot(years, revenue, marker='o', color='blue')
+    ax1.set_title(f"{company_name} Revenue")
+    ax1.set_xlabel("Year")
+    ax1.set_ylabel("Revenue")
+
+    ax2.plot(years, profit, marker='o', color='green')
+    ax2.set_title(f"{company_name} Profit")
+    ax2.set_xlabel("Year")
+    ax2.set_ylabel("Profit")
+
+    ax3.bar(years, assets, label='Assets', alpha=0.7)
+    ax3.bar(years, liabilities, label='Liabilities', alpha=0.7)
+    ax3.set_title(f"{company_name} Assets vs Liabilities")
+    ax3.set_xlabel("Year")
+    ax3.set_ylabel("Value")
+    ax3.legend()
+
+    ax4.plot(years, growth, marker='o', color='purple')
+    ax4.set_title(f"{company_name} Revenue Growth %")
+    ax4.set_xlabel("Year")
+    ax4.set_ylabel("Growth %")
+
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt)
+    return buf.getvalue()
+
 
+def chart_etag(company_id, fmt, width, height, dpi):
+    version = db.get_data_version(f"company:{company_id}")
+    raw = f"{company_id}|{version}|{fmt}|{width}x{height}@{dpi}"
+    return hashlib.sha1(raw.encode()).hexdigest()
 
-    plt.figure(figsize=(10, 6))
 
-    plt.subplot(2, 2, 1)
-    plt.plot(years, revenue, marker='o', color='blue')
-    plt.title(f"{company_name} Revenue")
-    plt.xlabel("Year")
-    plt.ylabel("Revenue")
+def get_chart(company_id, company_name, etag, fmt="png", width=10, height=6, dpi=100):
+    key = (company_id, etag)
+    with _chart_lock:
+        if key in _chart_cache:
+            _chart_cache.move_to_end(key)
+            return _chart_cache[key]
+    image = plot_balance_sheet(company_name, fmt, width, height, dpi)
+    if image is None:
+        return None
+    with _chart_lock:
+        _chart_cache[key] = image
+        while len(_chart_cache) > CHART_CACHE_SIZE:
+            _chart_cache.popitem(last=False)
+    return image
 
-    plt.subplot(2, 2, 2)
-    plt.plot(years, profit, marker='o', color='green')
-    plt.title(f"{company_name} Profit")
-    plt.xlabel("Year")
-    plt.ylabel("Profit")
 
-    plt.subplot(2, 2, 3)
-    plt.bar(years, assets, label='Assets', alpha=0.7)
-    plt.bar(years, liabilities, label='Liabilities', alpha=0.7)
-    plt.title(f"{company_name} Assets vs Liabilities")
-    plt.xlabel("Year")
-    plt.ylabel("Value")
-    plt.legend()
+def invalidate_charts(company_ids):
+    with _chart_lock:
+        for key in [k for k in _chart_cache if k[0] in company_ids]:
+            del _chart_cache[key]
 
-    plt.subplot(2, 2, 4)
-    plt.plot(years, growth, marker='o', color='purple')
-    plt.title(f"{company_name} Revenue Growth %")
-    plt.xlabel("Year")
-    plt.ylabel("Growth %")
 
-    plt.tight_layout()
-    plt.show()
+db.data_change_listeners.append(invalidate_charts)
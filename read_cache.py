@@ -0,0 +1,84 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", 1024))
+# results bigger than this are served straight from SQLite rather than pinned in memory
+READ_CACHE_MAX_ROWS = int(os.environ.get("READ_CACHE_MAX_ROWS", 5000))
+# how long a worker trusts its last look at the generation stamp; writes made by other
+# workers become visible within this window, writes in this process immediately
+READ_CACHE_RECHECK = float(os.environ.get("READ_CACHE_RECHECK", 1.0))
+
+
+class ReadCache:
+    # read-through cache for query results. every entry remembers the write generation it was
+    # loaded under; all write paths bump the generation in data_versions, so a write in any
+    # gunicorn worker makes every worker's entries stale on their next lookup
+
+    def __init__(self, max_entries=READ_CACHE_SIZE, max_rows=READ_CACHE_MAX_ROWS, recheck=READ_CACHE_RECHECK):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.recheck = recheck
+        self._generation = None
+        self._checked_at = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "uncacheable": 0}
+
+    def generation(self):
+        now = time.monotonic()
+        if self._generation is None or now - self._checked_at >= self.recheck:
+            self._generation = db.get_data_version("generation")
+            self._checked_at = now
+        return self._generation
+
+    def get_or_load(self, key, loader, *args):
+        generation = self.generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry[1]
+            self._counters["stale" if entry else "misses"] += 1
+
+        value = loader(*args)
+        with self._lock:
+            if len(value) > self.max_rows:
+                self._counters["uncacheable"] += 1
+                self._entries.pop(key, None)
+                return value
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+        return value
+
+    def clear(self, company_ids=None):
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"] + stats["stale"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+read_cache = ReadCache()
+# same-process writes free the memory right away instead of waiting for the next lookup
+db.data_change_listeners.append(read_cache.clear)
+
+
+def to_int(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,98 @@
+import analytics
+from db import get_connection
+
+# per-group, per-year sums over companies.parent_group, kept in group_rollups (migration 8).
+# every balance sheet write calls update_rollups() inside its own transaction, recomputing only
+# the (group, year) cells it touched, so readers never see a rollup out of step with the rows
+
+# a cell whose last row went away (a company moved group, a row was removed) must not keep its
+# old total, so every touched cell is cleared first and only re-inserted if rows remain
+CLEAR = "DELETE FROM group_rollups WHERE parent_group = :group AND year = :year"
+RECOMPUTE = """
+    INSERT INTO group_rollups (parent_group, year, companies, revenue, assets, liabilities, profit)
+    SELECT :group, :year, COUNT(*), SUM(revenue), SUM(assets), SUM(liabilities), SUM(profit)
+    FROM companies JOIN balance_sheets ON balance_sheets.company_id = companies.id
+    WHERE companies.parent_group = :group AND balance_sheets.year = :year
+    HAVING COUNT(*) > 0
+"""
+
+
+def update_rollups(cur, keys):
+    # keys: (company_id, year) pairs just written through cur
+    keys = set(keys)
+    if not keys:
+        return
+    company_ids = sorted({cid for cid, _ in keys})
+    groups = {}
+    for start in range(0, len(company_ids), 500):
+        chunk = company_ids[start:start + 500]
+        cur.execute(
+            f"SELECT id, parent_group FROM companies WHERE parent_group IS NOT NULL AND id IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        groups.update(cur.fetchall())
+    cells = {(groups[cid], year) for cid, year in keys if cid in groups}
+    params = [{"group": group, "year": year} for group, year in sorted(cells)]
+    cur.executemany(CLEAR, params)
+    cur.executemany(RECOMPUTE, params)
+
+
+def rebuild_rollups(cur):
+    cur.execute("DELETE FROM group_rollups")
+    cur.execute("""
+        INSERT INTO group_rollups (parent_group, year, companies, revenue, assets, liabilities, profit)
+        SELECT companies.parent_group, balance_sheets.year, COUNT(*), SUM(revenue), SUM(assets),
+               SUM(liabilities), SUM(profit)
+        FROM companies JOIN balance_sheets ON balance_sheets.company_id = companies.id
+        WHERE companies.parent_group IS NOT NULL
+        GROUP BY companies.parent_group, balance_sheets.year
+    """)
+
+
+def list_groups():
+    conn = get_connection()
+    groups = [g for (g,) in conn.execute(
+        "SELECT DISTINCT parent_group FROM companies WHERE parent_group IS NOT NULL ORDER BY parent_group"
+    )]
+    conn.close()
+    return groups
+
+
+def group_members(name):
+    conn = get_connection()
+    members = [{"id": cid, "name": cname} for cid, cname in conn.execute(
+        "SELECT id, name FROM companies WHERE parent_group=? ORDER BY name", (name,)
+    )]
+    conn.close()
+    return members
+
+
+def group_rows(names):
+    # (parent_group, year, companies, revenue, assets, liabilities, profit) ordered by group, year
+    conn = get_connection()
+    rows = conn.execute(
+        "SELECT parent_group, year, companies, revenue, assets, liabilities, profit FROM group_rollups "
+        f"WHERE parent_group IN ({','.join('?' * len(names))}) ORDER BY parent_group, year",
+        list(names),
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def group_summary(name):
+    # the ratios come from analytics, so they read the same as /analytics and the /ask context:
+    # profit_margin and revenue_growth in %, debt_to_asset as a fraction
+    rows = group_rows([name])
+    companies = {year: count for _, year, count, *_ in rows}
+    panel = analytics.build_panel([(0, year, *sums) for _, year, _, *sums in rows])
+    metrics = analytics.all_metrics(panel)
+    fields = ("revenue", "assets", "liabilities", "profit", "equity", "profit_margin", "debt_to_asset")
+    years = []
+    for col, year in enumerate(panel.years.tolist()):
+        if year not in companies:
+            continue
+        entry = {"year": year, "companies": companies[year]}
+        entry.update({field: analytics.to_json(metrics[field][0, col]) for field in fields})
+        entry["revenue_growth"] = analytics.to_json(metrics["revenue_yoy"][0, col])
+        years.append(entry)
+    return years
@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+import os
+
+from db import get_connection
+
+FIELDS = ("company_id", "year", "revenue", "assets", "liabilities", "profit")
+DEFAULT_FIELDS = ("year", "revenue", "assets", "liabilities", "profit")
+PAGE_SIZE = int(os.environ.get("BALANCE_SHEET_PAGE_SIZE", 500))
+PAGE_MAX = int(os.environ.get("BALANCE_SHEET_PAGE_MAX", 5000))
+FETCH_SIZE = 500
+
+
+def parse_fields(value):
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or value}. Allowed: {', '.join(FIELDS)}")
+    return fields
+
+
+# cursors are "<company_id>:<year>" of the last row on the previous page
+def encode_cursor(company_id, year):
+    return f"{company_id}:{year}"
+
+
+def parse_cursor(value):
+    if not value:
+        return None
+    try:
+        company_id, year = value.split(":")
+        return int(company_id), int(year)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(value):
+    if not value:
+        return PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, PAGE_MAX))
+
+
+def build_query(user, fields, company_id=None, year_from=None, year_to=None, after=None, limit=None):
+    # keyset order on (company_id, year) walks the unique idx_company_year index,
+    # so later pages cost the same as the first one
+    columns = ", ".join(("company_id", "year") + tuple(f for f in fields if f not in ("company_id", "year")))
+    query = f"SELECT {columns} FROM balance_sheets WHERE 1=1"
+    params = []
+
+    if user["role"] != "groupadmin":
+        query += " AND company_id=?"
+        params.append(user["company_id"])
+    elif company_id:
+        query += " AND company_id=?"
+        params.append(company_id)
+
+    if year_from:
+        query += " AND year>=?"
+        params.append(year_from)
+    if year_to:
+        query += " AND year<=?"
+        params.append(year_to)
+    if after:
+        query += " AND (company_id, year) > (?, ?)"
+        params.extend(after)
+
+    query += " ORDER BY company_id, year"
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+
+def iter_rows(query, params, fields):
+    # rows come off the cursor in FETCH_SIZE batches; nothing holds the whole result
+    conn = get_connection()
+    try:
+        cur = conn.execute(query, params)
+        names = [d[0] for d in cur.description]
+        index = [names.index(f) for f in fields]
+        while True:
+            batch = cur.fetchmany(FETCH_SIZE)
+            if not batch:
+                break
+            for row in batch:
+                yield row[0], row[1], [row[i] for i in index]
+    finally:
+        conn.close()
+
+
+def fetch_page(user, fields, company_id=None, year_from=None, year_to=None, after=None, limit=PAGE_SIZE):
+    # one extra row tells us whether there is a next page
+    query, params = build_query(user, fields, company_id, year_from, year_to, after, limit + 1)
+    rows, next_cursor = [], None
+    for company, year, values in iter_rows(query, params, fields):
+        if len(rows) == limit:
+            next_cursor = encode_cursor(*last)
+            break
+        rows.append(dict(zip(fields, values)))
+        last = (company, year)
+    return rows, next_cursor
+
+
+def iter_ndjson(query, params, fields):
+    lines = []
+    for _, _, values in iter_rows(query, params, fields):
+        lines.append(json.dumps(dict(zip(fields, values))))
+        if len(lines) == FETCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def iter_csv(query, params, fields):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for i, (_, _, values) in enumerate(iter_rows(query, params, fields), 1):
+        writer.writerow(values)
+        if i % FETCH_SIZE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
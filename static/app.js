@@ -45,17 +45,20 @@ document.getElementById('signupBtn').addEventListener('click', async () => {
 // ----------------- Load Companies -----------------
 async function loadCompanies() {
     const res = await fetch(`${backendUrl}/companies`, {
-        headers: { 'Authorization': JSON.stringify(userToken) }
+        headers: { 'Authorization': `Bearer ${userToken}` }
     });
     const companies = await res.json();
 
-    ['companySelectQuestion','companySelectPlot','companySelectFilter'].forEach(id => {
+    ['companySelectQuestion','companySelectUpload','companySelectPlot','companySelectFilter'].forEach(id => {
         const select = document.getElementById(id);
         select.innerHTML = '';
         companies.forEach(c => {
             select.innerHTML += `<option value="${c.id}">${c.name}</option>`;
         });
     });
+    // an empty company_id lets the server pick the company named in the PDF
+    document.getElementById('companySelectUpload').innerHTML =
+        '<option value="">Detect from PDF</option>' + document.getElementById('companySelectUpload').innerHTML;
 }
 function populateYears() {
     const yearFrom = document.getElementById('yearFrom');
@@ -70,16 +73,45 @@ document.getElementById('askBtn').addEventListener('click', async () => {
     const company_id = document.getElementById('companySelectQuestion').value;
     const question = document.getElementById('questionInput').value;
 
-    const res = await fetch(`${backendUrl}/ask`, {
+    const responseDiv = document.getElementById('response');
+    responseDiv.innerText = '';
+
+    const res = await fetch(`${backendUrl}/ask/stream`, {
         method: 'POST',
         headers: { 
             'Content-Type': 'application/json',
-            'Authorization': JSON.stringify(userToken)
+            'Authorization': `Bearer ${userToken}`
         },
         body: JSON.stringify({ company_id, question })
     });
-    const data = await res.json();
-    document.getElementById('response').innerText = data.answer || data.error || '';
+    if (!res.ok) {
+        const data = await res.json();
+        responseDiv.innerText = data.error || '';
+        return;
+    }
+
+    // server-sent events: "event: <name>" (optional) then "data: <json>", blank line between events
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        events.forEach(raw => {
+            let event = 'message';
+            let payload = null;
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                if (line.startsWith('data: ')) payload = JSON.parse(line.slice(6));
+            });
+            if (!payload) return;
+            if (event === 'error') responseDiv.innerText += `\n${payload.error}`;
+            else if (event === 'message') responseDiv.innerText += payload.token;
+        });
+    }
 });
 
 document.getElementById('uploadBtn').addEventListener('click', async () => {
@@ -88,23 +120,55 @@ document.getElementById('uploadBtn').addEventListener('click', async () => {
 
     const formData = new FormData();
     formData.append('file', fileInput.files[0]);
+    formData.append('company_id', document.getElementById('companySelectUpload').value);
 
     const res = await fetch(`${backendUrl}/upload-pdf`, {
         method: 'POST',
-        headers: { 'Authorization': JSON.stringify(userToken) },
+        headers: { 'Authorization': `Bearer ${userToken}` },
         body: formData
     });
     const data = await res.json();
-    alert(data.success ? "PDF uploaded!" : "Error: " + (data.error || ""));
+    if (!data.success) return alert("Error: " + (data.error || ""));
+
+    const responseDiv = document.getElementById('response');
+    if (data.cached) {
+        responseDiv.innerText = `${data.filename}: ${data.rows_extracted} rows (already extracted before).`;
+        await loadCompanies();
+        return;
+    }
+
+    // extraction runs in the background; poll until the job finishes
+    while (true) {
+        const jobRes = await fetch(`${backendUrl}/ingest/jobs/${data.job_id}`, {
+            headers: { 'Authorization': `Bearer ${userToken}` }
+        });
+        const job = await jobRes.json();
+        responseDiv.innerText = `Processing ${data.filename}: ${job.status}, page ${job.pages_done}/${job.pages_total || '?'}`;
+        if (job.status === 'done') {
+            responseDiv.innerText = `${data.filename}: ${job.rows_extracted} rows extracted.`;
+            break;
+        }
+        if (job.status === 'failed' || job.error) {
+            responseDiv.innerText = `${data.filename} failed: ${(job.errors || []).join('; ') || job.error}`;
+            break;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
     await loadCompanies();
 });
 document.getElementById('plotBtn').addEventListener('click', async () => {
     const companyId = document.getElementById('companySelectPlot').value;
-    const res = await fetch(`${backendUrl}/plot/${companyId}`, {
-        headers: { 'Authorization': JSON.stringify(userToken) }
+    const res = await fetch(`${backendUrl}/plot/${companyId}?format=png`, {
+        headers: { 'Authorization': `Bearer ${userToken}` }
     });
-    const data = await res.json();
-    alert(data.success ? `Plot generated for ${data.company}` : "Error: " + (data.error || ""));
+    if (!res.ok) {
+        const data = await res.json();
+        return alert("Error: " + (data.error || ""));
+    }
+    const img = document.getElementById('plotImg');
+    if (img.src) URL.revokeObjectURL(img.src);
+    img.src = URL.createObjectURL(await res.blob());
+    img.style.display = 'block';
 });
 document.getElementById('viewBtn').addEventListener('click', async () => {
     const companyId = document.getElementById('companySelectFilter').value;
@@ -112,7 +176,7 @@ document.getElementById('viewBtn').addEventListener('click', async () => {
     const year_to = document.getElementById('yearTo').value;
 
     const res = await fetch(`${backendUrl}/balance_sheet_filtered?company_id=${companyId}&year_from=${year_from}&year_to=${year_to}`, {
-        headers: { 'Authorization': JSON.stringify(userToken) }
+        headers: { 'Authorization': `Bearer ${userToken}` }
     });
     const data = await res.json();
 
@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# the modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# read at import time: cheap password hashes, a fixed signing key, and no HF token needed.
+# model calls go to a fake_llm server started per test (see the fake_llm fixture)
+os.environ.setdefault("AUTH_PASSWORD_COST", "1000")
+os.environ.setdefault("AUTH_SECRET", "test-secret")
+os.environ.setdefault("INFERENCE_BASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("LLM_PROVIDERS", "hf")
+os.environ.setdefault("INGEST_EMBEDDED_WORKERS", "0")
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # points the connection pool at a scratch database for the length of the test. Idle
+    # connections are per thread, so pool threads (ask_pool workers) drop theirs too
+    db.pool.close_idle()
+    monkeypatch.setattr(db.pool, "_local", threading.local())
+    monkeypatch.setattr(db.pool, "db_name", str(tmp_path / "test.db"))
+    yield db.pool.db_name
+    db.pool.close_idle()
+
+
+@pytest.fixture
+def app(database, tmp_path, monkeypatch):
+    # the Flask app on a seeded scratch database, uploads under tmp_path
+    monkeypatch.chdir(tmp_path)
+    import app as app_module
+    import extract_pdf
+    import plotting_helper
+    from answer_cache import answer_cache
+    from read_cache import read_cache
+
+    # in-process caches are keyed on data versions, which start over with every database
+    read_cache.clear()
+    with answer_cache._lock:
+        answer_cache._entries.clear()
+    with plotting_helper._chart_lock:
+        plotting_helper._chart_cache.clear()
+    extract_pdf._name_index["generation"] = None
+
+    flask_app = app_module.create_app()
+    db.seed_data()
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, username="ambani", password="ambani123"):
+    response = client.post("/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.get_json()
+    return {"Authorization": f"Bearer {response.get_json()['token']}"}
+
+
+def serve_fake_llm():
+    # fake_llm.py on a free port; tests change its behaviour with server.settings.update(...)
+    import fake_llm as fake
+
+    server = fake.serve(0, latency=0, token_delay=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    return server
+
+
+def router(server, name, **kwargs):
+    # the OpenAI-compatible provider against a fake_llm server; it makes no retries of its own
+    import llm
+
+    return llm.RouterProvider(name, "fake", api_key="test", base_url=f"{server.url}/v1", timeout=5, **kwargs)
+
+
+def stop_fake_llm(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_llm():
+    server = serve_fake_llm()
+    yield server
+    stop_fake_llm(server)
+
+
+@pytest.fixture
+def second_llm():
+    # a second provider for failover and hedging
+    server = serve_fake_llm()
+    yield server
+    stop_fake_llm(server)
+
+
+@pytest.fixture
+def model(app, fake_llm, monkeypatch):
+    # the app's LLM client pointed at the fake_llm server, without retries or hedging
+    import app as app_module
+    import llm
+
+    client = llm.LLMClient([router(fake_llm, "fake")], retries=0, backoff=0.01, backoff_max=0.02, hedge_after=0, deadline=10)
+    monkeypatch.setattr(app_module, "llm_client", client)
+    return fake_llm
+
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    # the app's ask pool cut to one worker and no queue, so a single call in flight fills it
+    import app as app_module
+    from ask_pool import AskPool
+
+    pool = AskPool(workers=1, max_pending=0, timeout=5)
+    monkeypatch.setattr(app_module, "ask_pool", pool)
+    yield pool
+    if pool._executor:
+        pool._executor.shutdown(wait=True)
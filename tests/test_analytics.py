@@ -0,0 +1,30 @@
+import analytics
+from context_builder import derive
+
+ROWS = [
+    (1, 2021, 100.0, 500.0, 200.0, 10.0),
+    (1, 2022, None, 520.0, 210.0, 12.0),  # revenue missing, the rest reported
+    (1, 2023, 121.0, 540.0, 220.0, 15.0),
+]
+
+
+def test_year_without_revenue_is_kept():
+    panel = analytics.build_panel(ROWS, {1: "A"})
+    series = analytics.company_series(panel, 1)
+    assert [entry["year"] for entry in series] == [2021, 2022, 2023]
+    assert series[1]["revenue"] is None and series[1]["assets"] == 520.0
+    assert series[1]["equity"] == 310.0
+
+    lines = derive(panel, analytics.all_metrics(panel), 0)
+    assert [year for year, _ in lines] == [2021, 2022, 2023]
+    assert lines[1][1].startswith("2022 | - | 520 | 210 | 12 | 310")
+
+
+def test_growth_and_latest_year():
+    panel = analytics.build_panel(ROWS + [(2, 2024, None, 10.0, 5.0, None)], {1: "A", 2: "B"})
+    summary = analytics.summary(panel)
+    assert summary["year"] == 2024
+    series = analytics.company_series(panel, 1)
+    assert series[0]["revenue_yoy"] is None and series[2]["revenue_yoy"] is None
+    assert series[2]["profit_yoy"] == 25.0
+    assert series[0]["profit_margin"] == 10.0
@@ -0,0 +1,66 @@
+from conftest import login
+
+import db
+from answer_cache import answer_cache
+
+
+def ask(client, headers, question="What was revenue?", company_id=1):
+    response = client.post("/ask", headers=headers, json={"question": question, "company_id": company_id})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_repeat_and_reworded_questions_are_answered_from_cache(client, model):
+    headers = login(client)
+    assert ask(client, headers)["cached"] is False
+    assert ask(client, headers, "Please what was revenue")["cached"] is True
+    assert model.requests == 1
+
+
+def test_answers_that_start_with_a_bracket_are_cached(client, model):
+    model.settings.update(answer="[1] Revenue grew")
+    headers = login(client)
+    assert ask(client, headers)["answer"] == "[1] Revenue grew"
+    assert ask(client, headers) == {"answer": "[1] Revenue grew", "cached": True}
+
+
+def test_failed_model_calls_are_not_cached(client, model):
+    model.settings.update(error_rate=1)
+    headers = login(client)
+    assert ask(client, headers)["answer"].startswith("[Error contacting DeepSeek:")
+    model.settings.update(error_rate=0)
+    assert ask(client, headers)["cached"] is False
+    assert ask(client, headers)["cached"] is True
+
+
+def test_a_write_makes_the_company_and_group_answers_stale(client, model):
+    headers = login(client)
+    ask(client, headers)
+    ask(client, headers, company_id=2)
+    ask(client, headers, company_id=None)
+    db.add_balance_sheet_data("Reliance Retail", 2024, 1, 2, 3, 4)
+    assert ask(client, headers)["cached"] is False
+    assert ask(client, headers, company_id=None)["cached"] is False
+    assert ask(client, headers, company_id=2)["cached"] is True
+
+
+def test_new_report_text_makes_answers_stale(client, model):
+    headers = login(client)
+    ask(client, headers)
+    conn = db.get_connection()
+    db.bump_passage_version(conn.cursor(), [1])
+    conn.commit()
+    conn.close()
+    assert ask(client, headers)["cached"] is False
+
+
+def test_answers_are_shared_through_the_database(client, model):
+    headers = login(client)
+    ask(client, headers)
+    # another gunicorn worker starts with an empty in-process cache
+    with answer_cache._lock:
+        answer_cache._entries.clear()
+    shared = answer_cache.stats()["shared_hits"]
+    assert ask(client, headers)["cached"] is True
+    assert answer_cache.stats()["shared_hits"] == shared + 1
+    assert model.requests == 1
@@ -0,0 +1,84 @@
+import threading
+import time
+
+from conftest import login
+
+from ask_pool import AskPool, QueueFull
+
+
+def poll(client, headers, job_id):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        body = client.get(f"/ask/jobs/{job_id}", headers=headers).get_json()
+        if body["status"] in ("done", "failed"):
+            return body
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_a_full_pool_answers_429(client, model, pool):
+    headers = login(client)
+    release = threading.Event()
+    pool.submit(0, release.wait)
+    try:
+        for path in ("/ask", "/ask/jobs"):
+            response = client.post(path, headers=headers, json={"question": "What was revenue?", "company_id": 1})
+            assert response.status_code == 429, path
+        response = client.post("/ask/batch", headers=headers, json={"items": [{"company_id": 1, "question": "What was revenue?"}]})
+        assert response.get_json()["results"][0]["error"].startswith("Too many questions")
+    finally:
+        release.set()
+    assert pool.stats()["rejected"] == 3
+    assert model.requests == 0
+
+
+def test_a_slow_model_answers_504_and_frees_its_slot(client, model, pool):
+    model.settings.update(latency=0.5)
+    pool.timeout = 0.1
+    headers = login(client)
+    response = client.post("/ask", headers=headers, json={"question": "What was revenue?", "company_id": 1})
+    assert response.status_code == 504
+    assert pool.stats()["timed_out"] == 1
+    # the call runs on in the pool and gives its slot back when the model answers
+    deadline = time.monotonic() + 5
+    while pool.stats()["completed"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    pool.run(0, time.sleep, 0)
+
+
+def test_queued_job_is_polled_from_the_database(client, model, pool):
+    model.settings.update(answer="Revenue was 100.")
+    headers = login(client)
+    response = client.post("/ask/jobs", headers=headers, json={"question": "What was revenue?", "company_id": 1})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert poll(client, headers, job_id)["answer"] == "Revenue was 100."
+
+    # another gunicorn worker has its own pool and no memory of the job, only the ask_jobs row
+    owner = client.post("/login", json={"username": "ambani", "password": "ambani123"}).get_json()["user"]["id"]
+    assert AskPool().status(job_id, owner)["answer"] == "Revenue was 100."
+    assert client.get(f"/ask/jobs/{job_id}", headers=login(client, "rajiv", "pass123")).status_code == 404
+
+
+def test_failed_job_reports_the_error(client, model, pool):
+    model.settings.update(error_rate=1)
+    headers = login(client)
+    response = client.post("/ask/jobs", headers=headers, json={"question": "What was revenue?", "company_id": 1})
+    body = poll(client, headers, response.get_json()["job_id"])
+    assert body["status"] == "failed"
+    assert body["error"]
+    assert pool.stats()["failed"] == 1
+
+
+def test_run_many_keeps_order_and_reports_a_full_pool():
+    pool = AskPool(workers=2, max_pending=0, timeout=5)
+    results = pool.run_many(0, [(time.sleep, (0.05,)), (lambda: 2, ()), (lambda: 3, ())], parallelism=5)
+    assert results == [None, 2, 3]
+    release = threading.Event()
+    pool.submit(0, release.wait)
+    pool.submit(0, release.wait)
+    try:
+        assert isinstance(pool.run_many(0, [(lambda: 1, ())], parallelism=1)[0], QueueFull)
+    finally:
+        release.set()
+    pool._executor.shutdown(wait=True)
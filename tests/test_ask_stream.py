@@ -0,0 +1,70 @@
+import json
+
+from conftest import login, router
+
+import llm
+
+
+def stream(client, headers, question="What was revenue?", company_id=1):
+    # the SSE body as (event, data) pairs
+    response = client.post("/ask/stream", headers=headers, json={"question": question, "company_id": company_id})
+    assert response.status_code == 200, response.get_json()
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    response.close()
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return events
+
+
+def test_tokens_stream_then_a_done_event(client, model, pool):
+    model.settings.update(answer="Revenue grew ten percent")
+    headers = login(client)
+    events = stream(client, headers)
+    tokens = [data["token"] for event, data in events if event == "message"]
+    assert "".join(tokens) == "Revenue grew ten percent"
+    assert len(tokens) == 4
+    event, done = events[-1]
+    assert event == "done" and done["cached"] is False and done["tokens"] == 4
+    assert pool.stats()["streams"] == 1
+
+    # the whole answer is cached and replayed as one token
+    assert stream(client, headers) == [
+        ("message", {"token": "Revenue grew ten percent"}),
+        ("done", {"cached": True, "tokens": 1, "ttft": 0.0, "total": 0.0}),
+    ]
+    assert model.requests == 1
+
+
+def test_model_failure_ends_with_an_error_event_and_frees_the_slot(client, model, pool):
+    model.settings.update(error_rate=1)
+    headers = login(client)
+    event, data = stream(client, headers)[-1]
+    assert event == "error" and data["error"].startswith("Error contacting DeepSeek")
+    # nothing cached, and the one slot is free for the next question
+    model.settings.update(error_rate=0)
+    assert stream(client, headers)[-1][0] == "done"
+
+
+def test_a_full_pool_answers_429(client, model, pool):
+    headers = login(client)
+    assert pool.try_reserve()
+    try:
+        response = client.post("/ask/stream", headers=headers, json={"question": "What was revenue?"})
+        assert response.status_code == 429
+    finally:
+        pool.release_reserved()
+
+
+def test_fails_over_before_the_first_token(client, fake_llm, second_llm, pool, monkeypatch):
+    import app as app_module
+
+    fake_llm.settings.update(error_rate=1)
+    second_llm.settings.update(answer="from b")
+    c = llm.LLMClient([router(fake_llm, "a"), router(second_llm, "b")], retries=0, hedge_after=0)
+    monkeypatch.setattr(app_module, "llm_client", c)
+    events = stream(client, login(client))
+    assert [data["token"] for event, data in events if event == "message"] == ["from", " b"]
+    assert c.stats()["failovers"] == 1
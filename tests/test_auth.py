@@ -0,0 +1,65 @@
+import json
+
+from conftest import login
+
+import auth
+import db
+
+
+def companies(client, headers):
+    return client.get("/companies", headers=headers)
+
+
+def test_login_rejects_missing_and_wrong_credentials(client):
+    for body in ({}, {"username": "ambani"}, {"username": "ambani", "password": 123}, {"username": "", "password": ""}):
+        assert client.post("/login", json=body).status_code == 400, body
+    assert client.post("/login", json={"username": "ambani", "password": "wrong"}).status_code == 401
+    assert client.post("/login", json={"username": "nobody", "password": "ambani123"}).status_code == 401
+
+
+def test_requests_without_a_valid_token_are_refused(client):
+    token = login(client)["Authorization"][len("Bearer "):]
+    payload, _, signature = token.partition(".")
+    claims = json.loads(auth.b64decode(payload))
+    forged = auth.b64encode(json.dumps({**claims, "company_id": 2}).encode())
+    for value in (None, "", "Bearer ", "Bearer nonsense", f"Bearer {forged}.{signature}",
+                  f"Bearer {payload}.{signature[:-2]}", "Bearer é.ü"):
+        headers = {} if value is None else {"Authorization": value}
+        assert companies(client, headers).status_code == 401, value
+        assert client.get("/plot/1", headers=headers).status_code == 401, value
+
+
+def test_expired_tokens_are_refused_even_when_cached(client, monkeypatch):
+    headers = login(client)
+    assert companies(client, headers).status_code == 200
+    assert auth.token_cache.stats()["size"] >= 1
+    monkeypatch.setattr(auth.time, "time", lambda: 10 ** 12)
+    assert companies(client, headers).status_code == 401
+
+    monkeypatch.undo()
+    expired = auth.issue_token({"id": 5, "username": "ambani", "role": "groupadmin", "company_id": None}, ttl=-1)
+    assert companies(client, {"Authorization": f"Bearer {expired}"}).status_code == 401
+
+
+def test_non_admins_only_see_their_own_company(client):
+    headers = login(client, "rajiv", "pass123")
+    assert [c["id"] for c in companies(client, headers).get_json()] == [1]
+    assert client.get("/plot/2", headers=headers).status_code == 403
+    # a company filter from a non-admin is ignored in favour of their own
+    own = client.get("/balance_sheet_filtered", headers=headers).get_json()["balance_sheets"]
+    other = client.get("/balance_sheet_filtered", headers=headers, query_string={"company_id": 2})
+    assert other.get_json()["balance_sheets"] == own
+    assert len(companies(client, login(client)).get_json()) == 3
+
+
+def test_plain_text_passwords_are_hashed_on_login(client):
+    conn = db.get_connection()
+    conn.execute("UPDATE users SET password='pass123' WHERE username='rajiv'")
+    conn.commit()
+    login(client, "rajiv", "pass123")
+    stored = conn.execute("SELECT password FROM users WHERE username='rajiv'").fetchone()[0]
+    conn.close()
+    assert stored.startswith("pbkdf2_sha256$")
+    assert auth.verify_password("pass123", stored) == (True, False)
+    assert auth.verify_password("pass123", "pbkdf2_sha256$x$y$z") == (False, False)
+    assert auth.verify_password("pass123", "pbkdf2_sha256$0$AA$AA") == (False, False)
@@ -0,0 +1,96 @@
+import io
+import json
+
+from conftest import login
+
+import bulk_load
+import db
+
+
+def sheet(company_id):
+    conn = db.get_connection()
+    rows = conn.execute(
+        "SELECT year, revenue, assets, liabilities, profit FROM balance_sheets WHERE company_id=? ORDER BY year",
+        (company_id,),
+    ).fetchall()
+    conn.close()
+    return rows
+
+
+def rollup(group, year):
+    conn = db.get_connection()
+    row = conn.execute("SELECT companies, revenue FROM group_rollups WHERE parent_group=? AND year=?",
+                       (group, year)).fetchone()
+    conn.close()
+    return row
+
+
+def test_excel_csv_upserts_rows_and_rollups(app, tmp_path):
+    path = tmp_path / "rows.csv"
+    path.write_text("﻿Company;Year;Revenue;Assets;Liabilities;Profit\n"
+                    "reliance retail;2024;1,000;2000;(300);₹ 50\n"
+                    "Jio Platforms;2024;10;20;30;40\n"
+                    "Reliance Retail;2022;7;8;9;10\n", encoding="utf-8")
+    result = bulk_load.load_file(str(path), batch_size=2)
+    assert (result["rows_written"], result["rows_skipped"], result["batches"]) == (3, 0, 2)
+    assert sheet(1)[0] == (2022, 7, 8, 9, 10)
+    assert sheet(1)[-1] == (2024, 1000, 2000, -300, 50)
+    assert rollup("Reliance Group", 2024) == (2, 1010)
+
+    # loading again updates in place
+    path.write_text("company,year,revenue,assets,liabilities,profit\nReliance Retail,2024,5,6,7,8\n")
+    assert bulk_load.load_file(str(path))["rows_written"] == 1
+    assert [r for r in sheet(1) if r[0] == 2024] == [(2024, 5, 6, 7, 8)]
+    assert rollup("Reliance Group", 2024) == (2, 15)
+
+
+def test_a_repeated_row_keeps_the_last_one_in_the_file(app):
+    lines = [{"company_id": 2, "year": 2024, "revenue": n, "assets": 1, "liabilities": 1, "profit": 1} for n in (3, 1, 2)]
+    lines.insert(1, {"company_id": 1, "year": 2021, "revenue": 9, "assets": 9, "liabilities": 9, "profit": 9})
+    stream = io.StringIO("".join(json.dumps(line) + "\n" for line in lines))
+    assert bulk_load.load_stream(stream, "jsonl")["rows_written"] == 4
+    assert sheet(2)[-1] == (2024, 2, 1, 1, 1)
+
+
+def test_bad_rows_are_skipped_and_reported_by_line(app):
+    stream = io.StringIO(
+        "company,year,revenue,assets,liabilities,profit\n"
+        "Reliance Retail,2024,1,2,3,4\n"
+        "Reliance Retail,1e400,1,2,3,4\n"
+        "Reliance Retail,202223,1,2,3,4\n"
+        "Reliance Retail,2025,nan,2,3,4\n"
+        "Reliance Retail,2025,1,inf,,4\n"
+        "New Co,2025,x,2,3,4\n"
+        "Nobody Ltd,2025,1,2,3,4\n"
+    )
+    result = bulk_load.load_stream(stream, "csv", create_companies=False)
+    assert (result["rows_written"], result["rows_skipped"]) == (1, 6)
+    assert [e.split(":")[0] for e in result["errors"]] == [f"line {n}" for n in range(3, 9)]
+    assert "assets, liabilities" in result["errors"][3]
+    assert "unknown company 'Nobody Ltd'" in result["errors"][5]
+
+    # a row that fails validation never creates its company
+    stream = io.StringIO("company,year,revenue,assets,liabilities,profit\nNew Co,2025,x,2,3,4\nOther Co,2025,1,2,3,4\n")
+    result = bulk_load.load_stream(stream, "csv", create_companies=True)
+    assert result["companies_created"] == 1
+    conn = db.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM companies WHERE name='New Co'").fetchone()[0] == 0
+    conn.close()
+
+
+def test_upload_is_limited_to_the_users_company(client):
+    headers = login(client, "rajiv", "pass123")
+    data = "company_id,year,revenue,assets,liabilities,profit\n1,2024,1,2,3,4\n2,2024,1,2,3,4\n"
+    response = client.post("/upload-bulk", headers=headers,
+                           data={"file": (io.BytesIO(data.encode()), "rows.csv")})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body["rows_written"], body["rows_skipped"]) == (1, 1)
+    assert "access denied" in body["errors"][0]
+    assert sheet(2)[-1][0] == 2023
+
+    response = client.post("/upload-bulk", headers=headers,
+                           data={"file": (io.BytesIO(data.encode()), "rows.csv"), "company_id": "2"})
+    assert response.status_code == 403
+    response = client.post("/upload-bulk", headers=headers, data={"file": (io.BytesIO(b"x"), "rows.xlsx")})
+    assert response.status_code == 400
@@ -0,0 +1,31 @@
+import tracemalloc
+
+import db
+import extract_pdf
+from benchmarks.fixtures import make_report_pdf
+
+
+def peak_mb(path):
+    tracemalloc.start()
+    try:
+        extract_pdf.extract_and_store(str(path), None, company_id=1)
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def test_peak_memory_does_not_grow_with_page_count(database, tmp_path, monkeypatch):
+    # pages are read and released one at a time, so a report four times as long should peak
+    # at about the same heap (see benchmarks/memory.py for the full-size run)
+    db.create_tables()
+    db.seed_data()
+    # tracemalloc only sees this process, so keep extraction in it
+    monkeypatch.setattr(extract_pdf, "EXTRACT_WORKERS", 1)
+    short = make_report_pdf(tmp_path / "short.pdf", pages=10, table_every=3)
+    long = make_report_pdf(tmp_path / "long.pdf", pages=40, table_every=3, seed=1)
+    # the first document pays for pdfminer's lazy imports and font caches
+    peak_mb(short)
+
+    short_peak, long_peak = peak_mb(short), peak_mb(long)
+    assert long_peak < 8
+    assert long_peak < short_peak * 1.5 + 0.5, (short_peak, long_peak)
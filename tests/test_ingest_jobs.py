@@ -0,0 +1,36 @@
+import time
+
+import ingest_jobs
+from db import get_connection
+from migrations import migrate
+
+
+def expire_lease(job_id):
+    conn = get_connection()
+    conn.execute("UPDATE ingest_jobs SET updated=? WHERE id=?", (time.time() - ingest_jobs.INGEST_LEASE - 1, job_id))
+    conn.commit()
+    conn.close()
+
+
+def test_lost_lease_is_retried_until_max_attempts(database):
+    migrate()
+    job_id, created = ingest_jobs.submit("/tmp/x.pdf", "x.pdf", {"id": 1}, 1, "hash")
+    assert created
+
+    for attempt in range(1, ingest_jobs.INGEST_MAX_ATTEMPTS + 1):
+        job = ingest_jobs.claim_job()
+        assert job["id"] == job_id
+        assert ingest_jobs.get_job(job_id)["attempts"] == attempt
+        expire_lease(job_id)  # the worker died without a word
+
+    assert ingest_jobs.claim_job() is None
+    job = ingest_jobs.get_job(job_id)
+    assert job["status"] == "failed"
+    assert job["errors"] == [f"attempt {ingest_jobs.INGEST_MAX_ATTEMPTS}: worker lost"]
+
+
+def test_same_file_is_queued_once(database):
+    migrate()
+    first, _ = ingest_jobs.submit("/tmp/x.pdf", "x.pdf", {"id": 1}, 1, "hash")
+    second, created = ingest_jobs.submit("/tmp/y.pdf", "y.pdf", {"id": 1}, 1, "hash")
+    assert second == first and not created
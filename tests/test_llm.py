@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from conftest import router
+
+import llm
+
+
+def client(*providers, **kwargs):
+    kwargs = {"retries": 2, "backoff": 0.01, "backoff_max": 0.02, "hedge_after": 0, "deadline": 10, **kwargs}
+    return llm.LLMClient(list(providers), **kwargs)
+
+
+def test_fails_over_to_the_next_provider(fake_llm, second_llm):
+    fake_llm.settings.update(error_rate=1)
+    second_llm.settings.update(answer="from b")
+    c = client(router(fake_llm, "a"), router(second_llm, "b"))
+    assert c.complete("q") == "from b"
+    assert c.stats()["failovers"] == 1
+
+
+def test_retries_retryable_errors_then_gives_up(fake_llm):
+    fake_llm.settings.update(error_rate=1, error_status=503)
+    c = client(router(fake_llm, "a"))
+    with pytest.raises(llm.LLMUnavailable):
+        c.complete("q")
+    assert fake_llm.requests == 3
+    assert c.stats()["retries"] == 2
+
+
+def test_bad_requests_are_not_retried_and_never_open_the_breaker(fake_llm):
+    fake_llm.settings.update(error_rate=1, error_status=400)
+    provider = router(fake_llm, "a")
+    provider.breaker = llm.CircuitBreaker(failures=2, cooldown=60)
+    c = client(provider)
+    for n in range(5):
+        with pytest.raises(llm.LLMUnavailable):
+            c.complete(f"q{n}")
+    assert fake_llm.requests == 5
+    assert provider.breaker.state == "closed"
+
+
+def test_breaker_opens_and_short_circuits(fake_llm):
+    fake_llm.settings.update(error_rate=1, error_status=503)
+    provider = router(fake_llm, "a")
+    provider.breaker = llm.CircuitBreaker(failures=2, cooldown=60)
+    c = client(provider, retries=0)
+    for n in range(2):
+        with pytest.raises(llm.LLMUnavailable):
+            c.complete(f"q{n}")
+    assert provider.breaker.state == "open"
+    with pytest.raises(llm.LLMUnavailable):
+        c.complete("q2")
+    assert fake_llm.requests == 2
+    assert c.stats()["short_circuited"] == 1
+
+
+def test_slow_provider_is_hedged(fake_llm, second_llm):
+    fake_llm.settings.update(latency=2, answer="from a")
+    second_llm.settings.update(answer="from b")
+    c = client(router(fake_llm, "a"), router(second_llm, "b"), hedge_after=0.1)
+    started = time.monotonic()
+    assert c.complete("q") == "from b"
+    assert time.monotonic() - started < 1.5
+    assert c.stats()["hedge_wins"] == 1
+
+
+def test_identical_prompts_in_flight_share_one_call(fake_llm):
+    from concurrent.futures import ThreadPoolExecutor
+
+    fake_llm.settings.update(latency=0.3)
+    c = client(router(fake_llm, "a"))
+    with ThreadPoolExecutor(4) as pool:
+        answers = list(pool.map(c.complete, ["same"] * 4))
+    assert len(set(answers)) == 1
+    assert fake_llm.requests == 1
+
+
+def test_stream_fails_over_before_the_first_token(fake_llm, second_llm):
+    fake_llm.settings.update(error_rate=1, error_status=503)
+    second_llm.settings.update(answer="streamed from b")
+    c = client(router(fake_llm, "a"), router(second_llm, "b"))
+    assert "".join(c.stream("q")) == "streamed from b"
+    assert c.stats()["failovers"] == 1
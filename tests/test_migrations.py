@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+from auth import verify_password
+from migrations import MIGRATIONS, check_query_plans, migrate
+
+# the users table as the app first created it, and as an older copy that only knew 'family'
+USERS_GROUPADMIN = "CHECK(role IN ('analyst','ceo','GroupAdmin'))"
+USERS_FAMILY = "CHECK(role IN ('analyst','ceo','family'))"
+
+
+def make_old_database(path, role_check, admin_role):
+    # the schema before migrations: no unique (company_id, year), plain-text passwords
+    conn = sqlite3.connect(path)
+    conn.executescript(f"""
+        CREATE TABLE companies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            parent_group TEXT
+        );
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL {role_check},
+            company_id INTEGER,
+            FOREIGN KEY(company_id) REFERENCES companies(id)
+        );
+        CREATE TABLE balance_sheets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            revenue REAL,
+            assets REAL,
+            liabilities REAL,
+            profit REAL,
+            FOREIGN KEY(company_id) REFERENCES companies(id)
+        );
+    """)
+    conn.execute("INSERT INTO companies (name, parent_group) VALUES ('Reliance Retail', 'Reliance Group')")
+    conn.executemany(
+        "INSERT INTO users (username, password, role, company_id) VALUES (?,?,?,?)",
+        [("rajiv", "pass123", "analyst", 1), ("ambani", "ambani123", admin_role, None)],
+    )
+    conn.executemany(
+        "INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit) VALUES (?,?,?,?,?,?)",
+        [(1, 2022, 100, 500, 200, 30), (1, 2023, 150, 520, 210, 35), (1, 2022, 220, 500, 200, 31)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_fresh_database_uses_indexes(database):
+    assert migrate() == [number for number, _ in MIGRATIONS]
+    assert migrate() == []
+    assert check_query_plans() == []
+
+
+@pytest.mark.parametrize("role_check, admin_role", [(USERS_GROUPADMIN, "GroupAdmin"), (USERS_FAMILY, "family")])
+def test_old_database(database, role_check, admin_role):
+    make_old_database(database, role_check, admin_role)
+    migrate()
+    assert check_query_plans() == []
+
+    conn = sqlite3.connect(database)
+    # duplicate years collapse to the newest row
+    rows = conn.execute("SELECT year, revenue, profit FROM balance_sheets ORDER BY year").fetchall()
+    assert rows == [(2022, 220, 31), (2023, 150, 35)]
+
+    users = dict(conn.execute("SELECT username, password FROM users"))
+    assert all(stored.startswith("pbkdf2_sha256$") for stored in users.values())
+    assert verify_password("pass123", users["rajiv"])[0]
+    assert verify_password("ambani123", users["ambani"])[0]
+
+    roles = dict(conn.execute("SELECT username, role FROM users"))
+    assert roles == {"rajiv": "analyst", "ambani": "GroupAdmin"}
+    users_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name='users'").fetchone()[0]
+    assert "'family'" in users_sql and "'GroupAdmin'" in users_sql
+    conn.close()
+
+
+def test_spare_py_database_maps_leftover_family_rows(database):
+    make_old_database(database, "CHECK(role IN ('analyst','ceo','family','GroupAdmin'))", "family")
+    migrate()
+    conn = sqlite3.connect(database)
+    assert conn.execute("SELECT role FROM users WHERE username='ambani'").fetchone() == ("GroupAdmin",)
+    conn.close()
@@ -0,0 +1,28 @@
+import db
+import passage_index
+from migrations import migrate
+
+TEXT = "Currency risk from imported inputs was hedged through forward contracts during the year under review."
+
+
+def test_long_document_bumps_passage_version_once(database):
+    migrate()
+    conn = db.get_connection()
+    conn.execute("INSERT INTO companies (id, name) VALUES (1, 'A')")
+    conn.commit()
+    conn.close()
+    changes = []
+    db.data_change_listeners.append(changes.append)
+    try:
+        stored = passage_index.index_document(1, "doc", [(page, TEXT) for page in range(1, 101)])
+    finally:
+        db.data_change_listeners.remove(changes.append)
+
+    assert stored == 100
+    assert db.get_data_version("passages:1") == 1
+    assert db.get_data_version("passages:all") == 1
+    # balance sheet caches (read_cache, charts) have nothing to drop
+    assert db.get_data_version("generation") == 0
+    assert db.get_data_version("company:1") == 0
+    assert changes == []
+    assert passage_index.search("currency hedged", [1])
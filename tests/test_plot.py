@@ -0,0 +1,29 @@
+from conftest import login
+
+import db
+
+
+def test_chart_is_cached_until_the_company_changes(client):
+    headers = login(client)
+    first = client.get("/plot/1", headers=headers)
+    assert first.status_code == 200 and first.mimetype == "image/png"
+    etag = first.headers["ETag"]
+
+    again = client.get("/plot/1", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+
+    # another company's write leaves the chart alone, this company's replaces it
+    db.add_balance_sheet_data("Jio Platforms", 2024, 1, 2, 3, 4)
+    assert client.get("/plot/1", headers={**headers, "If-None-Match": etag}).status_code == 304
+    db.add_balance_sheet_data("Reliance Retail", 2024, 1, 2, 3, 4)
+    changed = client.get("/plot/1", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+
+def test_bad_sizes_and_access(client):
+    headers = login(client)
+    for params in ({"width": "nan"}, {"height": "inf"}, {"width": "-inf"}, {"format": "gif"}):
+        assert client.get("/plot/1", headers=headers, query_string=params).status_code == 400, params
+    assert client.get("/plot/1", headers=headers, query_string={"width": 1000, "format": "svg"}).status_code == 200
+    analyst = login(client, "sneha", "pass123")
+    assert client.get("/plot/1", headers=analyst).status_code == 403
@@ -0,0 +1,46 @@
+from conftest import login
+
+import db
+from read_cache import read_cache
+
+
+def sheets(client, headers, **params):
+    response = client.get("/balance_sheet_filtered", headers=headers, query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["balance_sheets"]
+
+
+def test_bad_filters_are_rejected(client):
+    headers = login(client)
+    for params in ({"company_id": "abc"}, {"year_from": "2020x"}, {"year_to": "1.5"},
+                   {"company_id": "x", "limit": 10}, {"year_from": "x", "format": "ndjson"}):
+        response = client.get("/balance_sheet_filtered", headers=headers, query_string=params)
+        assert response.status_code == 400, params
+    assert len(sheets(client, headers, company_id=1)) == 2
+
+
+def test_write_in_this_process_is_seen_at_once(client):
+    headers = login(client)
+    assert [r["year"] for r in sheets(client, headers, company_id=1)] == [2022, 2023]
+    hits = read_cache.stats()["hits"]
+    sheets(client, headers, company_id=1)
+    assert read_cache.stats()["hits"] == hits + 1
+
+    db.add_balance_sheet_data("Reliance Retail", 2024, 1, 2, 3, 4)
+    assert [r["year"] for r in sheets(client, headers, company_id=1)] == [2022, 2023, 2024]
+
+
+def test_write_by_another_worker_is_seen_after_recheck(client, monkeypatch):
+    headers = login(client)
+    monkeypatch.setattr(read_cache, "recheck", 0)
+    sheets(client, headers, company_id=1)
+    # what another gunicorn worker's write leaves behind: new rows and a bumped generation,
+    # but no listener call in this process
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit) "
+                "VALUES (1, 2024, 1, 2, 3, 4)")
+    db.bump_data_version(cur, [1])
+    conn.commit()
+    conn.close()
+    assert [r["year"] for r in sheets(client, headers, company_id=1)] == [2022, 2023, 2024]
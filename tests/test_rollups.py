@@ -0,0 +1,52 @@
+import db
+from migrations import migrate
+from rollups import group_summary, update_rollups
+
+
+def write(company_id, year, revenue, assets, liabilities, profit):
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO balance_sheets (company_id, year, revenue, assets, liabilities, profit) VALUES (?,?,?,?,?,?) "
+        "ON CONFLICT(company_id, year) DO UPDATE SET revenue=excluded.revenue, assets=excluded.assets, "
+        "liabilities=excluded.liabilities, profit=excluded.profit",
+        (company_id, year, revenue, assets, liabilities, profit),
+    )
+    update_rollups(cur, [(company_id, year)])
+    conn.commit()
+    conn.close()
+
+
+def test_group_summary_matches_analytics_units(database):
+    migrate()
+    conn = db.get_connection()
+    conn.execute("INSERT INTO companies (id, name, parent_group) VALUES (1, 'A', 'G'), (2, 'B', 'G')")
+    conn.commit()
+    conn.close()
+    write(1, 2022, 100, 400, 100, 10)
+    write(2, 2022, 100, 600, 300, 20)
+    write(1, 2023, 220, 1000, 250, 33)
+
+    first, second = group_summary("G")
+    assert first["companies"] == 2 and first["revenue"] == 200
+    assert first["profit_margin"] == 15.0
+    assert first["debt_to_asset"] == 0.4
+    assert first["revenue_growth"] is None
+    assert second["revenue_growth"] == 10.0
+
+
+def test_cell_without_rows_is_removed(database):
+    migrate()
+    conn = db.get_connection()
+    conn.execute("INSERT INTO companies (id, name, parent_group) VALUES (1, 'A', 'G')")
+    conn.commit()
+    conn.close()
+    write(1, 2022, 100, 400, 100, 10)
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM balance_sheets WHERE company_id=1 AND year=2022")
+    update_rollups(cur, [(1, 2022)])
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM group_rollups").fetchone() == (0,)
+    conn.close()
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+
+from conftest import login
+
+
+def get(client, headers, **params):
+    return client.get("/balance_sheet_filtered", headers=headers, query_string=params)
+
+
+def test_pages_follow_the_cursor(client):
+    headers = login(client)
+    first = get(client, headers, limit=4, fields="company_id,year,profit").get_json()
+    assert len(first["balance_sheets"]) == 4
+    assert set(first["balance_sheets"][0]) == {"company_id", "year", "profit"}
+    assert first["next_cursor"] == "2:2023"
+
+    second = get(client, headers, limit=4, fields="company_id,year", cursor=first["next_cursor"]).get_json()
+    assert second["next_cursor"] is None
+    rows = first["balance_sheets"] + second["balance_sheets"]
+    keys = [(r["company_id"], r["year"]) for r in rows]
+    assert keys == sorted(keys) and len(set(keys)) == 6
+
+
+def test_filters_and_access_apply_to_pages(client):
+    page = get(client, login(client), limit=10, company_id=3, year_from=2023).get_json()
+    assert page["balance_sheets"] == [{"year": 2023, "revenue": 480000, "assets": 1050000,
+                                       "liabilities": 620000, "profit": 75000}]
+    # an analyst only ever sees their own company, whatever company_id says
+    analyst = get(client, login(client, "sneha", "pass123"), limit=10, company_id=1, fields="company_id").get_json()
+    assert {r["company_id"] for r in analyst["balance_sheets"]} == {2}
+
+
+def test_bad_paging_input_is_rejected(client):
+    headers = login(client)
+    for params in ({"cursor": "nope"}, {"cursor": "1:x"}, {"limit": "ten"}, {"fields": "year,secret"},
+                   {"format": "xml"}):
+        assert get(client, headers, **params).status_code == 400, params
+
+
+def test_exports_stream_every_row(client):
+    headers = login(client)
+    ndjson = get(client, headers, format="ndjson", fields="company_id,year").get_data(as_text=True)
+    assert len([json.loads(line) for line in ndjson.splitlines()]) == 6
+
+    text = get(client, headers, format="csv", company_id=1).get_data(as_text=True)
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == ["year", "revenue", "assets", "liabilities", "profit"]
+    assert [r[0] for r in rows[1:]] == ["2022", "2023"]
+
+    paged = get(client, headers, format="ndjson", limit=2).get_data(as_text=True)
+    assert len(paged.splitlines()) == 2
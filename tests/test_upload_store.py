@@ -0,0 +1,34 @@
+import os
+import time
+
+import upload_store
+
+
+def make(folder, name, size, age):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_eviction_spares_partial_recent_and_queued_files(tmp_path):
+    folder = str(tmp_path)
+    old = make(folder, "old.pdf", 100, 3600)
+    queued = make(folder, "queued.pdf", 100, 7200)
+    part = make(folder, ".abc.part", 100, 3600)
+    fresh = make(folder, "fresh.pdf", 100, 10)
+
+    removed = upload_store.evict_uploads(folder, protected=lambda: [queued], max_bytes=0, force=True)
+    assert removed == [old]
+    assert all(os.path.exists(p) for p in (queued, part, fresh))
+
+
+def test_eviction_removes_oldest_until_it_fits(tmp_path):
+    folder = str(tmp_path)
+    oldest = make(folder, "a.pdf", 100, 3000)
+    make(folder, "b.pdf", 100, 2000)
+    make(folder, "c.pdf", 100, 1000)
+    assert upload_store.evict_uploads(folder, max_bytes=250, force=True) == [oldest]
+    assert upload_store.evict_uploads(folder, max_bytes=250, max_age=1500, force=True) == [os.path.join(folder, "b.pdf")]
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from db import get_connection
+
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 2 * 1024 ** 3))
+UPLOAD_MAX_AGE = int(os.environ.get("UPLOAD_MAX_AGE", 30 * 24 * 3600))
+# files younger than this may belong to an upload that hasn't been queued yet
+UPLOAD_EVICT_GRACE = int(os.environ.get("UPLOAD_EVICT_GRACE", 300))
+EVICT_INTERVAL = 60
+
+_last_evict = 0.0
+_evict_lock = threading.Lock()
+
+
+def save_upload(file, folder, chunk_size=1 << 20):
+    # hash while writing, then move into place under the hash so identical uploads share a file
+    tmp_path = os.path.join(folder, f".{uuid.uuid4().hex}.part")
+    h = hashlib.sha256()
+    with open(tmp_path, "wb") as out:
+        for block in iter(lambda: file.stream.read(chunk_size), b""):
+            h.update(block)
+            out.write(block)
+    content_hash = h.hexdigest()
+    return tmp_path, content_hash
+
+
+def get_cached_extraction(content_hash):
+    conn = get_connection()
+    try:
+        row = conn.execute(
+            "SELECT records, tables, pages_total, detected_company, detected_mentions "
+            "FROM extraction_cache WHERE content_hash=?",
+            (content_hash,),
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute("UPDATE extraction_cache SET last_used=? WHERE content_hash=?", (time.time(), content_hash))
+        conn.commit()
+    finally:
+        conn.close()
+    detected = {"company_id": row[3], "mentions": row[4]} if row[3] is not None else None
+    return {"records": [tuple(r) for r in json.loads(row[0])], "tables": row[1], "pages_total": row[2],
+            "detected": detected}
+
+
+def store_extraction(content_hash, records, result, detected=None):
+    # records are (year, revenue, assets, liabilities, profit): the company is chosen per upload.
+    # detected is what company detection finds in the file, for uploads that don't pick one
+    now = time.time()
+    detected = detected or {}
+    conn = get_connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO extraction_cache (content_hash, records, tables, pages_total, created, last_used, "
+        "detected_company, detected_mentions) VALUES (?,?,?,?,?,?,?,?)",
+        (content_hash, json.dumps(records), result["tables"], result.get("pages_total"), now, now,
+         detected.get("company_id"), detected.get("mentions")),
+    )
+    conn.commit()
+    conn.close()
+
+
+def apply_cached_extraction(company_id, cached, content_hash=None):
+    from extract_pdf import add_balance_sheet_data_bulk
+    import passage_index
+
+    add_balance_sheet_data_bulk([(company_id, *record) for record in cached["records"]])
+    result = {"tables": cached["tables"], "rows": len(cached["records"]), "pages_total": cached["pages_total"]}
+    if content_hash and passage_index.PASSAGES_ENABLED:
+        # the page text is in the index under the content hash for whichever company uploaded it first
+        result["passages"] = passage_index.copy_document(content_hash, company_id)
+    return result
+
+
+def evict_uploads(folder, protected=lambda: (), max_bytes=UPLOAD_MAX_BYTES, max_age=UPLOAD_MAX_AGE, force=False,
+                  grace=UPLOAD_EVICT_GRACE):
+    # drop files past max_age, then the oldest until the folder fits in max_bytes.
+    # protected() returns paths that must stay (files of queued or running ingestion jobs);
+    # .part files still being written and anything modified in the last `grace` seconds stay
+    # too. kept files still count towards max_bytes
+    global _last_evict
+    with _evict_lock:
+        if not force and time.time() - _last_evict < EVICT_INTERVAL:
+            return []
+        _last_evict = time.time()
+
+    protected = {os.path.abspath(p) for p in protected()}
+    now = time.time()
+    files = []
+    kept = 0
+    for entry in os.scandir(folder):
+        if not entry.is_file():
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue  # a .part file that was just moved into place
+        if (entry.name.endswith(".part") or now - stat.st_mtime < grace
+                or os.path.abspath(entry.path) in protected):
+            kept += stat.st_size
+            continue
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    removed = []
+    total = kept + sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed.append(path)
+    return removed